@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Chrome 启动配置基准测试
+
+对比 default / lean 两种启动参数在 visible、headless=new、Xvfb 三种运行模式下的
+启动耗时和浏览器进程树 RSS（chromedriver + Chrome 全部进程）。
+
+使用方法：
+    python bench_chrome_profiles.py [--url URL] [--runs N] [--modes visible,headless,xvfb]
+
+示例：
+    # 默认：加载登录页，每种组合运行 3 次
+    python bench_chrome_profiles.py
+
+    # 只测 headless 和 Xvfb，加载空白页（排除网络影响）
+    python bench_chrome_profiles.py --url about:blank --modes headless,xvfb
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from login_humanlike import (
+    CHROME_LAUNCH_PROFILES,
+    LOGIN_URL,
+    create_chrome_driver,
+    start_xvfb,
+    stop_xvfb,
+)
+from process_monitor import ProcessTreeMonitor
+
+MODES = ("visible", "headless", "xvfb")
+
+
+def run_once(mode: str, profile: str, url: str, settle_s: float) -> Dict[str, float]:
+    """启动一次浏览器并加载页面，返回启动耗时、加载耗时和 RSS 峰值。"""
+    started = time.monotonic()
+    driver = create_chrome_driver(
+        headless=mode in ("headless", "xvfb"),
+        use_xvfb=mode == "xvfb",
+        launch_profile=profile,
+    )
+    startup_s = time.monotonic() - started
+    monitor = ProcessTreeMonitor.for_driver(driver, interval=0.25)
+    try:
+        started = time.monotonic()
+        driver.get(url)
+        load_s = time.monotonic() - started
+        # 页面加载后继续采样一段时间，覆盖后台进程启动带来的内存增长
+        time.sleep(settle_s)
+    finally:
+        stats = monitor.stop()
+        driver.quit()
+        monitor.reap()
+    return {"startup_s": startup_s, "load_s": load_s, "peak_rss_mb": stats["peak_rss_mb"]}
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="Chrome 启动配置基准测试（RSS 和启动耗时）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--url", default=LOGIN_URL, help=f"加载的页面（默认: {LOGIN_URL}）")
+    parser.add_argument("--runs", type=int, default=3, help="每种组合的运行次数（默认: 3）")
+    parser.add_argument("--modes", default=",".join(MODES), help="运行模式，逗号分隔（默认: visible,headless,xvfb）")
+    parser.add_argument("--settle", type=float, default=3.0, help="页面加载后继续采样的秒数（默认: 3）")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs 必须至少为 1")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"未知的运行模式: {', '.join(sorted(unknown))}")
+
+    results: List[tuple] = []
+    for mode in modes:
+        xvfb_process = None
+        # start_xvfb 会把 DISPLAY 指向 Xvfb，xvfb 模式结束后恢复，否则之后的模式会用到已关闭的虚拟显示
+        previous_display = os.environ.get("DISPLAY")
+        if mode == "xvfb":
+            xvfb_process = start_xvfb()
+            if xvfb_process is None and not os.getenv("DISPLAY"):
+                print("跳过 xvfb：Xvfb 无法启动")
+                continue
+        elif mode == "visible" and sys.platform == "linux" and not os.getenv("DISPLAY"):
+            print("跳过 visible：没有 DISPLAY")
+            continue
+        try:
+            for profile in CHROME_LAUNCH_PROFILES:
+                runs = [run_once(mode, profile, args.url, args.settle) for _ in range(args.runs)]
+                results.append((
+                    mode,
+                    profile,
+                    statistics.median(r["startup_s"] for r in runs),
+                    statistics.median(r["load_s"] for r in runs),
+                    statistics.median(r["peak_rss_mb"] for r in runs),
+                    max(r["peak_rss_mb"] for r in runs),
+                ))
+        finally:
+            stop_xvfb(xvfb_process)
+            if mode == "xvfb":
+                if previous_display is None:
+                    os.environ.pop("DISPLAY", None)
+                else:
+                    os.environ["DISPLAY"] = previous_display
+
+    print()
+    print(f"{'模式':<10} {'配置':<8} {'启动(中位)':>10} {'加载(中位)':>10} {'RSS 中位':>10} {'RSS 最大':>10}")
+    for mode, profile, startup_s, load_s, rss, rss_max in results:
+        print(f"{mode:<10} {profile:<8} {startup_s:>9.2f}s {load_s:>9.2f}s {rss:>8.0f}MB {rss_max:>8.0f}MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+课程列表（class-list.aspx）提取
+
+登录后通过 http_handoff 的 HTTP 客户端遍历课程列表，包括 ASP.NET GridView 的 postback 分页，
+以生成器的形式逐页产出解析好的课程记录：
+
+- 页面以流的方式读取并增量解析（html.parser），不构建完整 DOM
+- 分页请求用有界线程池并发执行；每个分页请求使用出现该分页链接的页面的表单状态
+  （__VIEWSTATE / __EVENTVALIDATION 等），新发现的分页链接（"..."）会继续加入队列
+- 记录逐页写入 JSONL 或 CSV，不在内存中保存全部行
+
+使用方法：
+    python class_list.py --session-file enrollware_session.json [--output classes.jsonl] [--format jsonl|csv]
+
+也可以在 login_humanlike.py 中设置 CLASS_LIST_OUTPUT，登录成功后自动交接会话并导出课程列表。
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from http_handoff import EnrollwareSession, load_session_file
+
+CLASS_LIST_PATH = "class-list.aspx"
+DEFAULT_WORKERS = 4
+READ_CHUNK_SIZE = 64 * 1024
+
+PAGER_LINK_RE = re.compile(r"__doPostBack\(\s*'([^']+)'\s*,\s*'Page\$(\d+)'\s*\)")
+
+
+class ClassListParser(HTMLParser):
+    """
+    增量解析课程列表页面。
+
+    - 表格：第一个整行都是 <th> 的表格视为课程表格，表头作为字段名；
+      同一层表格中单元格数与表头一致的行作为记录（分页行、页脚行会被跳过）
+    - 分页：收集 __doPostBack('...', 'Page$N') 链接
+    - 表单：收集 postback 需要回传的字段（隐藏字段、文本框、选中的复选框/单选框、下拉框）
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.headers: Optional[List[str]] = None
+        self.rows: List[Dict[str, str]] = []
+        self.pager: Dict[int, str] = {}
+        self.form_fields: Dict[str, str] = {}
+        self._grid_depth: Optional[int] = None
+        self._depth = 0
+        # 每层表格的当前行：(单元格文本列表, 是否全为 th, 行内第一个链接)
+        self._rows: Dict[int, Tuple[List[List[str]], List[bool], List[Optional[str]]]] = {}
+        self._select: Optional[str] = None
+        self._select_first: Optional[str] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = {key: value or "" for key, value in attrs}
+        if tag == "table":
+            self._depth += 1
+        elif tag == "tr" and self._depth:
+            self._rows[self._depth] = ([], [], [None])
+        elif tag in ("td", "th") and self._depth in self._rows:
+            cells, is_header, _ = self._rows[self._depth]
+            cells.append([])
+            is_header.append(tag == "th")
+        elif tag == "a":
+            href = attributes.get("href", "")
+            match = PAGER_LINK_RE.search(href)
+            if match:
+                self.pager.setdefault(int(match.group(2)), match.group(1))
+            elif href and self._depth in self._rows and self._rows[self._depth][2][0] is None:
+                self._rows[self._depth][2][0] = href
+        elif tag == "input":
+            self._collect_input(attributes)
+        elif tag == "select":
+            self._select = attributes.get("name")
+            self._select_first = None
+        elif tag == "option" and self._select:
+            value = attributes.get("value", "")
+            if self._select_first is None:
+                self._select_first = value
+            if "selected" in attributes:
+                self.form_fields[self._select] = value
+
+    def _collect_input(self, attributes: Dict[str, str]) -> None:
+        name = attributes.get("name")
+        input_type = attributes.get("type", "text").lower()
+        if not name or input_type in ("submit", "button", "image", "reset", "file"):
+            return
+        if input_type in ("checkbox", "radio") and "checked" not in attributes:
+            return
+        self.form_fields[name] = attributes.get("value", "")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "table" and self._depth:
+            self._rows.pop(self._depth, None)
+            self._depth -= 1
+        elif tag == "tr" and self._depth in self._rows:
+            self._finish_row(self._depth, *self._rows.pop(self._depth))
+        elif tag == "select" and self._select:
+            # 没有 selected 的下拉框，浏览器提交第一个选项
+            self.form_fields.setdefault(self._select, self._select_first or "")
+            self._select = None
+
+    def handle_data(self, data: str) -> None:
+        # 文本归入最内层表格的当前单元格（嵌套的分页表格不会混入外层记录）
+        for depth in range(self._depth, 0, -1):
+            row = self._rows.get(depth)
+            if row and row[0]:
+                row[0][-1].append(data)
+                break
+
+    def _finish_row(self, depth: int, cells: List[List[str]], is_header: List[bool], link: List[Optional[str]]) -> None:
+        texts = [" ".join("".join(parts).split()) for parts in cells]
+        if not texts:
+            return
+        if self._grid_depth is None:
+            if all(is_header):
+                self._grid_depth = depth
+                self.headers = [text or f"column_{i + 1}" for i, text in enumerate(texts)]
+            return
+        if depth != self._grid_depth or self.headers is None or len(texts) != len(self.headers) or any(is_header):
+            return
+        record = dict(zip(self.headers, texts))
+        if link[0]:
+            record["_link"] = link[0]
+        self.rows.append(record)
+
+
+@dataclass
+class ClassListPage:
+    """一页解析结果。form_fields 用于从这一页发起的分页 postback。"""
+
+    number: int
+    records: List[Dict[str, str]]
+    pager: Dict[int, str] = field(default_factory=dict)
+    form_fields: Dict[str, str] = field(default_factory=dict)
+
+
+def _parse_response(response, number: int) -> ClassListPage:
+    response.encoding = response.encoding or "utf-8"
+    try:
+        return parse_page(response.iter_content(READ_CHUNK_SIZE, decode_unicode=True), number)
+    finally:
+        response.close()
+
+
+def parse_page(chunks: Iterable[str], number: int) -> ClassListPage:
+    """增量解析一页 HTML（chunks 可以是流式读取的文本块）。"""
+    parser = ClassListParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    records = parser.rows
+    for record in records:
+        record["_page"] = str(number)
+    return ClassListPage(number, records, parser.pager, parser.form_fields)
+
+
+def fetch_first_page(session: EnrollwareSession, path: str = CLASS_LIST_PATH) -> ClassListPage:
+    return _parse_response(session.get_admin(path, stream=True), 1)
+
+
+def fetch_page(
+    session: EnrollwareSession, number: int, event_target: str, form_fields: Dict[str, str], path: str = CLASS_LIST_PATH
+) -> ClassListPage:
+    """以来源页面的表单状态发起 Page$N postback。"""
+    data = dict(form_fields)
+    data["__EVENTTARGET"] = event_target
+    data["__EVENTARGUMENT"] = f"Page${number}"
+    return _parse_response(session.post_admin(path, data, stream=True), number)
+
+
+PageFetcher = Callable[[int, str, Dict[str, str]], ClassListPage]
+
+
+def iter_class_pages(
+    session: EnrollwareSession, path: str = CLASS_LIST_PATH, max_workers: int = DEFAULT_WORKERS
+) -> Iterator[ClassListPage]:
+    """
+    遍历课程列表的所有分页，按完成顺序逐页产出（记录中带 _page 字段）。
+
+    Args:
+        session: 已登录的 HTTP 会话
+        path: 课程列表页面（相对于 /admin/）
+        max_workers: 同时进行的分页请求数
+    """
+    first = fetch_first_page(session, path)
+    yield from crawl_pages(
+        first,
+        lambda number, target, form_fields: fetch_page(session, number, target, form_fields, path),
+        max_workers,
+    )
+
+
+def crawl_pages(first: ClassListPage, fetch: PageFetcher, max_workers: int = DEFAULT_WORKERS) -> Iterator[ClassListPage]:
+    """
+    从第一页出发，用有界线程池并发请求所有分页（包括后续页面上新出现的分页链接）。
+
+    Args:
+        first: 已获取的第一页
+        fetch: fetch(页码, postback 目标, 来源页面的表单字段) -> ClassListPage，在工作线程中调用
+        max_workers: 同时进行的分页请求数
+    """
+    yield first
+
+    seen: Set[int] = {first.number}
+    # 待请求的分页：页码 -> (postback 目标, 来源页面的表单字段)
+    queue: Dict[int, Tuple[str, Dict[str, str]]] = {}
+
+    def discover(page: ClassListPage) -> None:
+        for number, target in page.pager.items():
+            if number not in seen and number not in queue:
+                queue[number] = (target, page.form_fields)
+
+    discover(first)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="class-list") as executor:
+        running: Dict[Future, int] = {}
+        while queue or running:
+            while queue and len(running) < max_workers:
+                number = min(queue)
+                target, form_fields = queue.pop(number)
+                seen.add(number)
+                running[executor.submit(fetch, number, target, form_fields)] = number
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                page = future.result()
+                discover(page)
+                yield page
+
+
+def iter_class_records(
+    session: EnrollwareSession, path: str = CLASS_LIST_PATH, max_workers: int = DEFAULT_WORKERS
+) -> Iterator[Dict[str, str]]:
+    """逐条产出课程记录。"""
+    for page in iter_class_pages(session, path, max_workers):
+        yield from page.records
+
+
+class RecordWriter:
+    """增量写入 JSONL 或 CSV。CSV 的列以第一条记录为准。"""
+
+    def __init__(self, stream: TextIO, fmt: str = "jsonl"):
+        if fmt not in ("jsonl", "csv"):
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        self._csv: Optional[csv.DictWriter] = None
+
+    def write_many(self, records: List[Dict[str, str]]) -> None:
+        for record in records:
+            if self.fmt == "jsonl":
+                self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                if self._csv is None:
+                    self._csv = csv.DictWriter(self.stream, fieldnames=list(record), extrasaction="ignore")
+                    self._csv.writeheader()
+                self._csv.writerow(record)
+            self.count += 1
+        self.stream.flush()
+
+
+def export_class_list(
+    session: EnrollwareSession, output: str, fmt: Optional[str] = None, max_workers: int = DEFAULT_WORKERS
+) -> int:
+    """把课程列表导出到文件（"-" 为标准输出），返回记录数。"""
+    fmt = fmt or ("csv" if output.endswith(".csv") else "jsonl")
+    stream = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+    try:
+        writer = RecordWriter(stream, fmt)
+        pages = 0
+        for page in iter_class_pages(session, max_workers=max_workers):
+            writer.write_many(page.records)
+            pages += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    logging.info(f"课程列表导出完成：{pages} 页，{writer.count} 条记录")
+    return writer.count
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="导出 Enrollware 课程列表",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  # 先登录并导出会话
+  SESSION_EXPORT_FILE=enrollware_session.json python login_humanlike.py
+
+  # 再导出课程列表
+  python class_list.py --session-file enrollware_session.json --output classes.csv
+        """,
+    )
+    parser.add_argument("--session-file", default=os.getenv("SESSION_EXPORT_FILE", "enrollware_session.json"),
+                        help="登录脚本导出的会话文件（默认: SESSION_EXPORT_FILE 或 enrollware_session.json）")
+    parser.add_argument("--output", default="-", help="输出文件，- 为标准输出（默认: -）")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="输出格式（默认按扩展名，否则 jsonl）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"并发分页请求数（默认: {DEFAULT_WORKERS}）")
+    parser.add_argument("--proxy", default=os.getenv("PROXY_SERVER"), help="代理服务器（默认: PROXY_SERVER）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", stream=sys.stderr)
+
+    session = load_session_file(args.session_file, args.proxy, pool_size=args.workers)
+    try:
+        export_class_list(session, args.output, args.format, args.workers)
+    except RuntimeError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
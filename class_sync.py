@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+课程列表增量同步
+
+每天变化的课程只有少数几条，但下游任务每次都要重新拉取整个课程列表。
+本模块在 class_list 的基础上维护一个本地索引（SQLite），保存每一页和每一行的内容指纹：
+
+- 页面指纹：去掉隐藏字段（__VIEWSTATE 等每次都会变化）后的页面 HTML 的 SHA-1。
+  指纹未变的页面不再解析、不再逐行比较，直接沿用索引中的行和分页链接
+- 行指纹：记录内容的 SHA-1，按行键（行内链接中的 id，没有则为内容本身）比较
+- 只输出变化：insert / update / delete
+
+同步在一个事务中完成；中途失败会回滚索引，下次同步重新输出这些变化（至少一次）。
+
+ASP.NET 页面不提供 ETag / Last-Modified，每一页仍需请求（响应经 gzip 压缩），
+节省的是解析、比较和下游处理；输出量与变化量成正比，而不是与账号大小成正比。
+
+使用方法：
+    python class_sync.py --session-file enrollware_session.json [--index class_sync.sqlite3] [--output changes.jsonl]
+"""
+import argparse
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Set, Tuple
+
+from class_list import (
+    CLASS_LIST_PATH,
+    DEFAULT_WORKERS,
+    ClassListPage,
+    crawl_pages,
+    parse_page,
+)
+from http_handoff import EnrollwareSession, load_session_file
+
+DEFAULT_INDEX_PATH = "class_sync.sqlite3"
+
+HIDDEN_INPUT_RE = re.compile(r"<input\b[^>]*\btype\s*=\s*[\"']?hidden[\"']?[^>]*>", re.IGNORECASE)
+ATTR_RE = re.compile(r"\b(name|value)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.IGNORECASE)
+ROW_ID_RE = re.compile(r"[?&]id=([^&#]+)", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_pages (
+    page INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    pager TEXT NOT NULL,
+    form_fields TEXT NOT NULL,
+    row_keys TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sync_rows (
+    row_key TEXT PRIMARY KEY,
+    row_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+"""
+
+
+def page_fingerprint(text: str) -> str:
+    """页面指纹：去掉隐藏字段后的 HTML 的 SHA-1。"""
+    return hashlib.sha1(HIDDEN_INPUT_RE.sub("", text).encode("utf-8")).hexdigest()
+
+
+def hidden_fields(text: str) -> Dict[str, str]:
+    """用正则提取隐藏字段（指纹未变的页面不做完整解析，但分页 postback 仍需要本页的表单状态）。"""
+    fields: Dict[str, str] = {}
+    for tag in HIDDEN_INPUT_RE.findall(text):
+        attrs = {m.group(1).lower(): html.unescape(m.group(2) if m.group(2) is not None else m.group(3)) for m in ATTR_RE.finditer(tag)}
+        if attrs.get("name"):
+            fields[attrs["name"]] = attrs.get("value", "")
+    return fields
+
+
+def row_key(record: Dict[str, str]) -> str:
+    """行键：优先使用行内链接中的 id，其次是链接本身，最后是内容指纹（此时修改会表现为删除 + 插入）。"""
+    link = record.get("_link")
+    if link:
+        match = ROW_ID_RE.search(link)
+        return f"id:{match.group(1)}" if match else f"link:{link}"
+    return "row:" + row_hash(record)
+
+
+def row_hash(record: Dict[str, str]) -> str:
+    content = {key: value for key, value in record.items() if key != "_page"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SyncPage(ClassListPage):
+    fingerprint: str = ""
+    unchanged: bool = False
+
+
+@dataclass
+class SyncStats:
+    pages: int = 0
+    unchanged_pages: int = 0
+    inserts: int = 0
+    updates: int = 0
+    deletes: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> str:
+        return (
+            f"{self.pages} 页（{self.unchanged_pages} 页未变化），"
+            f"新增 {self.inserts}，修改 {self.updates}，删除 {self.deletes}，"
+            f"耗时 {time.monotonic() - self.started:.1f}s"
+        )
+
+
+class ClassSync:
+    """
+    课程列表增量同步索引。
+
+    Args:
+        db_path: 索引数据库路径
+    """
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH):
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.stats = SyncStats()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _load_pages(self) -> Dict[int, Tuple[str, Dict[int, str], Dict[str, str], List[str]]]:
+        pages = {}
+        for page, fingerprint, pager, form_fields, row_keys in self.conn.execute(
+            "SELECT page, fingerprint, pager, form_fields, row_keys FROM sync_pages"
+        ):
+            pager_map = {int(number): target for number, target in json.loads(pager).items()}
+            pages[page] = (fingerprint, pager_map, json.loads(form_fields), json.loads(row_keys))
+        return pages
+
+    def _build_page(self, text: str, number: int, known) -> SyncPage:
+        """在工作线程中调用：指纹未变时跳过解析。"""
+        fingerprint = page_fingerprint(text)
+        stored = known.get(number)
+        if stored and stored[0] == fingerprint:
+            form_fields = dict(stored[2])
+            form_fields.update(hidden_fields(text))
+            return SyncPage(number, [], stored[1], form_fields, fingerprint, unchanged=True)
+        page = parse_page([text], number)
+        return SyncPage(number, page.records, page.pager, page.form_fields, fingerprint)
+
+    def _fetch_first(self, session: EnrollwareSession, path: str, known) -> SyncPage:
+        return self._build_page(session.get_admin(path).text, 1, known)
+
+    def _fetch_page(self, session: EnrollwareSession, path: str, known, number: int, target: str, form_fields: Dict[str, str]) -> SyncPage:
+        data = dict(form_fields)
+        data["__EVENTTARGET"] = target
+        data["__EVENTARGUMENT"] = f"Page${number}"
+        return self._build_page(session.post_admin(path, data).text, number, known)
+
+    def sync(
+        self, session: EnrollwareSession, path: str = CLASS_LIST_PATH, max_workers: int = DEFAULT_WORKERS
+    ) -> Iterator[Dict[str, object]]:
+        """
+        同步课程列表，逐条产出变化：{"op": "insert" | "update" | "delete", "key", "record"}。
+
+        删除在所有分页遍历完成后产出；生成器被提前关闭或出错时索引回滚。
+        """
+        self.stats = SyncStats()
+        known = self._load_pages()
+        old_rows: Dict[str, Tuple[str, str]] = {
+            key: (value_hash, record)
+            for key, value_hash, record in self.conn.execute("SELECT row_key, row_hash, record FROM sync_rows")
+        }
+        seen: Set[str] = set()
+        pages_seen: Set[int] = set()
+
+        def fetch(number: int, target: str, form_fields: Dict[str, str]) -> SyncPage:
+            return self._fetch_page(session, path, known, number, target, form_fields)
+
+        first = self._fetch_first(session, path, known)
+        try:
+            with self.conn:
+                for page in crawl_pages(first, fetch, max_workers):
+                    self.stats.pages += 1
+                    pages_seen.add(page.number)
+                    if page.unchanged:
+                        self.stats.unchanged_pages += 1
+                        seen.update(known[page.number][3])
+                        continue
+                    yield from self._apply_page(page, old_rows, seen)
+
+                for key in set(old_rows) - seen:
+                    self.stats.deletes += 1
+                    self.conn.execute("DELETE FROM sync_rows WHERE row_key = ?", (key,))
+                    yield {"op": "delete", "key": key, "record": json.loads(old_rows[key][1])}
+                stale = [(number,) for number in known if number not in pages_seen]
+                self.conn.executemany("DELETE FROM sync_pages WHERE page = ?", stale)
+        except GeneratorExit:
+            logging.warning("增量同步未完成，索引已回滚")
+            raise
+        logging.info(f"增量同步完成：{self.stats.summary()}")
+
+    def _apply_page(self, page: SyncPage, old_rows, seen: Set[str]) -> Iterator[Dict[str, object]]:
+        keys: List[str] = []
+        for record in page.records:
+            key = row_key(record)
+            value_hash = row_hash(record)
+            keys.append(key)
+            seen.add(key)
+            previous = old_rows.get(key)
+            if previous is not None and previous[0] == value_hash:
+                continue
+            op = "insert" if previous is None else "update"
+            if op == "insert":
+                self.stats.inserts += 1
+            else:
+                self.stats.updates += 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_rows (row_key, row_hash, page, record) VALUES (?, ?, ?, ?)",
+                (key, value_hash, page.number, json.dumps(record, ensure_ascii=False)),
+            )
+            # 同一次同步中重复出现的行（翻页时数据移动）不再重复输出
+            old_rows[key] = (value_hash, json.dumps(record, ensure_ascii=False))
+            yield {"op": op, "key": key, "record": record}
+        # ASP.NET 的状态字段（__VIEWSTATE 等）每次请求都会变化，不保存到索引
+        visible_fields = {name: value for name, value in page.form_fields.items() if not name.startswith("__")}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_pages (page, fingerprint, pager, form_fields, row_keys, synced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (page.number, page.fingerprint, json.dumps(page.pager), json.dumps(visible_fields), json.dumps(keys), time.time()),
+        )
+
+
+def sync_class_list(
+    session: EnrollwareSession, output: str, index_path: str = DEFAULT_INDEX_PATH, max_workers: int = DEFAULT_WORKERS
+) -> SyncStats:
+    """增量同步并把变化写入 JSONL 文件（"-" 为标准输出）。"""
+    index = ClassSync(index_path)
+    stream = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        for change in index.sync(session, max_workers=max_workers):
+            stream.write(json.dumps(change, ensure_ascii=False) + "\n")
+        stream.flush()
+        return index.stats
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        index.close()
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="Enrollware 课程列表增量同步",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  # 首次运行输出全部课程（insert），之后只输出变化
+  python class_sync.py --session-file enrollware_session.json --output changes.jsonl
+        """,
+    )
+    parser.add_argument("--session-file", default=os.getenv("SESSION_EXPORT_FILE", "enrollware_session.json"),
+                        help="登录脚本导出的会话文件（默认: SESSION_EXPORT_FILE 或 enrollware_session.json）")
+    parser.add_argument("--index", default=os.getenv("CLASS_SYNC_DB", DEFAULT_INDEX_PATH),
+                        help=f"索引数据库（默认: CLASS_SYNC_DB 或 {DEFAULT_INDEX_PATH}）")
+    parser.add_argument("--output", default="-", help="变化输出文件（JSONL），- 为标准输出（默认: -）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"并发分页请求数（默认: {DEFAULT_WORKERS}）")
+    parser.add_argument("--proxy", default=os.getenv("PROXY_SERVER"), help="代理服务器（默认: PROXY_SERVER）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", stream=sys.stderr)
+
+    session = load_session_file(args.session_file, args.proxy, pool_size=args.workers)
+    try:
+        sync_class_list(session, args.output, args.index, args.workers)
+    except RuntimeError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+登录后把浏览器会话交给轻量 HTTP 客户端
+
+登录成功后，后续的 Enrollware 管理页面请求不需要再占用一个几百 MB 的浏览器：
+导出 driver 的 cookies 和 User-Agent，构造一个走同一 PROXY_SERVER、带连接池和 keep-alive 的
+requests.Session，然后立即释放浏览器。
+
+用法：
+    session = handoff_from_driver(driver, proxy_server=os.getenv("PROXY_SERVER"))
+    html = session.get_admin("class-list.aspx").text
+
+也可以通过 SESSION_EXPORT_FILE 把会话保存到文件，供其他进程用 load_session_file() 复用。
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ADMIN_BASE_URL = "https://www.enrollware.com/admin/"
+
+
+def export_browser_session(driver) -> Dict[str, object]:
+    """导出浏览器当前的 cookies、User-Agent 和语言设置。"""
+    user_agent, languages = driver.execute_script(
+        "return [navigator.userAgent, navigator.languages ? navigator.languages.join(',') : navigator.language];"
+    )
+    return {
+        "cookies": driver.get_cookies(),
+        "user_agent": user_agent,
+        "accept_language": languages,
+    }
+
+
+def save_session_file(state: Dict[str, object], path: str) -> None:
+    """保存会话（包含登录 cookies，文件权限设为 600）。"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def load_session_file(path: str, proxy_server: Optional[str] = None, pool_size: int = 4) -> "EnrollwareSession":
+    with open(path, encoding="utf-8") as f:
+        return EnrollwareSession(json.load(f), proxy_server, pool_size)
+
+
+def _requests_proxy(proxy_server: Optional[str]) -> Optional[Dict[str, str]]:
+    """把 Chrome 的 --proxy-server 格式转换为 requests 的 proxies。"""
+    if not proxy_server:
+        return None
+    # Chrome 通过 SOCKS5 代理时由代理端解析域名，requests 对应的是 socks5h
+    if proxy_server.startswith("socks5://"):
+        proxy_server = "socks5h://" + proxy_server[len("socks5://"):]
+    return {"http": proxy_server, "https": proxy_server}
+
+
+class EnrollwareSession(requests.Session):
+    """
+    带浏览器登录状态的 requests.Session。
+
+    Args:
+        state: export_browser_session() 的结果
+        proxy_server: 代理服务器（与浏览器使用的 PROXY_SERVER 相同）
+        pool_size: 每个主机的连接池大小
+    """
+
+    def __init__(self, state: Dict[str, object], proxy_server: Optional[str] = None, pool_size: int = 4):
+        super().__init__()
+        self.headers.update({
+            "User-Agent": str(state["user_agent"]),
+            "Accept-Language": str(state.get("accept_language") or "en-US,en"),
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        })
+        cookies: List[Dict[str, object]] = state.get("cookies", [])  # type: ignore[assignment]
+        for cookie in cookies:
+            self.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain"),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+                expires=cookie.get("expiry"),
+                rest={"HttpOnly": None} if cookie.get("httpOnly") else {},
+            )
+
+        proxies = _requests_proxy(proxy_server)
+        if proxies:
+            self.proxies.update(proxies)
+
+        # 连接池 + 对幂等请求的有限重试；keep-alive 由 urllib3 连接池保持
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def get_admin(self, path: str, **kwargs) -> requests.Response:
+        """请求管理后台页面（path 相对于 /admin/）。会话失效时抛出 RuntimeError。"""
+        return self.request_admin("GET", path, **kwargs)
+
+    def post_admin(self, path: str, data: Dict[str, str], **kwargs) -> requests.Response:
+        """向管理后台页面提交表单（ASP.NET postback）。"""
+        return self.request_admin("POST", path, data=data, **kwargs)
+
+    def request_admin(self, method: str, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", 30)
+        response = self.request(method, urljoin(ADMIN_BASE_URL, path), **kwargs)
+        response.raise_for_status()
+        if "login.aspx" in response.url.lower():
+            raise RuntimeError("Enrollware 会话已失效（被重定向到登录页）")
+        return response
+
+
+def handoff_from_driver(
+    driver, proxy_server: Optional[str] = None, pool_size: int = 4, release_driver: bool = True
+) -> EnrollwareSession:
+    """
+    把浏览器登录状态交给 HTTP 客户端，并（默认）立即关闭浏览器。
+
+    Returns:
+        EnrollwareSession
+    """
+    state = export_browser_session(driver)
+    session = EnrollwareSession(state, proxy_server, pool_size)
+    logging.info(f"已把 {len(state['cookies'])} 个 cookies 交给 HTTP 客户端")
+    if release_driver:
+        try:
+            driver.quit()
+            logging.info("浏览器已释放，后续请求改用 HTTP 客户端")
+        except Exception as e:
+            logging.warning(f"关闭浏览器时出错: {e}")
+    return session
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+登录任务队列（SQLite，支持多主机）
+
+多个 login_humanlike.py --worker 进程（可以在不同主机上）从同一个队列数据库领取任务：
+
+- 租约：领取任务时在同一个写事务（BEGIN IMMEDIATE）中把任务标记为 leased 并写入租约到期时间，
+  不会被两个 worker 同时领取
+- 心跳：执行期间 worker 定期续租；worker 崩溃后租约过期，任务会被其他 worker 重新领取
+- 重试：失败的任务按指数退避重新排队，超过最大尝试次数后标记为 failed
+
+多主机共享时，数据库需要放在支持 POSIX 文件锁的共享存储上（例如 EFS / NFSv4）。
+多主机访问时不使用 WAL（WAL 依赖共享内存，只能在单机上使用）。
+
+使用方法：
+    python job_queue.py enqueue [--count N] [--payload JSON] [--max-attempts N]
+    python job_queue.py status
+    python job_queue.py requeue-failed
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+DEFAULT_QUEUE_PATH = "login_jobs.sqlite3"
+DEFAULT_LEASE_S = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_S = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs (status, lease_expires);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class Job:
+    id: int
+    payload: Dict[str, object]
+    attempts: int
+    max_attempts: int
+
+
+class JobQueue:
+    """
+    SQLite 任务队列。
+
+    Args:
+        db_path: 队列数据库路径
+        lease_s: 租约时长（秒），应大于单次登录时限；执行期间由心跳续租
+    """
+
+    def __init__(self, db_path: str = DEFAULT_QUEUE_PATH, lease_s: float = DEFAULT_LEASE_S):
+        self.lease_s = lease_s
+        # isolation_level=None：手动控制事务，领取任务使用 BEGIN IMMEDIATE 取得写锁
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # 心跳线程和主线程共用连接，事务之间用锁串行
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql: str, params: tuple) -> int:
+        with self._transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def enqueue(self, payload: Dict[str, object], max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """添加任务，返回任务 ID。payload 必须是 JSON 对象（worker 按字典读取任务参数）。"""
+        if not isinstance(payload, dict):
+            raise ValueError(f"任务参数必须是 JSON 对象，而不是 {type(payload).__name__}")
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT INTO jobs (payload, max_attempts, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(payload, ensure_ascii=False), max_attempts, now, now, now),
+            ).lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        领取一个任务：待执行且已到重试时间的任务，或租约已过期的任务（持有者已失联）。
+        租约过期且已用完尝试次数的任务标记为 failed。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_owner = NULL, updated_at = ?, "
+                "last_error = COALESCE(last_error, '') || '[租约过期]' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts, max_attempts FROM jobs "
+                "WHERE (status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY available_at, id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_s, now, row[0]),
+            )
+        return Job(row[0], json.loads(row[1]), row[2] + 1, row[3])
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """续租。返回 False 表示租约已丢失（已过期并被其他 worker 领取）。"""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + self.lease_s, now, job_id, worker_id),
+        ) == 1
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, object]) -> bool:
+        return self._write(
+            "UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, result = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id),
+        ) == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str, result: Optional[Dict[str, object]] = None) -> bool:
+        """失败：未用完尝试次数时按指数退避重新排队，否则标记为 failed。"""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET "
+            "status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+            "available_at = ? + ? * (1 << (attempts - 1)), "
+            "lease_owner = NULL, lease_expires = NULL, last_error = ?, result = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now, RETRY_BASE_DELAY_S, error, json.dumps(result, ensure_ascii=False) if result else None, now, job_id, worker_id),
+        ) == 1
+
+    def requeue_failed(self) -> int:
+        """把 failed 任务重新排队（尝试次数清零）。"""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? WHERE status = 'failed'",
+            (now, now),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数（租约已过期的 leased 任务单独计为 expired）。"""
+        counts = {"pending": 0, "leased": 0, "expired": 0, "done": 0, "failed": 0}
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, status = 'leased' AND lease_expires < ?, COUNT(*) FROM jobs GROUP BY 1, 2", (now,)
+            ).fetchall()
+        for status, expired, count in rows:
+            key = "expired" if expired else status
+            counts[key] = counts.get(key, 0) + count
+        return counts
+
+
+def positive_int(text: str) -> int:
+    """argparse 类型：至少为 1 的整数。"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的整数: {text}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"必须至少为 1: {text}")
+    return value
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="登录任务队列管理",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  # 添加 10 个使用 .env 凭据的登录任务
+  python job_queue.py enqueue --count 10
+
+  # 添加指定账号的任务
+  python job_queue.py enqueue --payload '{"username": "a@example.com", "password": "..."}'
+
+  # 在各主机上启动 worker
+  python login_humanlike.py --worker --queue /mnt/shared/login_jobs.sqlite3
+        """,
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("JOB_QUEUE_DB", DEFAULT_QUEUE_PATH),
+        help=f"队列数据库路径（默认: JOB_QUEUE_DB 或 {DEFAULT_QUEUE_PATH}）",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="添加任务")
+    enqueue.add_argument("--count", type=positive_int, default=1, help="任务数量（默认: 1）")
+    enqueue.add_argument("--payload", default="{}", help="任务参数 JSON（与服务模式 POST /login 的请求体相同）")
+    enqueue.add_argument("--max-attempts", type=positive_int, default=DEFAULT_MAX_ATTEMPTS, help=f"最大尝试次数（默认: {DEFAULT_MAX_ATTEMPTS}）")
+    commands.add_parser("status", help="查看各状态的任务数")
+    commands.add_parser("requeue-failed", help="重新排队失败的任务")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == "enqueue":
+            try:
+                payload = json.loads(args.payload)
+            except ValueError as e:
+                parser.error(f"--payload 不是有效的 JSON: {e}")
+            if not isinstance(payload, dict):
+                parser.error("--payload 必须是 JSON 对象，例如 '{\"username\": \"a@example.com\"}'")
+            ids = [queue.enqueue(payload, args.max_attempts) for _ in range(args.count)]
+            print(f"已添加 {len(ids)} 个任务（ID {ids[0]} - {ids[-1]}）")
+        elif args.command == "status":
+            for status, count in queue.stats().items():
+                print(f"{status:<8} {count}")
+        elif args.command == "requeue-failed":
+            print(f"已重新排队 {queue.requeue_failed()} 个任务")
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
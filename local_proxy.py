@@ -19,12 +19,28 @@
     python local_proxy.py --host 127.0.0.1 --port 8080
 """
 import argparse
+import errno
+import heapq
+import itertools
+import json
 import logging
+import os
+import selectors
+import signal
 import socket
 import socketserver
+import subprocess
 import sys
-from typing import Optional, Set
-from urllib.parse import urlparse
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from proxy_probe import connect_via_proxy
+from tunnel_capture import CaptureWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -36,22 +52,885 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class SocketTuning:
+    """上游（和客户端）socket 的调优参数。"""
+
+    nodelay: bool = True
+    keepalive: bool = True
+    keepidle: int = 60
+    keepintvl: int = 10
+    keepcnt: int = 3
+    rcvbuf: Optional[int] = None
+    sndbuf: Optional[int] = None
+
+    def apply(self, sock: socket.socket) -> None:
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # TCP_KEEPIDLE 等选项只在 Linux 上存在
+            for option, value in (("TCP_KEEPIDLE", self.keepidle), ("TCP_KEEPINTVL", self.keepintvl), ("TCP_KEEPCNT", self.keepcnt)):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        if self.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+
+
+class ConnectStats:
+    """按连接策略记录上游连接耗时（毫秒），保留最近 window 次。"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, int] = {}
+
+    def record(self, strategy: str, latency_ms: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._latencies.setdefault(strategy, deque(maxlen=self.window)).append(latency_ms)
+            else:
+                self._failures[strategy] = self._failures.get(strategy, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{策略: {count, failures, p50_ms, p95_ms, p99_ms}}"""
+        with self._lock:
+            strategies = set(self._latencies) | set(self._failures)
+            result = {}
+            for strategy in sorted(strategies):
+                values = sorted(self._latencies.get(strategy, ()))
+                entry: Dict[str, float] = {"count": len(values), "failures": self._failures.get(strategy, 0)}
+                for pct in (50, 95, 99):
+                    entry[f"p{pct}_ms"] = round(values[min(len(values) - 1, int(len(values) * pct / 100))], 1) if values else 0.0
+                result[strategy] = entry
+            return result
+
+    def log_summary(self) -> None:
+        for strategy, entry in self.summary().items():
+            logger.info(
+                f"上游连接 [{strategy}] 成功 {entry['count']:.0f} 次，失败 {entry['failures']:.0f} 次，"
+                f"p50 {entry['p50_ms']}ms / p95 {entry['p95_ms']}ms / p99 {entry['p99_ms']}ms"
+            )
+
+
+def interleave_addresses(infos: List[tuple]) -> List[tuple]:
+    """按 RFC 8305 交替排列地址族：首选 getaddrinfo 返回的第一个地址族，然后两个地址族轮流。"""
+    if not infos:
+        return []
+    first_family = infos[0][0]
+    preferred = [info for info in infos if info[0] == first_family]
+    others = [info for info in infos if info[0] != first_family]
+    ordered = []
+    for i in range(max(len(preferred), len(others))):
+        ordered.extend(group[i] for group in (preferred, others) if i < len(group))
+    return ordered
+
+
+class UpstreamConnector:
+    """
+    上游连接器：解析出多个地址时按 Happy Eyeballs（RFC 8305）并发竞速，
+    先启动第一个地址，每隔 attempt_delay 秒（或上一个失败时立即）启动下一个，第一个连上的胜出。
+
+    Args:
+        tuning: socket 调优参数
+        connect_timeout: 整体连接超时（秒）
+        attempt_delay: 相邻两次连接尝试的间隔（秒，RFC 8305 建议 250ms）
+    """
+
+    def __init__(self, tuning: Optional[SocketTuning] = None, connect_timeout: float = 10.0, attempt_delay: float = 0.25):
+        self.tuning = tuning or SocketTuning()
+        self.connect_timeout = connect_timeout
+        self.attempt_delay = attempt_delay
+        self.stats = ConnectStats()
+
+    def connect(
+        self, host: str, port: int, trace: Optional["TunnelTrace"] = None, stats_key: Optional[str] = None
+    ) -> socket.socket:
+        """
+        连接到 host:port，返回已调优的阻塞 socket（无超时）。失败时抛出 OSError / socket.timeout。
+
+        stats_key 指定时耗时记在该名称下（例如预连接补充），不计入按策略统计的真实请求。
+        """
+        started = time.monotonic()
+        infos = interleave_addresses(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        if trace is not None:
+            trace.mark("resolved")
+        strategy = stats_key or ("happy_eyeballs" if len(infos) > 1 else "single")
+        try:
+            sock = self._race(infos, started + self.connect_timeout)
+        except OSError:
+            self.stats.record(strategy, (time.monotonic() - started) * 1000, ok=False)
+            raise
+        self.stats.record(strategy, (time.monotonic() - started) * 1000, ok=True)
+        sock.setblocking(True)
+        self.tuning.apply(sock)
+        return sock
+
+    def _race(self, infos: List[tuple], deadline: float) -> socket.socket:
+        selector = selectors.DefaultSelector()
+        pending: List[socket.socket] = []
+        next_index = 0
+        next_start = time.monotonic()
+        last_error: Optional[OSError] = None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise socket.timeout("连接上游超时")
+                if next_index < len(infos) and (now >= next_start or not pending):
+                    family, socktype, proto, _, address = infos[next_index]
+                    next_index += 1
+                    next_start = now + self.attempt_delay
+                    sock = socket.socket(family, socktype, proto)
+                    sock.setblocking(False)
+                    code = sock.connect_ex(address)
+                    if code == 0:
+                        return sock
+                    if code in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                        pending.append(sock)
+                        selector.register(sock, selectors.EVENT_WRITE)
+                    else:
+                        sock.close()
+                        last_error = OSError(code, f"{address[0]}: {errno.errorcode.get(code, code)}")
+                        next_start = now
+                    continue
+                if not pending:
+                    raise last_error or OSError("没有可用的上游地址")
+                wait_until = deadline if next_index >= len(infos) else min(deadline, next_start)
+                for key, _ in selector.select(max(wait_until - now, 0)):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    pending.remove(sock)
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if code == 0:
+                        return sock
+                    last_error = OSError(code, errno.errorcode.get(code, str(code)))
+                    sock.close()
+                    # 失败后立即启动下一个地址，不等 attempt_delay
+                    next_start = time.monotonic()
+        finally:
+            for sock in pending:
+                sock.close()
+            selector.close()
+
+
+def socket_is_alive(sock: socket.socket) -> bool:
+    """空闲 socket 是否仍可用：非阻塞 peek 读到 EOF 或数据（对端不该先发数据）都视为不可用。"""
+    try:
+        sock.setblocking(False)
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        finally:
+            sock.setblocking(True)
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+    return False
+
+
+class PreconnectPool:
+    """
+    热门 CONNECT 目标的预连接池。
+
+    记录最近 hot_window 秒内的 CONNECT 目标，命中次数不少于 hot_threshold 的（最多 max_targets 个）视为热门，
+    后台线程为每个热门目标保持 per_target 个已建立的上游连接。CONNECT 到热门目标时直接取用，
+    省去一次 TCP 握手；空闲超过 max_age 秒的连接会被关闭（服务器通常会断开长时间不发数据的连接）。
+
+    Args:
+        connector: 上游连接器
+        per_target: 每个热门目标保持的连接数
+        max_targets: 热门目标数上限
+        max_age: 预连接的最长空闲时间（秒）
+        hot_window: 统计热门目标的时间窗口（秒），窗口内没有流量的目标不再预连接
+        hot_threshold: 成为热门目标所需的最少 CONNECT 次数
+    """
+
+    def __init__(
+        self,
+        connector: UpstreamConnector,
+        per_target: int = 2,
+        max_targets: int = 4,
+        max_age: float = 10.0,
+        hot_window: float = 120.0,
+        hot_threshold: int = 2,
+    ):
+        self.connector = connector
+        self.per_target = per_target
+        self.max_targets = max_targets
+        self.max_age = max_age
+        self.hot_window = hot_window
+        self.hot_threshold = hot_threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._recent: Dict[Tuple[str, int], Deque[float]] = {}
+        self._idle: Dict[Tuple[str, int], Deque[Tuple[float, socket.socket]]] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="preconnect", daemon=True)
+
+    def start(self) -> "PreconnectPool":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        with self._lock:
+            for idle in self._idle.values():
+                for _, sock in idle:
+                    sock.close()
+            self._idle.clear()
+
+    def acquire(self, host: str, port: int) -> Optional[socket.socket]:
+        """记录一次 CONNECT，并取出一个可用的预连接（没有则返回 None）。"""
+        target = (host.lower(), port)
+        now = time.monotonic()
+        with self._lock:
+            self._recent.setdefault(target, deque()).append(now)
+            idle = self._idle.get(target)
+            while idle:
+                created, sock = idle.popleft()
+                if now - created <= self.max_age and socket_is_alive(sock):
+                    self.hits += 1
+                    self._wakeup.set()  # 立即补充
+                    return sock
+                sock.close()
+            self.misses += 1
+        self._wakeup.set()
+        return None
+
+    def hot_targets(self) -> List[Tuple[str, int]]:
+        cutoff = time.monotonic() - self.hot_window
+        with self._lock:
+            counts = {}
+            for target, hits in list(self._recent.items()):
+                while hits and hits[0] < cutoff:
+                    hits.popleft()
+                if hits:
+                    counts[target] = len(hits)
+                else:
+                    del self._recent[target]
+        hot = [target for target, count in counts.items() if count >= self.hot_threshold]
+        hot.sort(key=lambda target: counts[target], reverse=True)
+        return hot[: self.max_targets]
+
+    def _evict(self, hot: List[Tuple[str, int]]) -> None:
+        """关闭过期的连接和已不再热门的目标的连接。"""
+        now = time.monotonic()
+        with self._lock:
+            for target in list(self._idle):
+                idle = self._idle[target]
+                keep = deque(
+                    (created, sock)
+                    for created, sock in idle
+                    if target in hot and now - created <= self.max_age and socket_is_alive(sock)
+                )
+                for entry in idle:
+                    if entry not in keep:
+                        entry[1].close()
+                if keep:
+                    self._idle[target] = keep
+                else:
+                    del self._idle[target]
+
+    def _refill(self, hot: List[Tuple[str, int]]) -> None:
+        for target in hot:
+            while not self._stop.is_set():
+                with self._lock:
+                    if len(self._idle.get(target, ())) >= self.per_target:
+                        break
+                try:
+                    sock = self.connector.connect(*target, stats_key="preconnect")
+                except OSError as e:
+                    logger.debug(f"预连接 {target[0]}:{target[1]} 失败: {e}")
+                    break
+                with self._lock:
+                    self._idle.setdefault(target, deque()).append((time.monotonic(), sock))
+
+    def _run(self) -> None:
+        # 每次唤醒（取用连接后）或每隔 max_age 的一部分检查一次
+        interval = max(self.max_age / 4, 0.5)
+        while not self._stop.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            hot = self.hot_targets()
+            self._evict(hot)
+            self._refill(hot)
+
+    def log_summary(self) -> None:
+        total = self.hits + self.misses
+        if total:
+            logger.info(f"预连接命中 {self.hits}/{total}（{self.hits * 100 / total:.0f}%）")
+
+
+DEFAULT_TRACE_CAPACITY = 1000
+DEFAULT_SLOW_CONNECT_MS = 1000.0
+DEFAULT_SLOW_FIRST_BYTE_MS = 3000.0
+
+
+@dataclass
+class TunnelTrace:
+    """
+    一个客户端连接的生命周期记录。events 为各阶段距 accept 的毫秒数：
+    accepted / parsed / resolved / connected / first_byte_up / first_byte_down / closed。
+    """
+
+    id: int
+    client: str
+    started_at: float
+    method: str = ""
+    target: str = ""
+    events: Dict[str, float] = field(default_factory=dict)
+    route: str = ""
+    preconnect: bool = False
+    status: Optional[int] = None
+    close_reason: Optional[str] = None
+    bytes_up: int = 0
+    bytes_down: int = 0
+    started: float = field(default_factory=time.monotonic, repr=False)
+    # 转发线程 mark() 的同时管理接口可能在读取 events
+    _events_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def mark(self, event: str) -> None:
+        """记录阶段时间（每个阶段只记录第一次）。"""
+        elapsed_ms = round((time.monotonic() - self.started) * 1000, 1)
+        with self._events_lock:
+            self.events.setdefault(event, elapsed_ms)
+
+    def between(self, start: str, end: str) -> Optional[float]:
+        with self._events_lock:
+            if start in self.events and end in self.events:
+                return self.events[end] - self.events[start]
+        return None
+
+    def to_dict(self) -> Dict[str, object]:
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name not in ("started", "_events_lock")}
+        with self._events_lock:
+            data["events"] = dict(self.events)
+        data["duration_ms"] = data["events"].get("closed", round((time.monotonic() - self.started) * 1000, 1))
+        return data
+
+
+class TraceBuffer:
+    """
+    连接记录的环形缓冲区：进行中的连接单独保存，结束后放入最多 capacity 条的缓冲区。
+
+    连接阶段（parsed -> connected）超过 slow_connect_ms，或首个下行字节（connected -> first_byte_down）
+    超过 slow_first_byte_ms 的连接在结束时自动输出到日志（以及 dump_path，JSONL）。
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_TRACE_CAPACITY,
+        slow_connect_ms: float = DEFAULT_SLOW_CONNECT_MS,
+        slow_first_byte_ms: float = DEFAULT_SLOW_FIRST_BYTE_MS,
+        dump_path: Optional[str] = None,
+    ):
+        self.slow_connect_ms = slow_connect_ms
+        self.slow_first_byte_ms = slow_first_byte_ms
+        self.dump_path = dump_path
+        self._lock = threading.Lock()
+        self._dump_lock = threading.Lock()  # 只保护 dump_path 的写入，不阻塞记录的增删和查询
+        self._finished: Deque[TunnelTrace] = deque(maxlen=capacity)
+        self._active: Dict[int, TunnelTrace] = {}
+        self._ids = itertools.count(1)
+
+    def start(self, client: str) -> TunnelTrace:
+        trace = TunnelTrace(next(self._ids), client, time.time())
+        trace.mark("accepted")
+        with self._lock:
+            self._active[trace.id] = trace
+        return trace
+
+    def finish(self, trace: TunnelTrace) -> None:
+        trace.mark("closed")
+        with self._lock:
+            self._active.pop(trace.id, None)
+            self._finished.append(trace)
+        reasons = self.slow_reasons(trace)
+        if reasons:
+            self._dump(trace, reasons)
+
+    def slow_reasons(self, trace: TunnelTrace) -> List[str]:
+        reasons = []
+        connect_ms = trace.between("parsed", "connected")
+        if connect_ms is not None and connect_ms > self.slow_connect_ms:
+            reasons.append(f"连接上游 {connect_ms:.0f}ms")
+        first_byte_ms = trace.between("connected", "first_byte_down")
+        if first_byte_ms is not None and first_byte_ms > self.slow_first_byte_ms:
+            reasons.append(f"首个下行字节 {first_byte_ms:.0f}ms")
+        return reasons
+
+    def _dump(self, trace: TunnelTrace, reasons: List[str]) -> None:
+        record = json.dumps(trace.to_dict(), ensure_ascii=False)
+        logger.warning(f"慢连接 #{trace.id} {trace.method} {trace.target}（{'，'.join(reasons)}）: {record}")
+        if self.dump_path:
+            try:
+                with self._dump_lock, open(self.dump_path, "a", encoding="utf-8") as f:
+                    f.write(record + "\n")
+            except OSError as e:
+                logger.warning(f"写入慢连接记录失败: {e}")
+
+    def get(self, trace_id: int) -> Optional[Dict[str, object]]:
+        with self._lock:
+            trace = self._active.get(trace_id) or next((t for t in self._finished if t.id == trace_id), None)
+        return trace.to_dict() if trace else None
+
+    def recent(self, limit: int = 100, slow_only: bool = False) -> List[Dict[str, object]]:
+        """最近结束的连接（新的在前）。"""
+        with self._lock:
+            traces = list(self._finished)
+        traces.reverse()
+        if slow_only:
+            traces = [trace for trace in traces if self.slow_reasons(trace)]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def active(self) -> List[Dict[str, object]]:
+        with self._lock:
+            traces = list(self._active.values())
+        return [trace.to_dict() for trace in traces]
+
+
+class AdminRequestHandler(BaseHTTPRequestHandler):
+    """
+    本地管理接口（只读，JSON）：
+
+        GET /traces?limit=N&slow=1   最近结束的连接
+        GET /traces/active           进行中的连接
+        GET /traces/<id>             单个连接
+        GET /stats                   上游连接耗时、流量统计和预连接命中率
+    """
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"管理接口: {format % args}")
+
+    def _send_json(self, code: int, payload: object) -> None:
+        body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        traces = ProxyRequestHandler.traces
+        path = parsed.path.rstrip("/")
+        if path == "/traces":
+            try:
+                limit = int(query.get("limit", ["100"])[0])
+                if limit < 0:
+                    raise ValueError
+            except ValueError:
+                self._send_json(400, {"error": "limit 必须是非负整数"})
+                return
+            slow_only = query.get("slow", ["0"])[0] not in ("0", "", "false")
+            self._send_json(200, traces.recent(limit, slow_only))
+        elif path == "/traces/active":
+            self._send_json(200, traces.active())
+        elif path.startswith("/traces/") and path[len("/traces/"):].isdigit():
+            trace = traces.get(int(path[len("/traces/"):]))
+            self._send_json(200 if trace else 404, trace or {"error": "not found"})
+        elif path == "/stats":
+            preconnect = ProxyRequestHandler.preconnect
+            self._send_json(200, {
+                "active_connections": len(traces.active()),
+                "connect": ProxyRequestHandler.connector.stats.summary(),
+                "traffic": ProxyRequestHandler.shaper.snapshot(),
+                "preconnect": {"hits": preconnect.hits, "misses": preconnect.misses} if preconnect else None,
+            })
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def start_admin_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), AdminRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="proxy-admin", daemon=True).start()
+    return server
+
+
+# systemd 套接字激活传入的第一个 fd
+LISTEN_FDS_START = 3
+DEFAULT_DRAIN_GRACE_S = 60.0
+HANDOFF_TIMEOUT_S = 30.0
+# 监听 socket 交接需要 Unix socket 传递 fd（SCM_RIGHTS），Windows 上不可用
+HANDOFF_SUPPORTED = hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+class DomainIndex:
+    """
+    域名后缀匹配索引：按标签从右到左存成字典树，查找只需遍历一次主机名的标签，最长匹配优先。
+
+    模式：
+        example.com     example.com 及其所有子域名
+        *.example.com   只匹配子域名
+        *               默认值（没有其他模式匹配时）
+    """
+
+    def __init__(self, rules: Optional[Dict[str, object]] = None):
+        self._root: Dict[str, object] = {}
+        self.default: Optional[object] = None
+        for pattern, value in (rules or {}).items():
+            self.add(pattern, value)
+
+    def add(self, pattern: str, value: object) -> None:
+        pattern = pattern.strip().lower().rstrip(".")
+        if pattern == "*":
+            self.default = value
+            return
+        subdomains_only = pattern.startswith("*.")
+        if subdomains_only:
+            pattern = pattern[2:]
+        node = self._root
+        for label in reversed(pattern.split(".")):
+            node = node.setdefault(label, {})
+        node["*" if subdomains_only else ""] = value
+
+    def lookup(self, host: str) -> Optional[object]:
+        labels = host.lower().rstrip(".").split(".")
+        node = self._root
+        found = self.default
+        for depth, label in enumerate(reversed(labels)):
+            node = node.get(label)
+            if node is None:
+                break
+            if "" in node:
+                found = node[""]
+            # *.suffix 只在还有更深一级标签时匹配
+            if "*" in node and depth < len(labels) - 1:
+                found = node["*"]
+        return found
+
+    def patterns(self) -> List[Tuple[str, object]]:
+        """所有模式（用于生成 PAC），不含默认值。"""
+        result: List[Tuple[str, object]] = []
+
+        def walk(node: Dict[str, object], labels: List[str]) -> None:
+            for key, child in node.items():
+                if key == "":
+                    result.append((".".join(reversed(labels)), child))
+                elif key == "*":
+                    result.append(("*." + ".".join(reversed(labels)), child))
+                else:
+                    walk(child, labels + [key])
+
+        walk(self._root, [])
+        return result
+
+
+ROUTE_PROXY = "proxy"
+ROUTE_DIRECT = "direct"
+ROUTE_REJECT = "reject"
+ROUTE_VIA_PREFIX = "via:"
+# PAC 中被拒绝的目标指向本机不监听的端口，浏览器立即失败，不占用代理链路
+PAC_BLACKHOLE = "PROXY 127.0.0.1:9"
+
+
+class Router:
+    """
+    按目标域名分流：
+
+        proxy      需要住宅 IP：由本代理直接连接目标（默认）
+        direct     不需要住宅 IP：PAC 让浏览器直连；请求仍到达本代理时由本代理直接连接
+        via:NAME   经命名的上游代理（--upstream NAME=URL，http:// 或 socks5://）转发
+        reject     拒绝（403）
+
+    Args:
+        rules: 域名模式 -> 动作（模式语法见 DomainIndex）
+        upstreams: 上游名称 -> 代理 URL
+        default: 没有规则匹配时的动作
+    """
+
+    def __init__(self, rules: Optional[Dict[str, str]] = None, upstreams: Optional[Dict[str, str]] = None, default: str = ROUTE_PROXY):
+        self.upstreams = dict(upstreams or {})
+        for action in list((rules or {}).values()) + [default]:
+            self.validate(action)
+        self.index = DomainIndex(rules)
+        if self.index.default is None:
+            self.index.default = default
+
+    def validate(self, action: str) -> None:
+        if action in (ROUTE_PROXY, ROUTE_DIRECT, ROUTE_REJECT):
+            return
+        if action.startswith(ROUTE_VIA_PREFIX) and action[len(ROUTE_VIA_PREFIX):] in self.upstreams:
+            return
+        raise ValueError(f"无效的路由动作: {action}（可用: proxy / direct / reject / via:NAME，NAME 需用 --upstream 定义）")
+
+    def route(self, host: str) -> str:
+        return self.index.lookup(host)
+
+    def upstream_for(self, action: str) -> Optional[str]:
+        """via:NAME 对应的上游代理 URL，其他动作返回 None。"""
+        if action.startswith(ROUTE_VIA_PREFIX):
+            return self.upstreams[action[len(ROUTE_VIA_PREFIX):]]
+        return None
+
+    def pac(self, proxy_address: str) -> str:
+        """生成浏览器使用的 PAC 文件：direct 直连，reject 立即失败，其余经本代理（proxy_address 为 host:port）。"""
+
+        def result(action: str) -> str:
+            if action == ROUTE_DIRECT:
+                return "DIRECT"
+            if action == ROUTE_REJECT:
+                return PAC_BLACKHOLE
+            return f"PROXY {proxy_address}"
+
+        domains: Dict[str, str] = {}
+        subdomains: Dict[str, str] = {}
+        for pattern, action in self.index.patterns():
+            if pattern.startswith("*."):
+                subdomains[pattern[2:]] = result(action)
+            else:
+                domains[pattern] = result(action)
+        return f"""// 由 local_proxy.py 生成，规则修改后请重新生成
+var DOMAINS = {json.dumps(domains, indent=2, sort_keys=True)};
+var SUBDOMAINS = {json.dumps(subdomains, indent=2, sort_keys=True)};
+var DEFAULT = {json.dumps(result(self.index.default))};
+
+function FindProxyForURL(url, host) {{
+  var labels = host.toLowerCase().replace(/\\.$/, "").split(".");
+  // 从最长的后缀开始查找，第一个命中即最长匹配；同一后缀上 *.suffix 优先于 suffix（与 DomainIndex.lookup 一致）
+  for (var i = 0; i < labels.length; i++) {{
+    var suffix = labels.slice(i).join(".");
+    if (i > 0 && SUBDOMAINS.hasOwnProperty(suffix)) return SUBDOMAINS[suffix];
+    if (DOMAINS.hasOwnProperty(suffix)) return DOMAINS[suffix];
+  }}
+  return DEFAULT;
+}}
+"""
+
+
+def load_route_file(path: str) -> Dict[str, str]:
+    """读取路由规则文件：每行 "模式 动作"，# 开头为注释。"""
+    rules: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) != 2:
+                raise ValueError(f"{path}:{number}: 格式应为 \"模式 动作\"")
+            rules[parts[0]] = parts[1]
+    return rules
+
+
+# 优先级类别及其权重：带宽紧张时各隧道按权重分配上行带宽
+PRIORITY_WEIGHTS = {"login": 8, "normal": 2, "bulk": 1}
+DEFAULT_PRIORITY = "normal"
+# 登录流量（页面和 Cloudflare 验证）默认为最高优先级
+DEFAULT_PRIORITY_RULES = {
+    "enrollware.com": "login",
+    "challenges.cloudflare.com": "login",
+}
+
+
+class TokenBucket:
+    """令牌桶：rate 字节/秒，最多积累 burst 字节。允许透支，透支部分由之后的等待偿还。"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int) -> float:
+        """发送 amount 字节前还需等待的秒数（超过 burst 的请求只需等到桶满）。"""
+        with self._lock:
+            self._refill()
+            needed = min(amount, self.burst)
+            return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+    def take(self, amount: int) -> None:
+        """阻塞直到可以发送 amount 字节。"""
+        while True:
+            delay = self.wait_time(amount)
+            if delay <= 0:
+                self.consume(amount)
+                return
+            time.sleep(delay)
+
+
+@dataclass
+class Flow:
+    """一条隧道（或一次 HTTP 请求）的流量记录。"""
+
+    client_ip: str
+    destination: str
+    priority: str
+    weight: int
+    finish: float = 0.0  # 公平调度的虚拟完成时间
+    bytes_up: int = 0
+    bytes_down: int = 0
+    capture_id: Optional[int] = None  # 抓包模式下的隧道 ID
+
+
+class FairScheduler:
+    """
+    加权公平调度（start-time fair queuing）：所有隧道共享一个上行令牌桶，
+    每个数据块按 "虚拟开始时间 + 字节数 / 权重" 排队，标签最小的先发送。
+    权重高的隧道（登录流量）在带宽紧张时排在大流量隧道的前面。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.bucket = TokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[float, int]] = []
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    def send(self, flow: Flow, amount: int) -> None:
+        """阻塞到轮到 flow 发送 amount 字节。"""
+        with self._cond:
+            start = max(self._virtual_time, flow.finish)
+            flow.finish = start + amount / flow.weight
+            entry = (flow.finish, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            while True:
+                if self._waiters[0] != entry:
+                    self._cond.wait()
+                    continue
+                delay = self.bucket.wait_time(amount)
+                if delay > 0:
+                    # 等待令牌期间释放锁：新到达的更高优先级数据块可以排到前面
+                    self._cond.wait(delay)
+                    continue
+                self.bucket.consume(amount)
+                heapq.heappop(self._waiters)
+                self._virtual_time = start
+                self._cond.notify_all()
+                return
+
+
+class TrafficShaper:
+    """
+    按客户端和目标统计流量，并可选地限速：
+
+    - client_rate：每个客户端 IP 的令牌桶（字节/秒）
+    - uplink_rate：所有隧道共享的总带宽（字节/秒），按优先级权重公平调度
+    - priority_rules：目标域名后缀 -> 优先级类别（login / normal / bulk）
+
+    两个速率都不设置时只统计，不限速。客户端和目标的统计及客户端令牌桶各保留最近活跃的 max_entries 个
+    （最久未活跃的先丢弃），长时间运行时不会无限增长。
+    """
+
+    def __init__(
+        self,
+        client_rate: Optional[float] = None,
+        uplink_rate: Optional[float] = None,
+        priority_rules: Optional[Dict[str, str]] = None,
+        max_entries: int = 1000,
+    ):
+        self.client_rate = client_rate
+        self.scheduler = FairScheduler(uplink_rate, max(uplink_rate / 10, 16384)) if uplink_rate else None
+        self.priority_rules = dict(DEFAULT_PRIORITY_RULES if priority_rules is None else priority_rules)
+        self._priority_index = DomainIndex(self.priority_rules)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._client_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._clients: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self._destinations: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def _touch(self, table: OrderedDict, key: str, factory: Callable[[], object]):
+        """取出（必要时创建）key 对应的条目并标记为最近活跃，超出 max_entries 时丢弃最久未活跃的。调用方持有锁。"""
+        value = table.get(key)
+        if value is None:
+            value = table[key] = factory()
+            while len(table) > self.max_entries:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return value
+
+    def priority_for(self, host: str) -> str:
+        """最长后缀匹配的优先级类别。"""
+        return self._priority_index.lookup(host) or DEFAULT_PRIORITY
+
+    def open_flow(self, client_ip: str, host: str, port: int) -> Flow:
+        priority = self.priority_for(host)
+        return Flow(client_ip, f"{host}:{port}", priority, PRIORITY_WEIGHTS.get(priority, 1))
+
+    def transfer(self, flow: Flow, direction: str, amount: int) -> None:
+        """在发送 amount 字节前调用：按需限速，然后记账。direction 为 "up"（客户端到上游）或 "down"。"""
+        if self.client_rate:
+            with self._lock:
+                bucket = self._touch(self._client_buckets, flow.client_ip, lambda: TokenBucket(self.client_rate))
+            bucket.take(amount)
+        if self.scheduler is not None:
+            self.scheduler.send(flow, amount)
+        with self._lock:
+            if direction == "up":
+                flow.bytes_up += amount
+            else:
+                flow.bytes_down += amount
+            for table, key in ((self._clients, flow.client_ip), (self._destinations, flow.destination)):
+                counters = self._touch(table, key, lambda: {"up": 0, "down": 0})
+                counters[direction] += amount
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        with self._lock:
+            return {
+                "clients": {key: dict(value) for key, value in self._clients.items()},
+                "destinations": {key: dict(value) for key, value in self._destinations.items()},
+            }
+
+    def log_summary(self, top: int = 5) -> None:
+        snapshot = self.snapshot()
+        for title, table in (("客户端", snapshot["clients"]), ("目标", snapshot["destinations"])):
+            ranked = sorted(table.items(), key=lambda item: item[1]["up"] + item[1]["down"], reverse=True)
+            for key, counters in ranked[:top]:
+                logger.info(f"流量 {title} {key}: 上行 {counters['up']} 字节，下行 {counters['down']} 字节")
+
+
 class ProxyRequestHandler(socketserver.BaseRequestHandler):
     """处理代理请求的处理器"""
 
     allowed_ips: Optional[Set[str]] = None
+    connector: UpstreamConnector = UpstreamConnector()
+    preconnect: Optional[PreconnectPool] = None
+    shaper: TrafficShaper = TrafficShaper()
+    capture: Optional[CaptureWriter] = None
+    traces: TraceBuffer = TraceBuffer()
+    router: Router = Router()
+    pac_address: Optional[str] = None  # 设置后在 GET /proxy.pac 提供 PAC 文件
 
     def handle(self):
         """处理客户端请求"""
         client_ip = self.client_address[0]
         logger.info(f"收到来自 {client_ip} 的连接请求")
+        self.trace = self.traces.start(client_ip)
 
         # 检查 IP 白名单
         if self.allowed_ips and client_ip not in self.allowed_ips:
             logger.warning(f"拒绝来自 {client_ip} 的连接（不在白名单中）")
+            self.trace.close_reason = "denied"
             self.request.close()
+            self.traces.finish(self.trace)
             return
 
+        self.connector.tuning.apply(self.request)
+
         try:
             # 读取请求的第一行（CONNECT 或 GET/POST 等）
             request_line = self.request.recv(4096).decode("utf-8", errors="ignore")
@@ -70,24 +949,33 @@ class ProxyRequestHandler(socketserver.BaseRequestHandler):
 
             method = parts[0]
             target = parts[1]
+            self.trace.method = method
+            self.trace.target = target
+            self.trace.mark("parsed")
 
+            # PAC 文件（浏览器直接请求代理自身，路径为相对路径）
+            if method == "GET" and target == "/proxy.pac" and self.pac_address:
+                self.send_pac()
             # 处理 CONNECT 方法（HTTPS）
-            if method == "CONNECT":
+            elif method == "CONNECT":
                 self.handle_connect(target, client_ip)
             # 处理 HTTP 方法（GET, POST 等）
             elif method in ("GET", "POST", "PUT", "DELETE", "HEAD", "OPTIONS"):
                 self.handle_http(method, target, request_line, client_ip)
             else:
                 logger.warning(f"不支持的 HTTP 方法: {method}")
+                self.trace.close_reason = "unsupported_method"
                 self.send_error_response(405, "Method Not Allowed")
 
         except Exception as e:
             logger.exception(f"处理请求时出错: {e}")
+            self.trace.close_reason = self.trace.close_reason or f"error: {e}"
         finally:
             try:
                 self.request.close()
             except Exception:
                 pass
+            self.traces.finish(self.trace)
 
     def handle_connect(self, target: str, client_ip: str):
         """处理 HTTPS CONNECT 请求"""
@@ -97,33 +985,50 @@ class ProxyRequestHandler(socketserver.BaseRequestHandler):
             self.send_error_response(400, "Bad Request")
             return
 
-        host, port = target.split(":", 1)
+        host, port = target.rsplit(":", 1)
+        host = host.strip("[]")  # IPv6 字面量: [::1]:443
         port = int(port)
-        logger.info(f"[{client_ip}] CONNECT {host}:{port}")
+        route = self.router.route(host)
+        self.trace.route = route
+        logger.info(f"[{client_ip}] CONNECT {host}:{port} ({route})")
+        if route == ROUTE_REJECT:
+            self.trace.close_reason = "rejected"
+            self.send_error_response(403, "Forbidden")
+            return
 
+        remote_socket = None
+        flow = None
         try:
-            # 连接到目标服务器
-            remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            remote_socket.settimeout(10)
-            remote_socket.connect((host, port))
+            # 连接到目标服务器（热门目标优先使用预连接，经上游代理的目标除外）
+            started = time.monotonic()
+            upstream = self.router.upstream_for(route)
+            if self.preconnect is not None and upstream is None:
+                remote_socket = self.preconnect.acquire(host, port)
+                self.trace.preconnect = remote_socket is not None
+            if remote_socket is None:
+                remote_socket = self.connect_upstream(host, port, route)
+            self.trace.mark("connected")
 
             # 发送 200 Connection Established 响应
             self.request.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
 
-            # 转发数据
-            self.forward_data(self.request, remote_socket)
+            # 双向转发数据
+            flow = self.open_flow(client_ip, host, port, started)
+            self.relay(self.request, remote_socket, flow)
 
         except socket.timeout:
             logger.error(f"连接超时: {host}:{port}")
+            self.trace.close_reason = "connect_timeout"
             self.send_error_response(504, "Gateway Timeout")
         except Exception as e:
             logger.error(f"连接失败 {host}:{port}: {e}")
+            self.trace.close_reason = f"connect_failed: {e}"
             self.send_error_response(502, "Bad Gateway")
         finally:
-            try:
+            if remote_socket is not None:
                 remote_socket.close()
-            except Exception:
-                pass
+            if flow is not None and flow.capture_id is not None:
+                self.capture.close_tunnel(flow.capture_id)
 
     def handle_http(self, method: str, target: str, request_line: str, client_ip: str):
         """处理 HTTP 请求（GET, POST 等）"""
@@ -154,48 +1059,133 @@ class ProxyRequestHandler(socketserver.BaseRequestHandler):
             self.send_error_response(400, "Bad Request")
             return
 
-        logger.info(f"[{client_ip}] {method} {host}:{port}{path}")
+        route = self.router.route(host)
+        self.trace.route = route
+        logger.info(f"[{client_ip}] {method} {host}:{port}{path} ({route})")
+        if route == ROUTE_REJECT:
+            self.trace.close_reason = "rejected"
+            self.send_error_response(403, "Forbidden")
+            return
 
+        remote_socket = None
+        flow = None
         try:
             # 连接到目标服务器
-            remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            started = time.monotonic()
+            remote_socket = self.connect_upstream(host, port, route)
+            self.trace.mark("connected")
             remote_socket.settimeout(30)
-            remote_socket.connect((host, port))
+            flow = self.open_flow(client_ip, host, port, started)
 
             # 修改请求行，使用相对路径
             modified_request = request_line.replace(target, path, 1)
 
             # 发送请求到目标服务器
-            remote_socket.sendall(modified_request.encode("utf-8"))
+            payload = modified_request.encode("utf-8")
+            self.transfer(flow, "up", payload)
+            remote_socket.sendall(payload)
 
             # 转发响应
-            self.forward_data(remote_socket, self.request)
+            self.forward_data(remote_socket, self.request, flow, "down")
 
         except socket.timeout:
             logger.error(f"请求超时: {host}:{port}")
+            self.trace.close_reason = "timeout"
             self.send_error_response(504, "Gateway Timeout")
         except Exception as e:
             logger.error(f"请求失败 {host}:{port}: {e}")
+            self.trace.close_reason = f"failed: {e}"
             self.send_error_response(502, "Bad Gateway")
         finally:
-            try:
+            if remote_socket is not None:
                 remote_socket.close()
-            except Exception:
-                pass
+            if flow is not None and flow.capture_id is not None:
+                self.capture.close_tunnel(flow.capture_id)
+
+    def connect_upstream(self, host: str, port: int, route: str) -> socket.socket:
+        """按路由连接目标：via:NAME 经上游代理建立隧道，其他直接连接。"""
+        upstream = self.router.upstream_for(route)
+        if upstream is None:
+            return self.connector.connect(host, port, self.trace)
+        started = time.monotonic()
+        try:
+            sock, _ = connect_via_proxy(upstream, host, port, self.connector.connect_timeout)
+        except OSError:
+            self.connector.stats.record(route, (time.monotonic() - started) * 1000, ok=False)
+            raise
+        self.connector.stats.record(route, (time.monotonic() - started) * 1000, ok=True)
+        sock.settimeout(None)
+        self.connector.tuning.apply(sock)
+        return sock
+
+    def send_pac(self):
+        body = self.router.pac(self.pac_address).encode("utf-8")
+        header = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ns-proxy-autoconfig\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        self.trace.status = 200
+        self.trace.close_reason = "pac"
+        self.request.sendall(header.encode("ascii") + body)
 
-    def forward_data(self, source: socket.socket, destination: socket.socket):
-        """在两个 socket 之间转发数据"""
+    def open_flow(self, client_ip: str, host: str, port: int, connect_started: float) -> Flow:
+        """上游连接建立后创建流量记录（抓包模式下同时记录隧道建立）。"""
+        flow = self.shaper.open_flow(client_ip, host, port)
+        if self.capture is not None:
+            connect_ms = (time.monotonic() - connect_started) * 1000
+            flow.capture_id = self.capture.open_tunnel(client_ip, flow.destination, connect_ms)
+        return flow
+
+    def transfer(self, flow: Flow, direction: str, data: bytes):
+        """发送数据块之前调用：流量整形和抓包。"""
+        self.shaper.transfer(flow, direction, len(data))
+        self.trace.mark(f"first_byte_{direction}")
+        if direction == "up":
+            self.trace.bytes_up += len(data)
+        else:
+            self.trace.bytes_down += len(data)
+        if flow.capture_id is not None:
+            self.capture.data(flow.capture_id, direction, data)
+
+    def relay(self, client: socket.socket, upstream: socket.socket, flow: Flow):
+        """CONNECT 隧道：上游到客户端在辅助线程中转发，客户端到上游在当前线程中转发。"""
+        downstream = threading.Thread(
+            target=self._forward_and_close, args=(upstream, client, flow, "down"), name="relay-downstream", daemon=True
+        )
+        downstream.start()
+        self._forward_and_close(client, upstream, flow, "up")
+        downstream.join()
+
+    def _forward_and_close(self, source: socket.socket, destination: socket.socket, flow: Flow, direction: str):
+        self.forward_data(source, destination, flow, direction)
+        # 先结束的一方决定关闭原因
+        if self.trace.close_reason is None:
+            self.trace.close_reason = "client_eof" if direction == "up" else "upstream_eof"
+        # 一个方向结束后半关闭对端，让另一个方向自然结束
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def forward_data(self, source: socket.socket, destination: socket.socket, flow: Flow, direction: str):
+        """在两个 socket 之间转发数据（每个数据块先经过流量整形）"""
         try:
             while True:
                 data = source.recv(4096)
                 if not data:
                     break
+                self.transfer(flow, direction, data)
                 destination.sendall(data)
         except Exception as e:
             logger.debug(f"转发数据时出错（可能是正常关闭）: {e}")
+            if self.trace.close_reason is None:
+                self.trace.close_reason = f"{direction}_error: {e}"
 
     def send_error_response(self, code: int, message: str):
         """发送错误响应"""
+        self.trace.status = code
         response = f"HTTP/1.1 {code} {message}\r\n\r\n"
         try:
             self.request.sendall(response.encode("utf-8"))
@@ -204,10 +1194,163 @@ class ProxyRequestHandler(socketserver.BaseRequestHandler):
 
 
 class ThreadingProxyServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    """支持多线程的代理服务器"""
+    """支持多线程的代理服务器（记录活动连接，用于平滑关闭）"""
     allow_reuse_address = True
     daemon_threads = True
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._active: Set[socket.socket] = set()
+        self._active_changed = threading.Condition()
+
+    @classmethod
+    def from_socket(cls, sock: socket.socket, handler_class) -> "ThreadingProxyServer":
+        """使用已在监听的 socket（继承自旧进程或 systemd）创建服务器。"""
+        server = cls(sock.getsockname()[:2], handler_class, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        server.address_family = sock.family
+        server.server_address = sock.getsockname()
+        return server
+
+    def process_request_thread(self, request, client_address):
+        with self._active_changed:
+            self._active.add(request)
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._active_changed:
+                self._active.discard(request)
+                self._active_changed.notify_all()
+
+    @property
+    def active_count(self) -> int:
+        with self._active_changed:
+            return len(self._active)
+
+    def drain(self, grace_s: float, force: Optional[threading.Event] = None) -> int:
+        """
+        等待活动连接自然结束，最多 grace_s 秒（force 被设置时立即结束等待），
+        然后强制关闭剩余连接。返回被强制关闭的连接数。
+        """
+        deadline = time.monotonic() + grace_s
+        with self._active_changed:
+            while self._active and not (force is not None and force.is_set()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._active_changed.wait(min(remaining, 1.0))
+            leftover = list(self._active)
+        for sock in leftover:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return len(leftover)
+
+
+def inherited_listen_socket() -> Optional[socket.socket]:
+    """systemd 套接字激活（LISTEN_PID / LISTEN_FDS）传入的监听 socket，没有则返回 None。"""
+    if os.getenv("LISTEN_PID") != str(os.getpid()) or int(os.getenv("LISTEN_FDS", "0")) < 1:
+        return None
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+    return socket.socket(fileno=LISTEN_FDS_START)
+
+
+class HandoffControl:
+    """
+    监听 socket 交接的控制通道（Unix socket）。
+
+    新进程以 --takeover 启动时连接旧进程的控制通道，经 SCM_RIGHTS 收到监听 socket 并开始接受连接，
+    然后回复 READY；旧进程收到后关闭控制通道，停止接受新连接并排空现有连接。
+    新进程在回复 READY 之前失败时，旧进程照常服务，不影响任何连接。
+
+    Args:
+        path: 控制通道路径
+        server: 当前的代理服务器
+        on_handoff: 交接完成后的回调（旧进程在其中开始排空）
+    """
+
+    def __init__(self, path: str, server: ThreadingProxyServer, on_handoff: Callable[[], None]):
+        self.path = path
+        self.server = server
+        self.on_handoff = on_handoff
+        self._listener: Optional[socket.socket] = None
+
+    def start(self) -> "HandoffControl":
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._listener.listen(1)
+        threading.Thread(target=self._run, name="handoff-control", daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        if self._listener is None:
+            return
+        self._listener.close()
+        self._listener = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while self._listener is not None:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            try:
+                conn.settimeout(HANDOFF_TIMEOUT_S)
+                socket.send_fds(conn, [b"LISTEN"], [self.server.fileno()])
+                if conn.recv(16) != b"READY":
+                    logger.warning("新进程未完成交接，继续服务")
+                    continue
+                logger.info("监听 socket 已交给新进程")
+                # 先释放控制通道路径，新进程在连接关闭后绑定自己的控制通道
+                self.close()
+                self.on_handoff()
+            except OSError as e:
+                logger.warning(f"监听 socket 交接失败，继续服务: {e}")
+            finally:
+                conn.close()
+
+
+def take_over(path: str) -> Tuple[socket.socket, socket.socket]:
+    """从旧进程接收监听 socket，返回 (监听 socket, 控制连接)。开始接受连接后调用 confirm_takeover。"""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(HANDOFF_TIMEOUT_S)
+    try:
+        conn.connect(path)
+        message, fds, _, _ = socket.recv_fds(conn, 16, 1)
+    except OSError:
+        conn.close()
+        raise
+    if message != b"LISTEN" or not fds:
+        conn.close()
+        raise OSError(f"控制通道 {path} 没有传来监听 socket")
+    return socket.socket(fileno=fds[0]), conn
+
+
+def confirm_takeover(conn: socket.socket) -> None:
+    """通知旧进程交接完成，等待它关闭控制通道。"""
+    try:
+        conn.sendall(b"READY")
+        conn.recv(1)
+    finally:
+        conn.close()
+
+
+def spawn_successor() -> None:
+    """以相同的命令行参数启动新进程接管监听 socket（SIGHUP）。"""
+    argv = [arg for arg in sys.argv if arg != "--takeover"]
+    logger.info("启动新进程接管监听 socket...")
+    subprocess.Popen([sys.executable, *argv, "--takeover"])
+
 
 def main():
     """主函数"""
@@ -227,6 +1370,15 @@ def main():
 
   # 只监听本地（用于测试）
   python local_proxy.py --host 127.0.0.1
+
+  # 不中断连接地更换参数：新进程接管监听 socket，旧进程排空现有连接后退出
+  python local_proxy.py --port 8080 --uplink-rate 2000 --takeover
+
+  # 不中断连接地重启（相同参数，例如升级代码后）
+  kill -HUP <旧进程 PID>
+
+  # 按域名分流，并在 /proxy.pac 提供 PAC 文件
+  python local_proxy.py --routes-file routes.txt --pac-address 136.56.72.172:8080
         """,
     )
     parser.add_argument(
@@ -244,6 +1396,112 @@ def main():
         "--allowed-ips",
         help="允许访问的 IP 地址列表（逗号分隔），如果不指定则允许所有 IP",
     )
+    parser.add_argument(
+        "--drain-grace",
+        type=float,
+        default=DEFAULT_DRAIN_GRACE_S,
+        help=f"停止时等待活动连接结束的最长秒数，超时后强制关闭（默认: {DEFAULT_DRAIN_GRACE_S:.0f}）",
+    )
+    parser.add_argument(
+        "--control-socket",
+        help="监听 socket 交接的控制通道路径（默认: /tmp/local_proxy_<端口>.sock）",
+    )
+    parser.add_argument(
+        "--takeover",
+        action="store_true",
+        help="从正在运行的旧进程接管监听 socket（旧进程随后排空连接并退出）",
+    )
+    parser.add_argument(
+        "--admin-port",
+        type=int,
+        default=0,
+        help="本地管理接口端口（只监听 127.0.0.1，提供 /traces 和 /stats），0 为关闭（默认: 0）",
+    )
+    parser.add_argument(
+        "--trace-capacity",
+        type=int,
+        default=DEFAULT_TRACE_CAPACITY,
+        help=f"内存中保留的已结束连接记录数（默认: {DEFAULT_TRACE_CAPACITY}）",
+    )
+    parser.add_argument(
+        "--slow-connect-ms",
+        type=float,
+        default=DEFAULT_SLOW_CONNECT_MS,
+        help=f"连接上游超过该毫秒数的连接自动输出记录（默认: {DEFAULT_SLOW_CONNECT_MS:.0f}）",
+    )
+    parser.add_argument(
+        "--slow-first-byte-ms",
+        type=float,
+        default=DEFAULT_SLOW_FIRST_BYTE_MS,
+        help=f"连上后超过该毫秒数才收到首个下行字节的连接自动输出记录（默认: {DEFAULT_SLOW_FIRST_BYTE_MS:.0f}）",
+    )
+    parser.add_argument("--trace-dump", metavar="FILE", help="慢连接记录同时追加到该 JSONL 文件")
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="连接上游的超时秒数（默认: 10）")
+    parser.add_argument(
+        "--attempt-delay",
+        type=float,
+        default=0.25,
+        help="多个上游地址时，相邻连接尝试的间隔秒数（Happy Eyeballs，默认: 0.25）",
+    )
+    parser.add_argument("--no-nodelay", action="store_true", help="不设置 TCP_NODELAY")
+    parser.add_argument("--no-keepalive", action="store_true", help="不启用 TCP keepalive")
+    parser.add_argument("--keepidle", type=int, default=60, help="keepalive 空闲多少秒后开始探测（默认: 60）")
+    parser.add_argument("--rcvbuf", type=int, help="SO_RCVBUF 字节数（默认: 系统默认）")
+    parser.add_argument("--sndbuf", type=int, help="SO_SNDBUF 字节数（默认: 系统默认）")
+    parser.add_argument("--client-rate", type=float, help="每个客户端 IP 的限速（KB/s，默认: 不限）")
+    parser.add_argument(
+        "--uplink-rate",
+        type=float,
+        help="总带宽（KB/s，默认: 不限）；设置后各隧道按优先级权重公平分配",
+    )
+    parser.add_argument(
+        "--priority",
+        action="append",
+        default=[],
+        metavar="DOMAIN=CLASS",
+        help=f"目标域名（含子域名）的优先级类别：{' / '.join(PRIORITY_WEIGHTS)}，可重复（默认已包含 enrollware.com=login）",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="FILE",
+        help="抓包模式：把每条隧道的时间线（建立时间、各方向数据块的长度和时间）写入二进制日志，供 proxy_replay.py 回放（--takeover 启动的新进程写入 FILE.<PID>）",
+    )
+    parser.add_argument(
+        "--capture-payload",
+        type=int,
+        default=0,
+        metavar="BYTES",
+        help="抓包时保存每个数据块的前 BYTES 字节负载（默认: 0，不保存负载）",
+    )
+    parser.add_argument(
+        "--route",
+        action="append",
+        default=[],
+        metavar="PATTERN=ACTION",
+        help="分流规则，可重复。PATTERN: example.com（含子域名）/ *.example.com（仅子域名）/ *（默认）；"
+        "ACTION: proxy / direct / reject / via:NAME",
+    )
+    parser.add_argument("--routes-file", help="分流规则文件，每行 \"模式 动作\"（# 为注释），--route 优先")
+    parser.add_argument(
+        "--upstream",
+        action="append",
+        default=[],
+        metavar="NAME=URL",
+        help="命名的上游代理（http:// 或 socks5://），供 via:NAME 规则使用，可重复",
+    )
+    parser.add_argument(
+        "--pac-address",
+        metavar="HOST:PORT",
+        help="浏览器访问本代理的地址；设置后在 http://HOST:PORT/proxy.pac 提供 PAC 文件",
+    )
+    parser.add_argument("--write-pac", metavar="FILE", help="生成 PAC 文件后退出（需要 --pac-address）")
+    parser.add_argument(
+        "--preconnect",
+        type=int,
+        default=0,
+        help="为每个热门 CONNECT 目标保持的预连接数，0 为关闭（默认: 0，例如 2 开启）",
+    )
+    parser.add_argument("--preconnect-max-age", type=float, default=10.0, help="预连接的最长空闲秒数（默认: 10）")
 
     args = parser.parse_args()
 
@@ -258,34 +1516,172 @@ def main():
 
     # 设置允许的 IP
     ProxyRequestHandler.allowed_ips = allowed_ips
+    ProxyRequestHandler.connector = UpstreamConnector(
+        SocketTuning(
+            nodelay=not args.no_nodelay,
+            keepalive=not args.no_keepalive,
+            keepidle=args.keepidle,
+            rcvbuf=args.rcvbuf,
+            sndbuf=args.sndbuf,
+        ),
+        connect_timeout=args.connect_timeout,
+        attempt_delay=args.attempt_delay,
+    )
+    priority_rules = dict(DEFAULT_PRIORITY_RULES)
+    for rule in args.priority:
+        domain, _, priority = rule.partition("=")
+        if priority not in PRIORITY_WEIGHTS:
+            parser.error(f"--priority {rule}: 优先级类别必须是 {' / '.join(PRIORITY_WEIGHTS)}")
+        priority_rules[domain.strip().lower()] = priority
+    ProxyRequestHandler.shaper = TrafficShaper(
+        client_rate=args.client_rate * 1024 if args.client_rate else None,
+        uplink_rate=args.uplink_rate * 1024 if args.uplink_rate else None,
+        priority_rules=priority_rules,
+    )
+    try:
+        route_rules = load_route_file(args.routes_file) if args.routes_file else {}
+        for rule in args.route:
+            pattern, _, action = rule.partition("=")
+            route_rules[pattern] = action
+        upstreams = {}
+        for upstream in args.upstream:
+            name, _, url = upstream.partition("=")
+            upstreams[name.strip()] = url.strip()
+        ProxyRequestHandler.router = Router(route_rules, upstreams)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    ProxyRequestHandler.pac_address = args.pac_address
+    if args.write_pac:
+        if not args.pac_address:
+            parser.error("--write-pac 需要 --pac-address")
+        with open(args.write_pac, "w", encoding="utf-8") as f:
+            f.write(ProxyRequestHandler.router.pac(args.pac_address))
+        logger.info(f"PAC 文件已写入: {args.write_pac}")
+        return
+
+    if args.takeover and not HANDOFF_SUPPORTED:
+        parser.error("--takeover 需要 Unix socket 传递监听 socket，当前平台不支持")
 
-    # 创建并启动服务器
+    ProxyRequestHandler.traces = TraceBuffer(
+        args.trace_capacity, args.slow_connect_ms, args.slow_first_byte_ms, args.trace_dump
+    )
+    if args.capture:
+        # 接管时旧进程仍在排空并写入 args.capture，新进程写入独立的文件，避免截断或交错
+        capture_path = f"{args.capture}.{os.getpid()}" if args.takeover else args.capture
+        ProxyRequestHandler.capture = CaptureWriter(capture_path, args.capture_payload)
+        logger.info(f"抓包模式: {capture_path}（每个数据块保存 {args.capture_payload} 字节负载）")
+    if args.preconnect > 0:
+        ProxyRequestHandler.preconnect = PreconnectPool(
+            ProxyRequestHandler.connector, per_target=args.preconnect, max_age=args.preconnect_max_age
+        ).start()
+
+    control_path = args.control_socket or f"/tmp/local_proxy_{args.port}.sock"
+
+    # 创建服务器：接管旧进程的监听 socket、systemd 套接字激活，或者自己绑定端口
+    takeover_conn = None
     try:
-        server = ThreadingProxyServer((args.host, args.port), ProxyRequestHandler)
-        logger.info("=" * 60)
-        logger.info(f"代理服务器已启动")
-        logger.info(f"监听地址: {args.host}:{args.port}")
-        if allowed_ips:
-            logger.info(f"允许的 IP: {', '.join(allowed_ips)}")
+        if args.takeover:
+            listen_socket, takeover_conn = take_over(control_path)
+            server = ThreadingProxyServer.from_socket(listen_socket, ProxyRequestHandler)
         else:
-            logger.info("允许的 IP: 所有 IP")
-        logger.info("=" * 60)
-        logger.info("按 Ctrl+C 停止服务器")
-        logger.info("")
-        server.serve_forever()
-    except KeyboardInterrupt:
-        logger.info("\n正在关闭服务器...")
-        server.shutdown()
-        logger.info("服务器已关闭")
+            listen_socket = inherited_listen_socket()
+            if listen_socket is not None:
+                server = ThreadingProxyServer.from_socket(listen_socket, ProxyRequestHandler)
+            else:
+                server = ThreadingProxyServer((args.host, args.port), ProxyRequestHandler)
     except OSError as e:
         if e.errno == 98:  # Address already in use
-            logger.error(f"端口 {args.port} 已被占用，请使用其他端口或关闭占用该端口的程序")
+            logger.error(f"端口 {args.port} 已被占用，请使用其他端口或关闭占用该端口的程序（或用 --takeover 接管）")
+        elif args.takeover:
+            logger.error(f"无法从 {control_path} 接管监听 socket: {e}")
         else:
             logger.exception(f"启动服务器失败: {e}")
         sys.exit(1)
-    except Exception as e:
-        logger.exception(f"服务器错误: {e}")
-        sys.exit(1)
+
+    stop_requested = threading.Event()
+    force_stop = threading.Event()
+    successor_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        if stop_requested.is_set():
+            force_stop.set()  # 第二次 Ctrl+C：不再等待活动连接
+        stop_requested.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    if hasattr(signal, "SIGHUP") and HANDOFF_SUPPORTED:
+        signal.signal(signal.SIGHUP, lambda signum, frame: successor_requested.set())
+
+    threading.Thread(target=server.serve_forever, name="proxy-server", daemon=True).start()
+    if takeover_conn is not None:
+        confirm_takeover(takeover_conn)
+    control = None
+    if HANDOFF_SUPPORTED:
+        control = HandoffControl(control_path, server, stop_requested.set)
+        try:
+            control.start()
+        except OSError as e:
+            logger.warning(f"控制通道 {control_path} 不可用，无法交接监听 socket: {e}")
+    else:
+        logger.info("当前平台不支持交接监听 socket，不中断重启（--takeover / SIGHUP）不可用")
+
+    admin = None
+    if args.admin_port:
+        # 接管时旧进程在交接后才释放管理接口端口，稍等重试
+        for attempt in range(10 if args.takeover else 1):
+            try:
+                admin = start_admin_server(args.admin_port)
+                logger.info(f"管理接口: http://127.0.0.1:{args.admin_port}/traces")
+                break
+            except OSError as e:
+                if attempt == (9 if args.takeover else 0):
+                    logger.warning(f"管理接口无法启动（端口 {args.admin_port}）: {e}")
+                else:
+                    time.sleep(0.5)
+
+    if args.pac_address:
+        logger.info(f"PAC 文件: http://{args.pac_address}/proxy.pac")
+
+    host, port = server.server_address[:2]
+    logger.info("=" * 60)
+    logger.info(f"代理服务器已启动" + ("（已接管旧进程的监听 socket）" if args.takeover else ""))
+    logger.info(f"监听地址: {host}:{port}")
+    if allowed_ips:
+        logger.info(f"允许的 IP: {', '.join(allowed_ips)}")
+    else:
+        logger.info("允许的 IP: 所有 IP")
+    logger.info("=" * 60)
+    if control is not None:
+        logger.info("按 Ctrl+C 停止服务器（再按一次立即停止），kill -HUP 不中断连接地重启")
+    else:
+        logger.info("按 Ctrl+C 停止服务器（再按一次立即停止）")
+    logger.info("")
+
+    while not stop_requested.wait(1):
+        if successor_requested.is_set():
+            successor_requested.clear()
+            spawn_successor()
+
+    # 停止接受新连接，排空现有连接
+    server.shutdown()
+    if control is not None:
+        control.close()
+    server.server_close()
+    if admin is not None:
+        admin.shutdown()
+        admin.server_close()
+    logger.info(f"正在关闭服务器，等待 {server.active_count} 个活动连接结束（最多 {args.drain_grace:.0f} 秒）...")
+    forced = server.drain(args.drain_grace, force_stop)
+    if forced:
+        logger.warning(f"强制关闭了 {forced} 个未结束的连接")
+    ProxyRequestHandler.connector.stats.log_summary()
+    ProxyRequestHandler.shaper.log_summary()
+    if ProxyRequestHandler.capture is not None:
+        ProxyRequestHandler.capture.close()
+    if ProxyRequestHandler.preconnect is not None:
+        ProxyRequestHandler.preconnect.stop()
+        ProxyRequestHandler.preconnect.log_summary()
+    logger.info("服务器已关闭")
 
 
 if __name__ == "__main__":
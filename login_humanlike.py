@@ -13,6 +13,7 @@
 - 可见模式：HEADLESS=false（默认，用于调试）
 - Headless + Xvfb：HEADLESS=true USE_XVFB=true（推荐，Linux 系统）
 - 标准 Headless：HEADLESS=true（已优化，但可能被检测）
+- 服务模式：python login_humanlike.py --serve（浏览器常驻，通过本地 HTTP / Unix socket 接收登录任务）
 
 Chrome Profile 使用（绕过 AWS IP 被标记）：
 - 本地成功登录后，设置 CHROME_PROFILE_DIR=./chrome_profile 保存 profile
@@ -20,24 +21,49 @@ Chrome Profile 使用（绕过 AWS IP 被标记）：
 - 在 AWS 中设置 CHROME_PROFILE_DIR=./chrome_profile 使用保存的 profile
 - Profile 包含 cookies、缓存和浏览器指纹，有助于绕过 Cloudflare 检测
 """
+import argparse
+import fnmatch
+import json
 import logging
+import math
 import os
 import random
+import signal
+import socketserver
 import subprocess
 import sys
+import tempfile
+import threading
 import time
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 import undetected_chromedriver as uc
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+from class_list import export_class_list
+from class_sync import DEFAULT_INDEX_PATH as DEFAULT_SYNC_INDEX_PATH, sync_class_list
+from http_handoff import export_browser_session, handoff_from_driver, save_session_file
+from job_queue import DEFAULT_LEASE_S, DEFAULT_QUEUE_PATH, JobQueue, default_worker_id
+from process_monitor import LaunchGuard, ProcessTreeMonitor, reap_orphans
+from run_history import DEFAULT_DB_PATH, PhaseTimer, RunHistory
+from tunnel_supervisor import is_supervised, same_proxy, wait_for_healthy_proxy
+from wait_budget import WaitBudgetModel
+
 LOGIN_URL = "https://www.enrollware.com/admin/login.aspx"
 TARGET_URL_FRAGMENT = "class-list.aspx"
+# 单次登录的总时限（秒），可通过 LOGIN_DEADLINE 环境变量调整
+DEFAULT_LOGIN_DEADLINE_S = 180.0
+# 隧道不健康时等待恢复的时间（秒），可通过 TUNNEL_WAIT 环境变量调整
+DEFAULT_TUNNEL_WAIT_S = 30.0
 
 
 def setup_logging(log_file: str = "login_humanlike.log") -> None:
@@ -119,7 +145,262 @@ def start_xvfb(display_num: str = ":99") -> Optional[subprocess.Popen]:
         return None
 
 
-def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_data_dir: Optional[str] = None, proxy_server: Optional[str] = None) -> uc.Chrome:
+# 资源拦截策略：登录不需要的图片、字体和统计脚本不再经过慢速的住宅代理隧道
+# Cloudflare 验证相关资源始终放行
+RESOURCE_ALLOW_PATTERNS = (
+    "*://challenges.cloudflare.com/*",
+    "*://*.cloudflare.com/*",
+    "*/cdn-cgi/challenge-platform/*",
+    "*turnstile*",
+)
+RESOURCE_BLOCK_EXTENSIONS = (
+    "png", "jpg", "jpeg", "gif", "webp", "svg", "ico",
+    "woff", "woff2", "ttf", "otf", "eot",
+    "mp4", "webm", "mp3",
+)
+RESOURCE_BLOCK_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "fonts.googleapis.com",
+    "fonts.gstatic.com",
+    "static.cloudflareinsights.com",
+)
+# 已观测到的资源大小缓存（用于估算拦截节省的流量），按最近使用保留最多 RESOURCE_SIZES_MAX 个 URL
+RESOURCE_STATS_FILE = "resource_policy_stats.json"
+RESOURCE_SIZES_MAX = 5000
+# URLPattern 构造字符串中有特殊含义、需要转义的字符（? 保留为查询串分隔符）
+_URL_PATTERN_SPECIAL = "\\+(){}:"
+
+
+def _escape_url_pattern(text: str) -> str:
+    return "".join("\\" + c if c in _URL_PATTERN_SPECIAL else c for c in text)
+
+
+def glob_to_url_pattern(pattern: str) -> str:
+    """
+    把 * 通配的 URL 模式转换为 CDP urlPatterns 使用的 URLPattern 构造字符串。
+
+    带协议的模式（*://host/path）补上任意端口；不带协议的模式（*.png、*/cdn-cgi/*）匹配任意协议、主机和端口下的路径。
+    """
+    if "://" in pattern:
+        scheme, rest = pattern.split("://", 1)
+        host, _, path = rest.partition("/")
+        hostname, _, port = host.partition(":")
+        return f"{scheme}://{_escape_url_pattern(hostname)}:{_escape_url_pattern(port or '*')}/{_escape_url_pattern(path)}"
+    path = pattern.lstrip("*/")
+    prefix = "/*" if pattern.startswith("*") else "/"
+    return f"*://*:*{prefix}{_escape_url_pattern(path)}"
+
+
+@dataclass
+class ResourcePolicy:
+    """通过 CDP Network.setBlockedURLs 应用的资源拦截策略。"""
+
+    name: str
+    block_extensions: Tuple[str, ...] = ()
+    block_domains: Tuple[str, ...] = ()
+    extra_block_patterns: Tuple[str, ...] = ()
+    allow_patterns: Tuple[str, ...] = RESOURCE_ALLOW_PATTERNS
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.block_extensions or self.block_domains or self.extra_block_patterns)
+
+    def domain_block_patterns(self) -> List[str]:
+        patterns = [f"*://{domain}/*" for domain in self.block_domains]
+        patterns += [f"*://*.{domain}/*" for domain in self.block_domains]
+        return patterns + list(self.extra_block_patterns)
+
+    def block_patterns(self) -> List[str]:
+        patterns = [f"*.{ext}" for ext in self.block_extensions]
+        patterns += [f"*.{ext}?*" for ext in self.block_extensions]
+        return patterns + self.domain_block_patterns()
+
+    def is_allowed(self, url: str) -> bool:
+        """URL 是否命中放行列表（fnmatch 与 CDP 的 * 通配语义一致）。"""
+        return any(fnmatch.fnmatchcase(url, pattern) for pattern in self.allow_patterns)
+
+    @classmethod
+    def from_env(cls) -> "ResourcePolicy":
+        """
+        读取 RESOURCE_POLICY（lean / off，默认 lean）、RESOURCE_BLOCK_EXTRA（额外拦截模式，逗号分隔）
+        和 RESOURCE_ALLOW_EXTRA（额外放行模式，逗号分隔）。
+        """
+        name = os.getenv("RESOURCE_POLICY", "lean").strip().lower() or "lean"
+        extra_block = tuple(p.strip() for p in os.getenv("RESOURCE_BLOCK_EXTRA", "").split(",") if p.strip())
+        extra_allow = tuple(p.strip() for p in os.getenv("RESOURCE_ALLOW_EXTRA", "").split(",") if p.strip())
+        if name == "off":
+            return cls(name="off")
+        if name != "lean":
+            logging.warning(f"未知的 RESOURCE_POLICY={name}，使用 lean")
+            name = "lean"
+        return cls(
+            name=name,
+            block_extensions=RESOURCE_BLOCK_EXTENSIONS,
+            block_domains=RESOURCE_BLOCK_DOMAINS,
+            extra_block_patterns=extra_block,
+            allow_patterns=RESOURCE_ALLOW_PATTERNS + extra_allow,
+        )
+
+
+def apply_resource_policy(driver: uc.Chrome, policy: Optional[ResourcePolicy]) -> None:
+    """通过 CDP 启用资源拦截。放行列表优先于拦截列表。"""
+    if policy is None or not policy.enabled:
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        url_patterns = [{"urlPattern": glob_to_url_pattern(p), "block": False} for p in policy.allow_patterns]
+        url_patterns += [{"urlPattern": glob_to_url_pattern(p), "block": True} for p in policy.block_patterns()]
+        try:
+            # 新版 Chrome 支持带放行规则的 urlPatterns（URLPattern 语法，第一个匹配的规则生效）
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urlPatterns": url_patterns})
+        except Exception:
+            # 旧版只支持纯拦截列表，无法表达放行规则：
+            # 按扩展名拦截会误伤 Cloudflare 验证资源，只保留按域名拦截
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": policy.domain_block_patterns()})
+        logging.info(f"已应用资源拦截策略: {policy.name}（{len(policy.block_patterns())} 条拦截规则）")
+    except Exception as e:
+        logging.warning(f"应用资源拦截策略失败（不影响使用）: {e}")
+
+
+def collect_resource_report(driver: uc.Chrome, policy: Optional[ResourcePolicy]) -> Optional[Dict[str, object]]:
+    """
+    统计本次登录的网络流量，并估算资源拦截节省的字节数和时间。
+
+    启用拦截时从 performance 日志统计（只有它记录被拦截的请求）；
+    未启用时（RESOURCE_POLICY=off）从页面的 Resource Timing 记录资源大小，不开启 performance 日志。
+    节省的字节数按放行时观测到的同一 URL 的大小估算（缓存在 RESOURCE_STATS_FILE）；
+    节省的时间按 RESOURCE_POLICY=off 时记录的页面加载耗时基线估算。
+    """
+    policy_enabled = policy is not None and policy.enabled
+    urls: Dict[str, str] = {}
+    sizes: Dict[str, int] = {}
+    blocked: List[str] = []
+    if policy_enabled:
+        try:
+            entries = driver.get_log("performance")
+        except Exception as e:
+            logging.debug(f"读取 performance 日志失败: {e}")
+            return None
+    else:
+        entries = []
+        try:
+            resources = driver.execute_script(
+                "return performance.getEntriesByType('resource')"
+                ".map(e => [e.name, e.transferSize || e.encodedBodySize || 0]);"
+            ) or []
+        except Exception as e:
+            logging.debug(f"读取 Resource Timing 失败: {e}")
+            resources = []
+        for index, (url, size) in enumerate(resources):
+            url = url.split("?", 1)[0]
+            urls[f"resource-{index}"] = url
+            if size:  # 跨域资源没有 Timing-Allow-Origin 时大小为 0
+                sizes[url] = int(size)
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method, params = message.get("method"), message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            urls[params["requestId"]] = params["request"]["url"].split("?", 1)[0]
+        elif method == "Network.loadingFinished" and params.get("requestId") in urls:
+            sizes[urls[params["requestId"]]] = int(params.get("encodedDataLength", 0))
+        elif method == "Network.loadingFailed" and params.get("blockedReason") == "inspector":
+            if params.get("requestId") in urls:
+                blocked.append(urls[params["requestId"]])
+
+    try:
+        load_ms = driver.execute_script(
+            "const n = performance.getEntriesByType('navigation')[0];"
+            "return n ? n.loadEventEnd - n.startTime : null;"
+        )
+    except Exception:
+        load_ms = None
+
+    try:
+        with open(RESOURCE_STATS_FILE, encoding="utf-8") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {"sizes": {}, "baseline_load_ms": None}
+
+    # 更新已观测资源大小（最近观测或用到的排在最后，超出上限时丢弃最久未用的），
+    # 以及无拦截时的加载耗时基线（指数移动平均）
+    known_sizes: Dict[str, int] = stats["sizes"]
+    bytes_saved = 0
+    for url in blocked:
+        if url in known_sizes:
+            bytes_saved += known_sizes[url]
+            known_sizes[url] = known_sizes.pop(url)
+    for url, size in sizes.items():
+        known_sizes.pop(url, None)
+        known_sizes[url] = size
+    for url in list(known_sizes)[: max(len(known_sizes) - RESOURCE_SIZES_MAX, 0)]:
+        del known_sizes[url]
+    if not policy_enabled and load_ms:
+        baseline = stats.get("baseline_load_ms")
+        stats["baseline_load_ms"] = load_ms if baseline is None else 0.8 * baseline + 0.2 * load_ms
+    try:
+        with open(RESOURCE_STATS_FILE, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+    except OSError as e:
+        logging.debug(f"写入资源统计失败: {e}")
+
+    baseline = stats.get("baseline_load_ms")
+    report: Dict[str, object] = {
+        "policy": policy.name if policy else "off",
+        "requests": len(urls),
+        "bytes_transferred": sum(sizes.values()),
+        "blocked_requests": len(blocked),
+        "bytes_saved_est": bytes_saved,
+        "load_ms": round(load_ms) if load_ms else None,
+        "time_saved_ms_est": round(baseline - load_ms) if (policy_enabled and baseline and load_ms) else None,
+    }
+    leaked = [url for url in blocked if policy is not None and policy.is_allowed(url)]
+    if leaked:
+        logging.warning(f"放行列表中的资源被拦截: {leaked[:5]}")
+    logging.info(
+        "资源拦截统计: 策略=%s，请求 %d 个，传输 %d 字节，拦截 %d 个（估计节省 %d 字节，%s ms）",
+        report["policy"], report["requests"], report["bytes_transferred"], report["blocked_requests"],
+        report["bytes_saved_est"], report["time_saved_ms_est"] if report["time_saved_ms_est"] is not None else "未知",
+    )
+    return report
+
+
+# 低内存启动参数（CHROME_LAUNCH_PROFILE=lean）：限制渲染进程数量，关闭后台联网、组件更新等后台服务，缩小缓存
+LEAN_PROFILE_ARGS = (
+    "--renderer-process-limit=2",
+    "--process-per-site",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-breakpad",
+    "--disable-client-side-phishing-detection",
+    "--disable-domain-reliability",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--mute-audio",
+    "--disk-cache-size=33554432",
+    "--media-cache-size=1048576",
+    "--js-flags=--max-old-space-size=512",
+)
+LEAN_DISABLED_FEATURES = (
+    "Translate",
+    "OptimizationHints",
+    "MediaRouter",
+    "AutofillServerCommunication",
+    "BackForwardCache",
+)
+CHROME_LAUNCH_PROFILES = ("default", "lean")
+
+
+def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_data_dir: Optional[str] = None, proxy_server: Optional[str] = None, resource_policy: Optional[ResourcePolicy] = None, launch_profile: str = "default") -> uc.Chrome:
     """
     使用 undetected-chromedriver 创建 Chrome WebDriver。
     
@@ -130,12 +411,19 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
         use_xvfb: 是否使用 Xvfb 虚拟显示（仅 Linux，推荐用于 headless 模式）
         user_data_dir: Chrome profile 数据目录路径（如果提供，将使用该目录保存 cookies、缓存等）
         proxy_server: 代理服务器地址（格式：http://host:port 或 socks5://host:port，用于绕过 AWS IP 检测）
+        resource_policy: 资源拦截策略（拦截图片、字体和统计脚本，放行 Cloudflare 验证资源）
+        launch_profile: 启动参数配置，default 或 lean（低内存）
 
     Returns:
         uc.Chrome: undetected-chromedriver 实例
     """
-    logging.info("正在创建 Chrome WebDriver（使用 undetected-chromedriver，headless=%s，use_xvfb=%s，user_data_dir=%s，proxy=%s）...", 
-                 headless, use_xvfb, user_data_dir if user_data_dir else "默认临时目录", proxy_server if proxy_server else "无")
+    logging.info("正在创建 Chrome WebDriver（使用 undetected-chromedriver，headless=%s，use_xvfb=%s，user_data_dir=%s，proxy=%s，launch_profile=%s）...", 
+                 headless, use_xvfb, user_data_dir if user_data_dir else "默认临时目录", proxy_server if proxy_server else "无", launch_profile)
+    
+    # --disable-features 只能出现一次（重复时只有最后一个生效），统一收集后再添加
+    disabled_features = ["IsolateOrigins", "site-per-process"]
+    temp_profile_dir = None
+    guard: Optional[LaunchGuard] = None
     
     try:
         # 配置 Chrome 选项
@@ -148,16 +436,18 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
             options.user_data_dir = user_data_dir
             logging.info(f"使用 Chrome profile 目录: {user_data_dir}")
             logging.info("这将保存 cookies、缓存和浏览器指纹信息，有助于绕过 Cloudflare 检测")
+        else:
+            # 临时 profile 目录由这里创建（而不是 uc.Chrome 内部），启动前就能登记，启动失败也能清理
+            temp_profile_dir = tempfile.mkdtemp(prefix="enrollware_chrome_")
+            options.user_data_dir = temp_profile_dir
+        guard = LaunchGuard([temp_profile_dir] if temp_profile_dir else [])
         
         if headless and not use_xvfb:
             # 使用新的 headless 模式，并添加更多反检测参数
             options.add_argument("--headless=new")
             # 移除 headless 标识的关键参数
             options.add_argument("--disable-blink-features=AutomationControlled")
-            # 添加更多反检测参数
-            options.add_argument("--disable-features=IsolateOrigins,site-per-process,VizDisplayCompositor")
             # 模拟真实浏览器的窗口大小和行为
-            options.add_argument("--window-size=1920,1080")
             options.add_argument("--start-maximized")
             # 禁用一些可能暴露自动化的特征
             options.add_argument("--disable-extensions")
@@ -172,8 +462,6 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-gpu")
         options.add_argument("--window-size=1920,1080")
-        # 禁用 CSP 相关警告
-        options.add_argument("--disable-features=IsolateOrigins,site-per-process")
         # 允许不安全内容（某些 Cloudflare 资源可能需要）
         options.add_argument("--allow-running-insecure-content")
         
@@ -185,16 +473,40 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
         options.add_argument("--disable-webrtc-hw-vp8-encoding")
         options.add_argument("--disable-webrtc-ip-handling-policy")
         
+        if launch_profile == "lean":
+            for arg in LEAN_PROFILE_ARGS:
+                if arg not in options.arguments:
+                    options.add_argument(arg)
+            disabled_features.extend(LEAN_DISABLED_FEATURES)
+            logging.info("使用低内存启动参数（lean）")
+        
+        # 禁用 CSP 相关警告（站点隔离关闭后渲染进程也更少）
+        options.add_argument(f"--disable-features={','.join(disabled_features)}")
+        
         # 设置 User-Agent（移除 HeadlessChrome 标识）
         # undetected-chromedriver 会自动处理，但我们可以确保它正确
         options.add_argument("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36")
         
         # 配置代理服务器（用于绕过 AWS IP 检测）
-        if proxy_server:
+        # PROXY_PAC_URL（local_proxy.py --pac-address 提供）：只有需要住宅 IP 的域名经过代理。
+        # PAC 由 PROXY_SERVER 对应的代理提供；隧道检查改用了其他代理（原代理不可用）时不使用 PAC
+        pac_url = os.getenv("PROXY_PAC_URL", "").strip()
+        configured_proxy = os.getenv("PROXY_SERVER", "").strip() or None
+        if pac_url and proxy_server and not same_proxy(proxy_server, configured_proxy):
+            logging.warning(f"代理已切换为 {proxy_server}，不使用 PAC {pac_url}（PAC 由 {configured_proxy} 提供）")
+            pac_url = ""
+        if pac_url:
+            logging.info(f"使用 PAC 分流: {pac_url}（不使用 --proxy-server）")
+            options.add_argument(f"--proxy-pac-url={pac_url}")
+        elif proxy_server:
             logging.info(f"配置代理服务器: {proxy_server}")
             options.add_argument(f"--proxy-server={proxy_server}")
             logging.info("代理服务器已配置，将使用代理访问网站以绕过 AWS IP 检测")
         
+        # 启用资源拦截时开启 performance 日志，用于统计被拦截的请求和节省的流量
+        if resource_policy is not None and resource_policy.enabled:
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        
         # 使用 undetected-chromedriver 创建驱动
         # version_main=144 指定 Chrome 144 版本
         driver = uc.Chrome(
@@ -203,6 +515,9 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
             headless=headless and not use_xvfb,  # 如果使用 Xvfb，不使用 headless 模式
             use_subprocess=True,  # 使用子进程模式，更稳定
         )
+        guard.register_children()
+        if temp_profile_dir:
+            driver.keep_user_data_dir = False  # driver.quit() 时删除临时 profile 目录
         
         # 如果使用 Xvfb，DISPLAY 环境变量已在 start_xvfb 中设置
         if use_xvfb:
@@ -346,84 +661,275 @@ def create_chrome_driver(headless: bool = False, use_xvfb: bool = False, user_da
         except Exception as e:
             logging.warning(f"注入 CDP 脚本失败（不影响使用）: {e}")
         
+        apply_resource_policy(driver, resource_policy)
+        
+        guard.release()
         logging.info("Chrome WebDriver 已启动（undetected-chromedriver，Chrome 144）。")
         return driver
     except Exception as e:
         logging.exception("创建 Chrome WebDriver 失败。")
         # 如果指定版本失败，尝试自动检测版本
         logging.info("尝试自动检测 Chrome 版本...")
+        if guard is not None:
+            guard.kill_processes()  # 结束第一次启动留下的 chrome / chromedriver
         try:
             driver = uc.Chrome(
                 options=options,
                 headless=headless,
                 use_subprocess=True,
             )
+            if guard is not None:
+                guard.register_children()
+            if temp_profile_dir:
+                driver.keep_user_data_dir = False
             if not headless:
                 driver.maximize_window()
+            apply_resource_policy(driver, resource_policy)
+            if guard is not None:
+                guard.release()
             logging.info("Chrome WebDriver 已启动（自动检测版本）。")
             return driver
         except Exception as e2:
             logging.exception("自动检测版本也失败。")
+            if guard is not None:
+                guard.reap()
             raise e
 
 
-def human_like_delay(min_ms: float = 50, max_ms: float = 300) -> None:
-    """模拟人类操作的随机延迟（毫秒）。"""
+class DeadlineExceeded(TimeoutException):
+    """单次登录超出总时限。"""
+
+
+def parse_deadline_s(value) -> float:
+    """把总时限（秒）转换为 float；不是有限的正数（nan、inf、0、负数）时抛出 ValueError。"""
+    try:
+        seconds = float(value)
+    except TypeError:
+        seconds = math.nan
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise ValueError(f"登录时限必须是有限的正数: {value!r}")
+    return seconds
+
+
+def job_deadline_s(job: Dict[str, object], default: float) -> float:
+    """任务参数中的 deadline_s（缺省为 default），无效时抛出 ValueError。"""
+    value = job.get("deadline_s")
+    return default if value is None else parse_deadline_s(value)
+
+
+class Deadline:
+    """
+    单次登录的总时限。
+
+    每次登录创建一个，传入流程中的所有等待、停顿和脚本调用，
+    各步骤只能使用剩余时间，超时不再逐级叠加。
+    """
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def clamp(self, seconds: float) -> float:
+        """把一次等待限制在剩余时间内。"""
+        return min(seconds, self.remaining())
+
+    def check(self, what: str) -> None:
+        """时限已到则抛出 DeadlineExceeded。"""
+        if self.expired:
+            raise DeadlineExceeded(f"超出单次登录时限 {self.budget_s:.0f}s（{what}）")
+
+
+def human_like_delay(min_ms: float = 50, max_ms: float = 300, deadline: Optional[Deadline] = None) -> None:
+    """模拟人类操作的随机延迟（毫秒）。指定 deadline 时不会睡过时限。"""
     delay = random.uniform(min_ms / 1000, max_ms / 1000)
+    if deadline is not None:
+        delay = deadline.clamp(delay)
     time.sleep(delay)
 
 
-def move_mouse_humanlike(actions: ActionChains, element, offset_x: int = 0, offset_y: int = 0) -> None:
+# 浏览器会话最后一次鼠标位置（视口坐标）保存在 driver 的这个属性上，用作下一段轨迹的起点；
+# 随 driver 一起释放，服务模式反复重建浏览器时不会累积
+POINTER_POSITION_ATTR = "_humanlike_pointer_position"
+
+# Fitts 定律参数：T = a + b * log2(D / W + 1)（秒）
+FITTS_A = 0.1
+FITTS_B = 0.15
+# 轨迹采样间隔（毫秒），约等于 60Hz 的指针事件频率
+TRAJECTORY_STEP_MS = 16
+
+
+def generate_mouse_trajectory(
+    start: Tuple[float, float],
+    end: Tuple[float, float],
+    target_width: float,
+    bounds: Tuple[float, float],
+) -> List[Tuple[int, int, int]]:
+    """
+    生成从 start 到 end 的人类化鼠标轨迹。
+
+    路径为随机控制点的三次 Bezier 曲线，总时长由 Fitts 定律决定，
+    沿路径的进度使用最小加加速度（minimum-jerk）速度曲线：起步慢、中段快、末端减速。
+    所有采样点在一次批量计算中得出，不涉及任何浏览器往返。
+
+    Args:
+        start: 起点（视口坐标）
+        end: 终点（视口坐标）
+        target_width: 目标元素宽度（像素），用于 Fitts 定律
+        bounds: 视口宽高，采样点会被限制在视口内
+
+    Returns:
+        [(x, y, 本段移动耗时毫秒), ...]
+    """
+    (x0, y0), (x3, y3) = start, end
+    dx, dy = x3 - x0, y3 - y0
+    distance = math.hypot(dx, dy)
+    if distance < 1:
+        return [(int(round(x3)), int(round(y3)), TRAJECTORY_STEP_MS)]
+
+    # 控制点沿路径法线方向随机偏移，形成自然的弧线
+    nx, ny = -dy / distance, dx / distance
+    bend = random.uniform(-0.25, 0.25) * distance
+    x1 = x0 + dx * random.uniform(0.2, 0.4) + nx * bend
+    y1 = y0 + dy * random.uniform(0.2, 0.4) + ny * bend
+    x2 = x0 + dx * random.uniform(0.6, 0.8) + nx * bend * random.uniform(0.3, 0.8)
+    y2 = y0 + dy * random.uniform(0.6, 0.8) + ny * bend * random.uniform(0.3, 0.8)
+
+    duration = FITTS_A + FITTS_B * math.log2(distance / max(target_width, 1) + 1)
+    duration *= random.uniform(0.85, 1.15)
+    steps = max(int(duration * 1000 / TRAJECTORY_STEP_MS), 5)
+
+    # 最小加加速度进度曲线 s(t) = 10t^3 - 15t^4 + 6t^5，再代入 Bezier 基函数
+    progress = [(i / steps) for i in range(1, steps + 1)]
+    progress = [10 * t ** 3 - 15 * t ** 4 + 6 * t ** 5 for t in progress]
+    basis = [((1 - s) ** 3, 3 * (1 - s) ** 2 * s, 3 * (1 - s) * s ** 2, s ** 3) for s in progress]
+
+    max_x, max_y = bounds[0] - 1, bounds[1] - 1
+    return [
+        (
+            int(round(min(max(b0 * x0 + b1 * x1 + b2 * x2 + b3 * x3, 0), max_x))),
+            int(round(min(max(b0 * y0 + b1 * y1 + b2 * y2 + b3 * y3, 0), max_y))),
+            TRAJECTORY_STEP_MS,
+        )
+        for b0, b1, b2, b3 in basis
+    ]
+
+
+def move_mouse_humanlike(
+    actions: ActionChains, element, offset_x: int = 0, offset_y: int = 0, deadline: Optional[Deadline] = None
+) -> None:
     """
     模拟人类鼠标移动到元素位置，带随机轨迹。
 
+    整条轨迹作为指针 action 追加到 actions 中，由调用方的 perform() 一次性下发。
+
     Args:
         actions: ActionChains 实例
         element: 目标元素
         offset_x: X 轴偏移（相对于元素中心）
         offset_y: Y 轴偏移（相对于元素中心）
+        deadline: 单次登录总时限（可选）
     """
-    # 使用更安全的方法：直接移动到元素，添加小幅随机偏移模拟人类不精确的移动
-    # 先移动到元素附近，再精确移动到目标位置
-    random_offset_x = random.randint(-5, 5)
-    random_offset_y = random.randint(-5, 5)
-    
-    # 第一步：移动到元素附近（带小偏移）
-    actions.move_to_element_with_offset(
-        element, 
-        offset_x + random_offset_x, 
-        offset_y + random_offset_y
+    driver = element.parent
+    if deadline is not None:
+        deadline.check("鼠标移动")
+    # 一次脚本调用取得元素位置和视口大小
+    left, top, width, height, view_w, view_h = driver.execute_script(
+        "const r = arguments[0].getBoundingClientRect();"
+        "return [r.left, r.top, r.width, r.height, window.innerWidth, window.innerHeight];",
+        element,
     )
-    human_like_delay(50, 150)
-    
-    # 第二步：精确移动到目标位置
-    actions.move_to_element_with_offset(element, offset_x, offset_y)
-    human_like_delay(30, 100)
+
+    # 人类点击不会正好落在中心：在元素内部加入小幅随机偏移
+    jitter_x = random.uniform(-0.2, 0.2) * width
+    jitter_y = random.uniform(-0.2, 0.2) * height
+    end = (left + width / 2 + offset_x + jitter_x, top + height / 2 + offset_y + jitter_y)
+
+    start = getattr(driver, POINTER_POSITION_ATTR, None)
+    if start is None:
+        # 首次移动：从视口内随机位置出发
+        start = (random.uniform(0, view_w), random.uniform(0, view_h))
+
+    trajectory = generate_mouse_trajectory(start, end, width, (view_w, view_h))
+    pointer = actions.w3c_actions.pointer_action
+    for x, y, duration_ms in trajectory:
+        pointer.source.create_pointer_move(duration=duration_ms, x=x, y=y)
+        # 键盘设备补一个空 pause，保持各输入源 tick 对齐
+        actions.w3c_actions.key_action.pause(0)
+    # 到达后稍作停顿再点击
+    actions.pause(random.uniform(0.05, 0.15))
+
+    setattr(driver, POINTER_POSITION_ATTR, (trajectory[-1][0], trajectory[-1][1]))
+
+
+def adaptive_wait(
+    driver: uc.Chrome,
+    waits: WaitBudgetModel,
+    phase: str,
+    condition,
+    required: bool = True,
+    deadline: Optional[Deadline] = None,
+):
+    """
+    按阶段 phase 的自适应预算等待 condition 成立，并把实际就绪耗时记入模型。
+    超时（包括超时属于正常分支的阶段）也记为删失观测，否则样本只剩预算内完成的等待，预算只会收缩不会放宽。
+
+    Args:
+        condition: WebDriverWait.until 接受的条件
+        required: 超时是否抛出 TimeoutException（False 时返回 None）
+        deadline: 单次登录总时限；预算会被截断到剩余时间，时限已到时无论 required 都抛出 DeadlineExceeded
+    """
+    budget = waits.budget(phase)
+    truncated = False
+    if deadline is not None:
+        deadline.check(phase)
+        truncated = deadline.remaining() < budget
+        budget = deadline.clamp(budget)
+    started = time.monotonic()
+    try:
+        result = WebDriverWait(driver, budget, poll_frequency=0.25).until(condition)
+    except TimeoutException:
+        # 被总时限截断的超时不代表该阶段本身慢，不计入观测
+        if not truncated:
+            waits.observe(phase, time.monotonic() - started, timed_out=True)
+        logging.info(f"等待 {phase} 超时（预算 {budget:.1f}s）")
+        if deadline is not None:
+            deadline.check(phase)
+        if required:
+            raise
+        return None
+    latency = time.monotonic() - started
+    waits.observe(phase, latency)
+    logging.info(f"{phase} 就绪耗时 {latency:.1f}s（预算 {budget:.1f}s）")
+    return result
 
 
-def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout: int = 15) -> bool:
+def handle_cloudflare_challenge(
+    driver: uc.Chrome, waits: Optional[WaitBudgetModel] = None, deadline: Optional[Deadline] = None
+) -> bool:
     """
     检测并处理 Cloudflare 验证（Turnstile checkbox）。
 
     Args:
         driver: WebDriver 实例
-        wait: WebDriverWait 实例
-        timeout: 等待超时时间（秒）
+        waits: 自适应等待预算（为 None 时使用各阶段默认预算）
+        deadline: 单次登录总时限（可选）
 
     Returns:
         True 如果检测到并处理了 Cloudflare 验证，False 否则
     """
     try:
         logging.info("检测 Cloudflare 验证（等待 iframe 加载）...")
-        
-        # 先等待一段时间，让 Cloudflare iframe 有时间加载
-        human_like_delay(2000, 3000)
+        waits = waits or WaitBudgetModel()
 
         # Cloudflare Turnstile 通常在 iframe 中
-        # 使用 WebDriverWait 等待 iframe 出现
-        cloudflare_iframe = None
-        
-        # 方法1: 等待特定的 iframe 选择器出现
+        # 方法1: 用所有选择器组成的一个组合选择器等待可见的 iframe 出现（只消耗一次等待预算）
         iframe_selectors = [
             "iframe[src*='challenges.cloudflare.com']",
             "iframe[src*='cloudflare.com']",
@@ -436,22 +942,24 @@ def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout:
             "iframe[title*='Verify you are human']",
         ]
 
-        for selector in iframe_selectors:
-            try:
-                iframe = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                if iframe and iframe.is_displayed():
-                    cloudflare_iframe = iframe
-                    logging.info(f"通过 WebDriverWait 找到 Cloudflare iframe: {selector}")
-                    break
-            except Exception:
-                continue
+        iframe_selector = ", ".join(iframe_selectors)
 
-        # 方法2: 如果没找到，尝试查找所有 iframe 并检查 src
+        def visible_cloudflare_iframe(d):
+            for iframe in d.find_elements(By.CSS_SELECTOR, iframe_selector):
+                if iframe.is_displayed():
+                    return iframe
+            return False
+
+        cloudflare_iframe = adaptive_wait(
+            driver, waits, "challenge_iframe", visible_cloudflare_iframe, required=False, deadline=deadline
+        )
+        if cloudflare_iframe:
+            logging.info("通过 WebDriverWait 找到 Cloudflare iframe")
+
+        # 方法2: 如果没找到，检查页面上已有的所有 iframe 的 src / title（不再额外等待）
         if not cloudflare_iframe:
             logging.info("尝试通过 src 属性查找所有 iframe...")
             try:
-                # 等待至少一个 iframe 出现
-                wait.until(EC.presence_of_element_located((By.TAG_NAME, "iframe")))
                 all_iframes = driver.find_elements(By.TAG_NAME, "iframe")
                 logging.info(f"页面上找到 {len(all_iframes)} 个 iframe")
                 
@@ -480,8 +988,6 @@ def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout:
 
         if not cloudflare_iframe:
             logging.warning("未检测到 Cloudflare iframe，可能不需要验证或 iframe 尚未加载。")
-            # 再等待一下，可能 iframe 加载较慢
-            human_like_delay(2000, 3000)
             # 最后尝试一次快速查找
             try:
                 all_iframes = driver.find_elements(By.TAG_NAME, "iframe")
@@ -502,161 +1008,127 @@ def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout:
         
         logging.info("切换到 Cloudflare iframe...")
         driver.switch_to.frame(cloudflare_iframe)
-        human_like_delay(2000, 3000)  # 等待 iframe 内容加载
+        human_like_delay(2000, 3000, deadline)  # 等待 iframe 内容加载
 
         # Cloudflare Turnstile checkbox 在 iframe 内的第二个 shadow-root 中
         # 结构: iframe -> body -> shadow-root (第二个) -> div.main-wrapper -> label.cb-lb -> input[type="checkbox"]
         logging.info("检测到 checkbox 在 iframe 内的 shadow-root 中，使用 JavaScript 访问...")
         
         try:
-            # JavaScript 代码来访问第二个 shadow DOM 并点击 checkbox
+            # 一次异步脚本完成：定位 shadow host -> checkbox / label 两种策略 -> 返回耗时数据
+            # 等待使用 requestAnimationFrame + setTimeout，不再忙等阻塞 iframe 主线程
             click_script = """
-            // 获取 iframe 的 body 元素
-            const body = document.body;
-            if (!body) {
-                return {success: false, error: 'Body not found in iframe'};
-            }
-            
-            // 查找包含 shadow root 的元素（第二个 shadow root）
-            let shadowHost = null;
-            let shadowRoot = null;
-            
-            // 尝试查找 shadow host（通常是 body 的直接子元素）
-            const children = body.children;
-            for (let i = 0; i < children.length; i++) {
-                const child = children[i];
-                if (child.shadowRoot) {
-                    shadowHost = child;
-                    shadowRoot = child.shadowRoot;
-                    break;
-                }
-            }
-            
-            // 如果没找到，尝试查找所有可能的 shadow host
-            if (!shadowRoot) {
-                const allElements = body.querySelectorAll('*');
-                for (let elem of allElements) {
-                    if (elem.shadowRoot) {
-                        shadowHost = elem;
-                        shadowRoot = elem.shadowRoot;
-                        break;
+            const done = arguments[arguments.length - 1];
+            const t0 = performance.now();
+            const timing = {};
+            const sleep = (ms) => new Promise(resolve => {
+                requestAnimationFrame(() => setTimeout(resolve, ms));
+            });
+
+            // 定向查找 shadow host：先看 body 的直接子元素（Turnstile 的常见结构），
+            // 找不到再用 TreeWalker 逐个检查，命中即停止，不构造全量 NodeList
+            const findShadowRoot = (root) => {
+                for (const child of root.children) {
+                    if (child.shadowRoot) {
+                        return child;
                     }
                 }
-            }
-            
-            if (!shadowRoot) {
-                return {success: false, error: 'Second shadow root not found in iframe'};
-            }
-            
-            // 在第二个 shadow root 中查找 checkbox
-            // 路径: div.main-wrapper -> div#content -> div -> div.cb-c -> label.cb-lb -> input[type="checkbox"]
-            let checkbox = shadowRoot.querySelector('input[type="checkbox"]');
-            
-            // 如果直接找不到，尝试通过 label 查找
-            if (!checkbox) {
+                const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT, {
+                    acceptNode: (node) => node.shadowRoot ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_SKIP
+                });
+                return walker.nextNode();
+            };
+
+            (async () => {
+                const body = document.body;
+                if (!body) {
+                    return {success: false, error: 'Body not found in iframe'};
+                }
+
+                const shadowHost = findShadowRoot(body);
+                timing.locateMs = performance.now() - t0;
+                if (!shadowHost) {
+                    return {success: false, error: 'Second shadow root not found in iframe', timing};
+                }
+                const shadowRoot = shadowHost.shadowRoot;
+
+                // 在第二个 shadow root 中查找 checkbox 和 label
+                // 路径: div.main-wrapper -> div#content -> div -> div.cb-c -> label.cb-lb -> input[type="checkbox"]
                 const label = shadowRoot.querySelector('label.cb-lb');
-                if (label) {
-                    checkbox = label.querySelector('input[type="checkbox"]');
+                const checkbox = shadowRoot.querySelector('input[type="checkbox"]')
+                    || (label && label.querySelector('input[type="checkbox"]'));
+
+                const isVisible = (el) => {
+                    const style = window.getComputedStyle(el);
+                    return style.display !== 'none' && style.visibility !== 'hidden';
+                };
+
+                // 策略顺序：checkbox 优先，失败时同一轮内改用 label
+                const candidates = [];
+                if (checkbox && isVisible(checkbox)) {
+                    candidates.push(['checkbox click', checkbox]);
                 }
-            }
-            
-            if (!checkbox) {
-                return {success: false, error: 'Checkbox not found in second shadow root'};
-            }
-            
-            // 检查 checkbox 是否可见
-            const style = window.getComputedStyle(checkbox);
-            if (style.display === 'none' || style.visibility === 'hidden') {
-                return {success: false, error: 'Checkbox is hidden'};
-            }
-            
-            // 滚动到 checkbox 位置
-            checkbox.scrollIntoView({behavior: 'smooth', block: 'center'});
-            
-            // 等待一下让滚动完成
-            const startTime = Date.now();
-            while (Date.now() - startTime < 500) {
-                // 等待 500ms
-            }
-            
-            // 点击 checkbox
-            checkbox.click();
-            
-            // 等待一下让点击生效
-            const startTime2 = Date.now();
-            while (Date.now() - startTime2 < 500) {
-                // 等待 500ms
-            }
-            
-            // 检查是否被选中
-            const isChecked = checkbox.checked;
-            
-            return {
-                success: true,
-                checked: isChecked,
-                shadowHostTag: shadowHost ? shadowHost.tagName : 'unknown',
-                checkboxFound: true
-            };
+                if (label && isVisible(label)) {
+                    candidates.push(['label click', label]);
+                }
+                if (candidates.length === 0) {
+                    return {
+                        success: false,
+                        error: checkbox ? 'Checkbox is hidden' : 'Checkbox not found in second shadow root',
+                        timing
+                    };
+                }
+
+                for (const [method, target] of candidates) {
+                    const tStrategy = performance.now();
+                    target.scrollIntoView({behavior: 'smooth', block: 'center'});
+                    // 等待滚动完成
+                    await sleep(500);
+                    target.click();
+                    // 等待点击生效
+                    await sleep(500);
+                    const isChecked = checkbox ? checkbox.checked : null;
+                    timing[method] = performance.now() - tStrategy;
+                    if (isChecked !== false) {
+                        timing.totalMs = performance.now() - t0;
+                        return {
+                            success: true,
+                            method: method,
+                            checked: isChecked,
+                            shadowHostTag: shadowHost.tagName,
+                            timing
+                        };
+                    }
+                }
+
+                // 点击已下发但 checkbox 仍未选中（Turnstile 可能已切换为验证动画），交由后续 URL 检查判断
+                timing.totalMs = performance.now() - t0;
+                return {
+                    success: true,
+                    method: candidates.map(c => c[0]).join(' + '),
+                    checked: false,
+                    shadowHostTag: shadowHost.tagName,
+                    timing
+                };
+            })().then(done, (err) => done({success: false, error: String(err), timing}));
             """
             
-            logging.info("执行 JavaScript 访问第二个 shadow DOM 并点击 checkbox...")
-            result = driver.execute_script(click_script)
+            logging.info("执行异步 JavaScript 访问第二个 shadow DOM 并点击 checkbox...")
+            if deadline is not None:
+                deadline.check("Turnstile 点击")
+                driver.set_script_timeout(max(deadline.remaining(), 1))
+            result = driver.execute_async_script(click_script)
+            timing = result.get('timing') if result else None
+            if timing:
+                logging.info(f"Turnstile 点击脚本耗时: {timing}")
             
             if result and result.get('success'):
-                logging.info(f"成功点击 Cloudflare checkbox！Checkbox 状态: checked={result.get('checked')}")
-                human_like_delay(3000, 5000)  # 等待验证完成
+                logging.info(f"成功点击 Cloudflare checkbox（{result.get('method')}）！Checkbox 状态: checked={result.get('checked')}")
             else:
                 error_msg = result.get('error', 'Unknown error') if result else 'No result'
-                logging.warning(f"JavaScript 点击失败: {error_msg}")
-                
-                # 尝试备用方法：通过 label 点击
-                logging.info("尝试备用方法：通过 label.cb-lb 点击...")
-                try:
-                    label_script = """
-                    const body = document.body;
-                    let shadowRoot = null;
-                    const children = body.children;
-                    for (let i = 0; i < children.length; i++) {
-                        if (children[i].shadowRoot) {
-                            shadowRoot = children[i].shadowRoot;
-                            break;
-                        }
-                    }
-                    if (!shadowRoot) {
-                        const allElements = body.querySelectorAll('*');
-                        for (let elem of allElements) {
-                            if (elem.shadowRoot) {
-                                shadowRoot = elem.shadowRoot;
-                                break;
-                            }
-                        }
-                    }
-                    if (shadowRoot) {
-                        const label = shadowRoot.querySelector('label.cb-lb');
-                        if (label) {
-                            label.scrollIntoView({behavior: 'smooth', block: 'center'});
-                            const startTime = Date.now();
-                            while (Date.now() - startTime < 500) {}
-                            label.click();
-                            const startTime2 = Date.now();
-                            while (Date.now() - startTime2 < 500) {}
-                            return {success: true, method: 'label click'};
-                        }
-                    }
-                    return {success: false, error: 'Label not found'};
-                    """
-                    result2 = driver.execute_script(label_script)
-                    if result2 and result2.get('success'):
-                        logging.info("通过点击 label 成功！")
-                        human_like_delay(3000, 5000)
-                    else:
-                        logging.error("所有方法都失败了")
-                        driver.switch_to.default_content()
-                        return False
-                except Exception as e2:
-                    logging.exception(f"备用方法也失败: {e2}")
-                    driver.switch_to.default_content()
-                    return False
+                logging.error(f"所有方法都失败了: {error_msg}")
+                driver.switch_to.default_content()
+                return False
                     
         except Exception as e:
             logging.exception(f"使用 JavaScript 访问 shadow DOM 时出错: {e}")
@@ -665,13 +1137,17 @@ def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout:
 
         # 切换回主页面
         driver.switch_to.default_content()
+        # 验证完成后的页面跳转由调用方按 post_challenge 预算等待
         logging.info("已切换回主页面，等待 Cloudflare 验证完成...")
 
-        # 等待验证完成（通常会有页面变化或元素消失）
-        human_like_delay(2000, 4000)
-
         return True
 
+    except DeadlineExceeded:
+        try:
+            driver.switch_to.default_content()
+        except Exception:
+            pass
+        raise
     except Exception as e:
         logging.exception("处理 Cloudflare 验证时出现异常。")
         # 确保切换回主页面
@@ -682,126 +1158,332 @@ def handle_cloudflare_challenge(driver: uc.Chrome, wait: WebDriverWait, timeout:
         return False
 
 
-def type_humanlike(element, text: str, min_delay: float = 0.05, max_delay: float = 0.3) -> None:
+def build_keystroke_schedule(
+    text: str, min_delay: float = 0.05, max_delay: float = 0.3, typo_rate: float = 0.05
+) -> List[Tuple[str, float]]:
     """
-    模拟人类逐字符输入，带随机延迟。
+    预先生成整段输入的按键计划（按键 + 按键后的停顿）。
 
     Args:
-        element: 输入框元素
         text: 要输入的文本
         min_delay: 最小延迟（秒）
         max_delay: 最大延迟（秒）
-    """
-    element.clear()
-    human_like_delay(100, 200)  # 清空后稍作停顿
+        typo_rate: 模拟打字错误（退格后重输）的概率
 
+    Returns:
+        [(按键, 停顿秒数), ...]
+    """
+    schedule: List[Tuple[str, float]] = []
     for char in text:
-        element.send_keys(char)
         # 随机延迟，模拟人类打字速度
-        delay = random.uniform(min_delay, max_delay)
-        time.sleep(delay)
+        schedule.append((char, random.uniform(min_delay, max_delay)))
 
         # 偶尔模拟打字错误和修正（小概率）
-        if random.random() < 0.05:  # 5% 概率
-            element.send_keys(Keys.BACKSPACE)
-            human_like_delay(50, 150)
-            element.send_keys(char)
+        if random.random() < typo_rate:
+            schedule.append((Keys.BACKSPACE, random.uniform(0.05, 0.15)))
+            schedule.append((char, random.uniform(min_delay, max_delay)))
+    return schedule
+
+
+def type_humanlike(
+    element, text: str, min_delay: float = 0.05, max_delay: float = 0.3, deadline: Optional[Deadline] = None
+) -> None:
+    """
+    模拟人类逐字符输入，带随机延迟。
+
+    按键计划预先生成，并作为一个 W3C action 序列一次性下发，
+    停顿在浏览器端执行，不再受每个字符一次 HTTP 往返的抖动影响。
+
+    Args:
+        element: 输入框元素
+        text: 要输入的文本
+        min_delay: 最小延迟（秒）
+        max_delay: 最大延迟（秒）
+        deadline: 单次登录总时限（可选）；整段输入计划超过剩余时间时直接报超时
+    """
+    schedule = build_keystroke_schedule(text, min_delay, max_delay)
+    driver = element.parent
+    if deadline is not None:
+        deadline.check("输入")
+        if sum(delay for _, delay in schedule) > deadline.remaining():
+            raise DeadlineExceeded(f"剩余时间不足以完成输入（剩余 {deadline.remaining():.1f}s）")
+
+    # 清空并聚焦输入框（WebDriver 的 clear 会让元素失去焦点，这里用一次脚本调用完成）
+    driver.execute_script(
+        "arguments[0].value = '';"
+        "arguments[0].dispatchEvent(new Event('input', {bubbles: true}));"
+        "arguments[0].focus();",
+        element,
+    )
+
+    actions = ActionChains(driver)
+    actions.pause(random.uniform(0.1, 0.2))  # 清空后稍作停顿
+    for key, delay in schedule:
+        actions.key_down(key).key_up(key)
+        actions.pause(delay)
+
+    try:
+        actions.perform()
+    except Exception as e:
+        # 批量下发失败时退回逐字符输入，按同一份计划执行
+        logging.warning(f"批量按键下发失败，改为逐字符输入: {e}")
+        element.clear()
+        for key, delay in schedule:
+            element.send_keys(key)
+            time.sleep(deadline.clamp(delay) if deadline is not None else delay)
+
+
+# 登录表单定位策略：按顺序尝试，命中的策略会记入 LOCATOR_CACHE，下次优先尝试
+# 每个字段是 CSS 选择器列表；submit_text 用于按按钮文字匹配
+LOGIN_FORM_STRATEGIES: List[Dict[str, object]] = [
+    {
+        "name": "aspnet_ids",
+        "username": ["input[id*='UserName']", "input[name*='UserName']"],
+        "password": ["input[type='password'][id*='Password']", "input[type='password'][name*='Password']"],
+        "submit": ["input[type='submit'][id*='Login']", "input[id*='Login']"],
+        "submit_text": [],
+    },
+    {
+        "name": "name_attrs",
+        "username": ["input[name='username']", "input[type='email']"],
+        "password": ["input[name='password']", "input[type='password']"],
+        "submit": ["button[type='submit']", "input[type='submit']"],
+        "submit_text": ["Sign In", "Login"],
+    },
+    {
+        "name": "generic",
+        "username": ["input[type='text']"],
+        "password": ["input[type='password']"],
+        "submit": ["input[type='submit']", "input[type='button']", "button"],
+        "submit_text": ["Sign In", "Login"],
+    },
+]
+LOCATOR_CACHE_FILE = "locator_cache.json"
+
+# 一次脚本调用按策略顺序查找用户名、密码和 Sign In 三个元素
+# 只对候选选择器做定向 querySelectorAll，不扫描整棵 DOM
+FORM_DISCOVERY_SCRIPT = """
+const strategies = arguments[0];
+const visible = (el) => {
+    if (!el || el.disabled) return false;
+    const r = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return r.width > 0 && r.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+};
+const first = (selectors, textFilter) => {
+    for (const selector of selectors) {
+        for (const el of document.querySelectorAll(selector)) {
+            if (!visible(el)) continue;
+            if (textFilter && textFilter.length) {
+                const label = (el.value || el.textContent || '').trim();
+                if (!textFilter.some(t => label.includes(t))) continue;
+            }
+            return el;
+        }
+    }
+    return null;
+};
+for (const s of strategies) {
+    const username = first(s.username);
+    const password = first(s.password);
+    const submit = first(s.submit, s.submit_text);
+    if (username && password && submit && username !== password) {
+        return {strategy: s.name, username: username, password: password, submit: submit};
+    }
+}
+return null;
+"""
+
+
+def _locator_cache_path() -> str:
+    return os.getenv("LOCATOR_CACHE", LOCATOR_CACHE_FILE)
+
+
+def _ordered_form_strategies(host: str) -> List[Dict[str, object]]:
+    """上次命中的策略排在最前面。"""
+    try:
+        with open(_locator_cache_path(), encoding="utf-8") as f:
+            preferred = json.load(f).get(host)
+    except (OSError, ValueError):
+        preferred = None
+    return sorted(LOGIN_FORM_STRATEGIES, key=lambda s: s["name"] != preferred)
+
+
+def _remember_form_strategy(host: str, strategy: str) -> None:
+    path = _locator_cache_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get(host) == strategy:
+        return
+    cache[host] = strategy
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        logging.debug(f"写入定位缓存失败: {e}")
+
+
+def _locate_login_form_xpath(driver: uc.Chrome, timeout: float) -> Tuple:
+    """兜底：用宽泛的 XPath 联合查询逐个定位三个元素（timeout 为三个元素共用的等待时间）。"""
+    wait = WebDriverWait(driver, timeout)
+    username_input = wait.until(
+        EC.presence_of_element_located(
+            (
+                By.XPATH,
+                "//input[@type='text' or @name='username' or contains(@id,'UserName') "
+                "or contains(@name,'UserName')]",
+            )
+        )
+    )
+    password_input = wait.until(
+        EC.presence_of_element_located(
+            (
+                By.XPATH,
+                "//input[@type='password' or contains(@id,'Password') "
+                "or contains(@name,'Password')]",
+            )
+        )
+    )
+    signin_button = wait.until(
+        EC.element_to_be_clickable(
+            (
+                By.XPATH,
+                "//input[@type='submit' or @type='button' or contains(@value,'Sign In') "
+                "or contains(@value,'Login') or contains(@id,'Login')] "
+                "| //button[contains(.,'Sign In') or contains(.,'Login')]",
+            )
+        )
+    )
+    return username_input, password_input, signin_button
+
+
+def discover_login_form(driver: uc.Chrome, waits: WaitBudgetModel, deadline: Deadline) -> Tuple:
+    """
+    定位登录表单的用户名、密码和 Sign In 按钮。
+
+    先用注入脚本按策略一次性找出三个元素（上次命中的策略优先），
+    在 form_ready 预算内找不到时退回宽泛的 XPath 联合查询（只使用预算剩下的时间）。
+
+    Returns:
+        (username_input, password_input, signin_button)
+    """
+    host = urlparse(LOGIN_URL).hostname or ""
+    strategies = _ordered_form_strategies(host)
+    budget_ends = time.monotonic() + waits.budget("form_ready")
+    found = adaptive_wait(
+        driver,
+        waits,
+        "form_ready",
+        lambda d: d.execute_script(FORM_DISCOVERY_SCRIPT, strategies) or False,
+        required=False,
+        deadline=deadline,
+    )
+    if found:
+        logging.info(f"一次性定位到登录表单（策略: {found['strategy']}）")
+        _remember_form_strategy(host, found["strategy"])
+        return found["username"], found["password"], found["submit"]
+
+    logging.warning("脚本定位登录表单失败，改用 XPath 逐个定位...")
+    return _locate_login_form_xpath(driver, deadline.clamp(max(budget_ends - time.monotonic(), 0.0)))
 
 
 def perform_humanlike_login(
-    driver: uc.Chrome, username: str, password: str
+    driver: uc.Chrome,
+    username: str,
+    password: str,
+    timer: Optional[PhaseTimer] = None,
+    waits: Optional[WaitBudgetModel] = None,
+    deadline: Optional[Deadline] = None,
 ) -> bool:
     """
     模拟人类行为执行登录流程。
 
+    Args:
+        timer: 阶段计时器（可选），各阶段耗时会记入其中
+        waits: 自适应等待预算（可选，为 None 时使用各阶段默认预算）
+        deadline: 单次登录总时限（可选，默认 DEFAULT_LOGIN_DEADLINE_S 秒）
+
     Returns:
         True 如果登录成功，False 否则
     """
-    wait = WebDriverWait(driver, 20)
+    timer = timer or PhaseTimer()
+    waits = waits or WaitBudgetModel()
+    deadline = deadline or Deadline(DEFAULT_LOGIN_DEADLINE_S)
     actions = ActionChains(driver)
 
-    logging.info("打开登录页面: %s", LOGIN_URL)
-    driver.get(LOGIN_URL)
-
-    # 等待页面加载
-    human_like_delay(1000, 2000)
+    # 页面加载和异步脚本超时按剩余时限设置，结束后恢复（服务模式下 driver 会被之后的登录复用）
+    try:
+        original_timeouts = driver.timeouts
+    except Exception as e:
+        logging.warning(f"读取 driver 超时设置失败: {e}")
+        original_timeouts = None
 
     try:
-        # 定位用户名输入框
-        logging.info("定位用户名输入框...")
-        username_input = wait.until(
-            EC.presence_of_element_located(
-                (
-                    By.XPATH,
-                    "//input[@type='text' or @name='username' or contains(@id,'UserName') "
-                    "or contains(@name,'UserName')]",
-                )
-            )
-        )
+        logging.info("打开登录页面: %s（总时限 %.0fs）", LOGIN_URL, deadline.budget_s)
+        driver.set_page_load_timeout(max(deadline.remaining(), 1))
+        driver.get(LOGIN_URL)
+
+        # 等待页面加载
+        human_like_delay(1000, 2000, deadline)
+        timer.lap("open_login_page")
+
+        # 一次性定位用户名输入框、密码输入框和 Sign In 按钮
+        logging.info("定位登录表单...")
+        username_input, password_input, signin_button = discover_login_form(driver, waits, deadline)
+        timer.lap("locate_form")
 
         # 模拟鼠标移动到用户名输入框并点击
         logging.info("模拟鼠标移动到用户名输入框...")
         actions = ActionChains(driver)
-        move_mouse_humanlike(actions, username_input)
+        move_mouse_humanlike(actions, username_input, deadline=deadline)
         actions.click().perform()
-        human_like_delay(300, 600)
+        human_like_delay(300, 600, deadline)
 
         # 模拟人类输入用户名
         logging.info("模拟人类输入用户名...")
-        type_humanlike(username_input, username)
-        human_like_delay(300, 600)
-
-        # 定位密码输入框
-        logging.info("定位密码输入框...")
-        password_input = wait.until(
-            EC.presence_of_element_located(
-                (
-                    By.XPATH,
-                    "//input[@type='password' or contains(@id,'Password') "
-                    "or contains(@name,'Password')]",
-                )
-            )
-        )
+        type_humanlike(username_input, username, deadline=deadline)
+        human_like_delay(300, 600, deadline)
+        timer.lap("fill_username")
 
         # 模拟鼠标移动到密码输入框并点击
         logging.info("模拟鼠标移动到密码输入框...")
         actions = ActionChains(driver)
         # 先移动到密码框附近（模拟从用户名框移动过来的轨迹）
-        move_mouse_humanlike(actions, password_input)
+        move_mouse_humanlike(actions, password_input, deadline=deadline)
         actions.click().perform()
-        human_like_delay(300, 600)
+        human_like_delay(300, 600, deadline)
 
         # 模拟人类输入密码
         logging.info("模拟人类输入密码...")
-        type_humanlike(password_input, password)
-        human_like_delay(500, 1000)  # 输入密码后稍作停顿
-
-        # 定位 Sign In 按钮
-        logging.info("定位 Sign In 按钮...")
-        signin_button = wait.until(
-            EC.element_to_be_clickable(
-                (
-                    By.XPATH,
-                    "//input[@type='submit' or @type='button' or contains(@value,'Sign In') "
-                    "or contains(@value,'Login') or contains(@id,'Login')] "
-                    "| //button[contains(.,'Sign In') or contains(.,'Login')]",
-                )
-            )
-        )
+        type_humanlike(password_input, password, deadline=deadline)
+        human_like_delay(500, 1000, deadline)  # 输入密码后稍作停顿
+        timer.lap("fill_password")
 
         # 模拟鼠标移动到 Sign In 按钮并点击
         logging.info("模拟鼠标移动到 Sign In 按钮...")
         actions = ActionChains(driver)
-        move_mouse_humanlike(actions, signin_button)
+        move_mouse_humanlike(actions, signin_button, deadline=deadline)
         logging.info("点击 Sign In 按钮...")
         actions.click().perform()
+        timer.lap("submit")
         
-        # 点击后等待页面跳转（给足够时间让验证和跳转完成）
+        # 点击后等待页面离开登录页（需要 Cloudflare 验证时会一直停在登录页，超时属于正常分支）
         logging.info("等待页面跳转和验证完成...")
-        human_like_delay(5000, 8000)
+        adaptive_wait(
+            driver,
+            waits,
+            "post_submit",
+            lambda d: "login.aspx" not in d.current_url.lower(),
+            required=False,
+            deadline=deadline,
+        )
         
         # 第一次检查：如果已经跳转到目标页面，直接返回成功
         current_url = driver.current_url
+        timer.lap("post_submit_wait")
         logging.info("第一次检查 - 当前 URL: %s", current_url)
         
         if TARGET_URL_FRAGMENT in current_url:
@@ -814,16 +1496,19 @@ def perform_humanlike_login(
             logging.info("仍在登录页，检测是否需要 Cloudflare 验证...")
             
             # 检测并处理 Cloudflare 验证
-            if handle_cloudflare_challenge(driver, wait):
+            challenge_handled = handle_cloudflare_challenge(driver, waits, deadline)
+            timer.lap("cloudflare_challenge")
+            if challenge_handled:
                 logging.info("Cloudflare 验证已处理，继续等待页面跳转...")
-                # 验证后等待更长时间
-                human_like_delay(5000, 8000)
             else:
                 logging.info("未检测到 Cloudflare 验证，继续等待页面跳转...")
-                human_like_delay(3000, 5000)
+            adaptive_wait(
+                driver, waits, "post_challenge", EC.url_contains(TARGET_URL_FRAGMENT), required=False, deadline=deadline
+            )
             
             # 第二次检查：验证后再次检查 URL
             current_url = driver.current_url
+            timer.lap("post_challenge_wait")
             logging.info("第二次检查 - 当前 URL: %s", current_url)
             
             if TARGET_URL_FRAGMENT in current_url:
@@ -837,10 +1522,13 @@ def perform_humanlike_login(
         else:
             # 既不在登录页，也不在目标页，可能是中间状态
             logging.info("页面处于中间状态，继续等待...")
-            human_like_delay(3000, 5000)
+            adaptive_wait(
+                driver, waits, "redirect", EC.url_contains(TARGET_URL_FRAGMENT), required=False, deadline=deadline
+            )
             
             # 第三次检查
             current_url = driver.current_url
+            timer.lap("intermediate_wait")
             logging.info("第三次检查 - 当前 URL: %s", current_url)
             
             if TARGET_URL_FRAGMENT in current_url:
@@ -852,6 +1540,13 @@ def perform_humanlike_login(
                 logging.error("✗ LOGIN_FAILED - 当前 URL: %s", current_url)
                 return False
 
+    except DeadlineExceeded as e:
+        logging.error(f"登录流程被终止: {e}")
+        try:
+            logging.error("✗ LOGIN_FAILED - 超时时的 URL: %s", driver.current_url)
+        except Exception:
+            logging.error("✗ LOGIN_FAILED - 无法获取当前 URL")
+        return False
     except Exception as e:
         logging.exception("执行登录流程时出现异常。")
         try:
@@ -860,57 +1555,545 @@ def perform_humanlike_login(
         except:
             logging.error("✗ LOGIN_FAILED - 无法获取当前 URL")
         return False
+    finally:
+        if original_timeouts is not None:
+            try:
+                driver.timeouts = original_timeouts
+            except Exception as e:
+                logging.warning(f"恢复 driver 超时设置失败: {e}")
+
+
+@dataclass
+class RuntimeConfig:
+    """从环境变量读取的运行配置。"""
+
+    headless: bool
+    use_xvfb: bool
+    chrome_profile_dir: Optional[str]
+    proxy_server: Optional[str]
+    resource_policy: Optional[ResourcePolicy] = None
+    login_deadline_s: float = DEFAULT_LOGIN_DEADLINE_S
+    launch_profile: str = "default"
+
+    @property
+    def mode_description(self) -> str:
+        return "headless (Xvfb)" if (self.headless and self.use_xvfb) else ("headless" if self.headless else "visible")
+
+    @classmethod
+    def from_env(cls) -> "RuntimeConfig":
+        # 检查是否在 EC2 环境（通过环境变量控制 headless 模式）
+        # 默认在 EC2 上使用 headless，本地可以通过设置 HEADLESS=false 来禁用
+        is_headless = os.getenv("HEADLESS", "true").lower() == "true"
+        
+        # 检查是否使用 Xvfb（推荐用于 headless 模式，绕过 Cloudflare 检测）
+        # 设置 USE_XVFB=true 来启用 Xvfb 虚拟显示
+        use_xvfb = os.getenv("USE_XVFB", "false").lower() == "true"
+        
+        # 读取 Chrome profile 目录（用于保存 cookies、缓存等，有助于绕过 Cloudflare）
+        # 如果本地成功登录后，可以将 profile 目录复制到 AWS 使用
+        chrome_profile_dir = os.getenv("CHROME_PROFILE_DIR", "").strip()
+        if chrome_profile_dir:
+            # 检查目录是否存在
+            if os.path.exists(chrome_profile_dir):
+                logging.info(f"检测到 Chrome profile 目录: {chrome_profile_dir}")
+                logging.info("将使用该目录中的 cookies、缓存和浏览器指纹信息")
+            else:
+                logging.warning(f"Chrome profile 目录不存在，将创建: {chrome_profile_dir}")
+                os.makedirs(chrome_profile_dir, exist_ok=True)
+        else:
+            logging.info("未指定 CHROME_PROFILE_DIR，将使用临时目录（数据不会保存）")
+            chrome_profile_dir = None
+        
+        # 读取代理服务器配置（用于绕过 AWS IP 检测）
+        # 格式：http://host:port 或 socks5://host:port
+        # 示例：PROXY_SERVER=http://proxy.example.com:8080
+        proxy_server = os.getenv("PROXY_SERVER", "").strip()
+        if proxy_server:
+            logging.info(f"检测到代理服务器配置: {proxy_server}")
+            logging.info("将使用代理服务器访问网站，以绕过 AWS IP 被 Cloudflare 检测的问题")
+        else:
+            logging.info("未配置代理服务器，将直接连接（如果 AWS IP 被标记，建议配置代理）")
+            proxy_server = None
+        
+        # 如果 headless=True 且未指定 USE_XVFB，在 Linux 上自动尝试使用 Xvfb
+        if is_headless and not use_xvfb and sys.platform == "linux":
+            logging.info("检测到 headless 模式，建议使用 Xvfb 以提高 Cloudflare 绕过成功率")
+            logging.info("设置环境变量 USE_XVFB=true 来启用 Xvfb，或手动安装: sudo apt-get install xvfb")
+
+        # 单次登录总时限（秒），所有等待、停顿和脚本调用共享这一预算
+        try:
+            login_deadline_s = parse_deadline_s(os.getenv("LOGIN_DEADLINE", DEFAULT_LOGIN_DEADLINE_S))
+        except ValueError:
+            logging.warning(f"LOGIN_DEADLINE 无效，使用默认值 {DEFAULT_LOGIN_DEADLINE_S:.0f}s")
+            login_deadline_s = DEFAULT_LOGIN_DEADLINE_S
+
+        # Chrome 启动参数配置：default 或 lean（低内存，适合小规格 EC2）
+        launch_profile = os.getenv("CHROME_LAUNCH_PROFILE", "default").strip().lower() or "default"
+        if launch_profile not in CHROME_LAUNCH_PROFILES:
+            logging.warning(f"未知的 CHROME_LAUNCH_PROFILE={launch_profile}，使用 default")
+            launch_profile = "default"
+
+        return cls(
+            headless=is_headless,
+            use_xvfb=use_xvfb,
+            chrome_profile_dir=chrome_profile_dir,
+            proxy_server=proxy_server,
+            resource_policy=ResourcePolicy.from_env(),
+            login_deadline_s=login_deadline_s,
+            launch_profile=launch_profile,
+        )
+
+
+def prepare_display(config: RuntimeConfig) -> Optional[subprocess.Popen]:
+    """如果使用 Xvfb，先启动虚拟显示服务器；启动失败时回退到标准 headless 模式。"""
+    xvfb_process = None
+    if config.use_xvfb and config.headless:
+        xvfb_process = start_xvfb()
+        if xvfb_process is None and sys.platform == "linux":
+            logging.warning("Xvfb 启动失败，将使用标准 headless 模式")
+            config.use_xvfb = False
+    return xvfb_process
+
+
+def stop_xvfb(xvfb_process: Optional[subprocess.Popen]) -> None:
+    """清理 Xvfb 进程（如果是由我们启动的）。"""
+    if xvfb_process is None:
+        return
+    try:
+        logging.info(f"关闭 Xvfb 进程 (PID: {xvfb_process.pid})")
+        xvfb_process.terminate()
+        xvfb_process.wait(timeout=5)
+    except Exception as e:
+        logging.warning(f"关闭 Xvfb 进程时出错: {e}")
+        try:
+            xvfb_process.kill()
+        except Exception:
+            pass
+
+
+def history_db_path() -> Optional[str]:
+    """运行历史数据库路径（RUN_HISTORY_DB，默认 login_history.sqlite3；设为 off 关闭）。"""
+    db_path = os.getenv("RUN_HISTORY_DB", DEFAULT_DB_PATH).strip()
+    if not db_path or db_path.lower() == "off":
+        return None
+    return db_path
+
+
+def ensure_tunnel_proxy(config: RuntimeConfig) -> Optional[str]:
+    """
+    选择本次登录使用的代理（需要设置 TUNNEL_HEALTH_FILE，由 tunnel_supervisor.py 维护）。
+
+    PROXY_SERVER 对应的隧道不健康时，最多等待 TUNNEL_WAIT 秒（默认 30）让它恢复，
+    或者改用另一条健康的隧道；仍然没有可用隧道时抛出 RuntimeError，避免登录卡到超时。
+    config.proxy_server 不会被修改：每次都先尝试 PROXY_SERVER，它恢复后立即切回。
+    PROXY_SERVER 不是健康文件中的隧道（例如 local_proxy.py 住宅代理）时不检查，直接使用。
+
+    Returns:
+        本次使用的代理（未配置代理时为 None）
+    """
+    preferred = config.proxy_server
+    health_file = os.getenv("TUNNEL_HEALTH_FILE")
+    if not health_file or not preferred:
+        return preferred
+    if is_supervised(health_file, preferred) is False:
+        logging.debug(f"{preferred} 不是 {health_file} 中的隧道，不检查健康状态")
+        return preferred
+    try:
+        timeout = float(os.getenv("TUNNEL_WAIT", DEFAULT_TUNNEL_WAIT_S))
+    except ValueError:
+        logging.warning(f"TUNNEL_WAIT 无效，使用默认值 {DEFAULT_TUNNEL_WAIT_S:.0f}s")
+        timeout = DEFAULT_TUNNEL_WAIT_S
+    proxy = wait_for_healthy_proxy(health_file, preferred, timeout)
+    if proxy is None:
+        raise RuntimeError(f"没有可用的代理隧道（{timeout:.0f}s 内 {health_file} 中没有健康的隧道）")
+    if proxy != preferred:
+        logging.warning(f"隧道 {preferred} 不可用，本次改用 {proxy}")
+    return proxy
+
+
+def open_wait_model(config: RuntimeConfig) -> WaitBudgetModel:
+    """按当前代理打开自适应等待模型；数据库不可用时退回默认预算。"""
+    try:
+        return WaitBudgetModel(history_db_path(), proxy=config.proxy_server)
+    except Exception as e:
+        logging.warning(f"打开等待预算模型失败，使用默认预算: {e}")
+        return WaitBudgetModel(proxy=config.proxy_server)
 
 
-def main() -> int:
+def record_run_history(
+    timer: PhaseTimer, outcome: str, final_url: Optional[str], config: RuntimeConfig, proxy: Optional[str] = None
+) -> None:
+    """
+    把本次运行写入 SQLite 运行历史（见 history_db_path）。
+    proxy 为本次实际使用的代理（隧道切换时与 PROXY_SERVER 不同），默认 config.proxy_server。
+    写入失败只记录警告，不影响登录结果。
+    """
+    db_path = history_db_path()
+    if db_path is None:
+        return
+    try:
+        history = RunHistory(db_path)
+        try:
+            history.record_run(
+                timer,
+                outcome=outcome,
+                final_url=final_url,
+                mode=config.mode_description,
+                proxy=proxy or config.proxy_server,
+                profile=config.chrome_profile_dir,
+            )
+        finally:
+            history.close()
+    except Exception as e:
+        logging.warning(f"写入运行历史失败: {e}")
+
+
+class LoginService:
+    """
+    常驻登录服务：保持已导入的模块、Xvfb 和浏览器常驻，逐个执行登录任务。
+
+    同一时间只有一个浏览器会话，任务通过锁串行执行。
+    """
+
+    def __init__(self, config: RuntimeConfig):
+        self.config = config
+        self.xvfb_process: Optional[subprocess.Popen] = None
+        self.driver: Optional[uc.Chrome] = None
+        self.monitor: Optional[ProcessTreeMonitor] = None
+        self.jobs_done = 0
+        self.proxy_server = config.proxy_server  # 当前浏览器使用的代理（本次任务选出的隧道）
+        self.waits = open_wait_model(config)
+        self._lock = threading.Lock()
+        self._default_credentials: Optional[Tuple[str, str]] = None
+
+    def start(self) -> None:
+        """启动虚拟显示和浏览器（预热）。"""
+        reap_orphans()
+        self.xvfb_process = prepare_display(self.config)
+        logging.info("运行模式: %s", self.config.mode_description)
+        self._check_tunnel()
+        self._ensure_driver()
+
+    def _check_tunnel(self) -> None:
+        """
+        每个任务开始前检查隧道健康状态。
+
+        代理写在浏览器的启动参数中，改用另一条隧道后必须重新创建常驻浏览器，否则会一直使用已断开的隧道。
+        """
+        proxy = ensure_tunnel_proxy(self.config)
+        if self.driver is not None and not same_proxy(proxy, self.proxy_server):
+            logging.warning(f"代理从 {self.proxy_server} 切换为 {proxy}，重新创建浏览器")
+            self._quit_driver()
+        self.proxy_server = proxy
+        self.waits.proxy = proxy or "direct"
+
+    def _ensure_driver(self) -> uc.Chrome:
+        """返回可用的浏览器；如果浏览器已崩溃则重新创建。"""
+        if self.driver is not None:
+            try:
+                _ = self.driver.current_url
+                return self.driver
+            except Exception as e:
+                logging.warning(f"浏览器会话不可用，将重新创建: {e}")
+                self._quit_driver()
+        self.driver = create_chrome_driver(
+            headless=self.config.headless,
+            use_xvfb=self.config.use_xvfb,
+            user_data_dir=self.config.chrome_profile_dir,
+            proxy_server=self.proxy_server,
+            resource_policy=self.config.resource_policy,
+            launch_profile=self.config.launch_profile,
+        )
+        self.monitor = ProcessTreeMonitor.for_driver(self.driver)
+        return self.driver
+
+    def _quit_driver(self) -> None:
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.warning(f"关闭浏览器时出错: {e}")
+        self.driver = None
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor.reap()
+            self.monitor = None
+
+    def run_job(self, job: Dict[str, object]) -> Dict[str, object]:
+        """
+        执行一次登录任务。
+
+        Args:
+            job: 任务参数，可包含 username、password（缺省使用 .env 中的凭据）、
+                 reset_cookies（默认 True，登录前清除 Enrollware 的会话 cookies）
+                 、deadline_s（本次登录总时限，默认 LOGIN_DEADLINE）
+                 和 export_session（默认 False，成功时在结果中附带 cookies 和 User-Agent，
+                 调用方可用 http_handoff.EnrollwareSession 继续请求）
+
+        Returns:
+            结构化结果：success、final_url、duration_s、error、session（可选）
+        """
+        with self._lock:
+            timer = PhaseTimer()
+            result: Dict[str, object] = {"success": False, "final_url": None, "error": None}
+            try:
+                username = job.get("username")
+                password = job.get("password")
+                if not username or not password:
+                    if self._default_credentials is None:
+                        self._default_credentials = load_credentials()
+                    username, password = self._default_credentials
+
+                self._check_tunnel()
+                driver = self._ensure_driver()
+                if job.get("reset_cookies", True) and self.jobs_done > 0:
+                    # 当前页面仍在 Enrollware 域名下，清除上一次任务的登录状态
+                    driver.delete_all_cookies()
+                timer.lap("driver_ready")
+
+                deadline = Deadline(job_deadline_s(job, self.config.login_deadline_s))
+                result["success"] = perform_humanlike_login(
+                    driver, str(username), str(password), timer, self.waits, deadline
+                )
+                result["final_url"] = driver.current_url
+                result["resources"] = collect_resource_report(driver, self.config.resource_policy)
+                if result["success"] and job.get("export_session"):
+                    result["session"] = export_browser_session(driver)
+            except Exception as e:
+                logging.exception("执行登录任务时出现异常。")
+                result["error"] = str(e)
+            finally:
+                self.jobs_done += 1
+                result["duration_s"] = round(timer.elapsed, 3)
+                result["phases"] = {name: round(value, 3) for name, value in timer.phases.items()}
+                outcome = "error" if result["error"] else ("success" if result["success"] else "failed")
+                record_run_history(timer, outcome, result["final_url"], self.config, self.proxy_server)
+            return result
+
+    def close(self) -> None:
+        self._quit_driver()
+        self.waits.close()
+        stop_xvfb(self.xvfb_process)
+        self.xvfb_process = None
+
+
+class LoginRequestHandler(BaseHTTPRequestHandler):
+    """
+    本地 RPC 接口：
+    - POST /login  请求体为 JSON 任务参数，返回 JSON 结果
+    - GET /health  返回服务状态
+    """
+
+    service: Optional[LoginService] = None
+
+    def address_string(self) -> str:
+        # Unix socket 的 client_address 是空字符串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        logging.info("[service] %s - %s", self.address_string(), format % args)
+
+    def _send_json(self, code: int, payload: Dict[str, object]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {
+            "status": "ok",
+            "mode": self.service.config.mode_description,
+            "browser_running": self.service.driver is not None,
+            "jobs_done": self.service.jobs_done,
+            "peak_rss_mb": round(self.service.monitor.peak_rss_bytes / 1024 / 1024, 1) if self.service.monitor else None,
+        })
+
+    def do_POST(self) -> None:
+        if self.path != "/login":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            job = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(job, dict):
+                raise ValueError("job must be a JSON object")
+            job_deadline_s(job, self.service.config.login_deadline_s)
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid job: {e}"})
+            return
+        self._send_json(200, self.service.run_job(job))
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听 Unix socket 的 HTTP 服务器"""
+    daemon_threads = True
+
+
+def serve(config: RuntimeConfig, host: str, port: int, socket_path: Optional[str] = None) -> int:
+    """
+    以服务模式运行：保持浏览器常驻，通过本地 HTTP 或 Unix socket 接收登录任务。
+
+    Returns:
+        进程退出码
+    """
+    service = LoginService(config)
+    LoginRequestHandler.service = service
+    try:
+        service.start()
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = UnixHTTPServer(socket_path, LoginRequestHandler)
+            logging.info(f"登录服务已启动，监听 Unix socket: {socket_path}")
+        else:
+            server = ThreadingHTTPServer((host, port), LoginRequestHandler)
+            logging.info(f"登录服务已启动，监听 http://{host}:{port}")
+        logging.info("POST /login 提交登录任务，GET /health 查看状态，按 Ctrl+C 停止")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("正在关闭登录服务...")
+        finally:
+            server.server_close()
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+        return 0
+    except Exception:
+        logging.exception("登录服务运行失败。")
+        return 1
+    finally:
+        service.close()
+        logging.info("===== Enrollware 登录服务结束 =====")
+
+
+def run_worker(config: RuntimeConfig, queue_path: str, worker_id: str, poll_s: float = 5.0, max_jobs: int = 0) -> int:
+    """
+    以 worker 模式运行：从共享任务队列领取登录任务，执行期间定期心跳续租。
+    可以在任意多台主机上启动任意多个 worker。SIGTERM / Ctrl+C 后完成当前任务再退出。
+
+    Args:
+        poll_s: 队列为空时的轮询间隔（秒）
+        max_jobs: 处理指定数量的任务后退出（0 表示不限）
+
+    Returns:
+        进程退出码
+    """
+    queue = JobQueue(queue_path, lease_s=max(DEFAULT_LEASE_S, config.login_deadline_s * 2))
+    service = LoginService(config)
+    stop = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        logging.info("收到停止信号，完成当前任务后退出")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    processed = 0
+    try:
+        service.start()
+        logging.info(f"worker {worker_id} 已启动，队列: {queue_path}")
+        while not stop.is_set() and (max_jobs <= 0 or processed < max_jobs):
+            job = queue.claim(worker_id)
+            if job is None:
+                stop.wait(poll_s)
+                continue
+            logging.info(f"领取任务 #{job.id}（第 {job.attempts}/{job.max_attempts} 次尝试）")
+
+            # 心跳线程：每 1/3 租约续租一次；租约丢失说明任务已被其他 worker 接管
+            done = threading.Event()
+
+            def keep_alive(job_id: int = job.id) -> None:
+                while not done.wait(queue.lease_s / 3):
+                    try:
+                        if not queue.heartbeat(job_id, worker_id):
+                            logging.warning(f"任务 #{job_id} 的租约已丢失")
+                            return
+                    except Exception as e:
+                        logging.warning(f"任务 #{job_id} 心跳失败: {e}")
+
+            heartbeat = threading.Thread(target=keep_alive, name="job-heartbeat", daemon=True)
+            heartbeat.start()
+            try:
+                result = service.run_job(job.payload)
+            finally:
+                done.set()
+                heartbeat.join()
+            processed += 1
+
+            if result["success"]:
+                recorded = queue.complete(job.id, worker_id, result)
+            else:
+                recorded = queue.fail(job.id, worker_id, str(result["error"] or "登录失败"), result)
+            status = "成功" if result["success"] else "失败"
+            if recorded:
+                logging.info(f"任务 #{job.id} {status}（{result['duration_s']}s）")
+            else:
+                logging.warning(f"任务 #{job.id} {status}，但租约已丢失，结果未写入队列")
+        return 0
+    except Exception:
+        logging.exception("worker 运行失败。")
+        return 1
+    finally:
+        service.close()
+        queue.close()
+        logging.info(f"===== worker {worker_id} 结束，共处理 {processed} 个任务 =====")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Enrollware 人类化自动登录脚本")
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="以常驻服务模式运行，通过本地 HTTP / Unix socket 接收登录任务",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="服务模式监听地址（默认: 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8765, help="服务模式监听端口（默认: 8765）")
+    parser.add_argument("--socket", help="服务模式改为监听该 Unix socket 路径")
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="以 worker 模式运行，从共享任务队列领取登录任务（见 job_queue.py）",
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("JOB_QUEUE_DB", DEFAULT_QUEUE_PATH),
+        help=f"worker 模式的队列数据库路径（默认: JOB_QUEUE_DB 或 {DEFAULT_QUEUE_PATH}）",
+    )
+    parser.add_argument("--worker-id", default=default_worker_id(), help="worker 标识（默认: 主机名:PID）")
+    parser.add_argument("--max-jobs", type=int, default=0, help="worker 处理指定数量的任务后退出（默认: 不限）")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
     """
     主函数。
     
     Returns:
         0 如果登录成功，1 如果登录失败
     """
+    args = parse_args(argv)
     setup_logging()
     logging.info("===== Enrollware 人类化自动登录脚本开始运行 =====")
 
-    # 检查是否在 EC2 环境（通过环境变量控制 headless 模式）
-    # 默认在 EC2 上使用 headless，本地可以通过设置 HEADLESS=false 来禁用
-    is_headless = os.getenv("HEADLESS", "true").lower() == "true"
-    
-    # 检查是否使用 Xvfb（推荐用于 headless 模式，绕过 Cloudflare 检测）
-    # 设置 USE_XVFB=true 来启用 Xvfb 虚拟显示
-    use_xvfb = os.getenv("USE_XVFB", "false").lower() == "true"
-    
-    # 读取 Chrome profile 目录（用于保存 cookies、缓存等，有助于绕过 Cloudflare）
-    # 如果本地成功登录后，可以将 profile 目录复制到 AWS 使用
-    chrome_profile_dir = os.getenv("CHROME_PROFILE_DIR", "").strip()
-    if chrome_profile_dir:
-        # 检查目录是否存在
-        if os.path.exists(chrome_profile_dir):
-            logging.info(f"检测到 Chrome profile 目录: {chrome_profile_dir}")
-            logging.info("将使用该目录中的 cookies、缓存和浏览器指纹信息")
-        else:
-            logging.warning(f"Chrome profile 目录不存在，将创建: {chrome_profile_dir}")
-            os.makedirs(chrome_profile_dir, exist_ok=True)
-    else:
-        logging.info("未指定 CHROME_PROFILE_DIR，将使用临时目录（数据不会保存）")
-        chrome_profile_dir = None
-    
-    # 读取代理服务器配置（用于绕过 AWS IP 检测）
-    # 格式：http://host:port 或 socks5://host:port
-    # 示例：PROXY_SERVER=http://proxy.example.com:8080
-    proxy_server = os.getenv("PROXY_SERVER", "").strip()
-    if proxy_server:
-        logging.info(f"检测到代理服务器配置: {proxy_server}")
-        logging.info("将使用代理服务器访问网站，以绕过 AWS IP 被 Cloudflare 检测的问题")
-    else:
-        logging.info("未配置代理服务器，将直接连接（如果 AWS IP 被标记，建议配置代理）")
-        proxy_server = None
-    
-    # 如果 headless=True 且未指定 USE_XVFB，在 Linux 上自动尝试使用 Xvfb
-    if is_headless and not use_xvfb and sys.platform == "linux":
-        logging.info("检测到 headless 模式，建议使用 Xvfb 以提高 Cloudflare 绕过成功率")
-        logging.info("设置环境变量 USE_XVFB=true 来启用 Xvfb，或手动安装: sudo apt-get install xvfb")
+    # 清理之前运行残留的浏览器进程和临时目录
+    reap_orphans()
+
+    config = RuntimeConfig.from_env()
+    if args.serve:
+        return serve(config, args.host, args.port, args.socket)
+    if args.worker:
+        return run_worker(config, args.queue, args.worker_id, max_jobs=args.max_jobs)
     
+    timer = PhaseTimer()
+    waits = open_wait_model(config)
+    outcome = "error"
+    final_url = None
     xvfb_process = None
     try:
         username, password = load_credentials()
@@ -920,25 +2103,57 @@ def main() -> int:
         return 1
 
     driver = None
+    monitor = None
+    proxy_server = config.proxy_server
     try:
         # 如果使用 Xvfb，先启动虚拟显示服务器
-        if use_xvfb and is_headless:
-            xvfb_process = start_xvfb()
-            if xvfb_process is None and sys.platform == "linux":
-                logging.warning("Xvfb 启动失败，将使用标准 headless 模式")
-                use_xvfb = False
+        xvfb_process = prepare_display(config)
+        timer.lap("start_display")
         
         # 创建 Chrome（根据环境变量决定是否 headless）
-        mode_description = "headless (Xvfb)" if (is_headless and use_xvfb) else ("headless" if is_headless else "visible")
-        logging.info("运行模式: %s", mode_description)
-        driver = create_chrome_driver(headless=is_headless, use_xvfb=use_xvfb, user_data_dir=chrome_profile_dir, proxy_server=proxy_server)
+        logging.info("运行模式: %s", config.mode_description)
+        proxy_server = ensure_tunnel_proxy(config)
+        waits.proxy = proxy_server or "direct"
+        driver = create_chrome_driver(headless=config.headless, use_xvfb=config.use_xvfb, user_data_dir=config.chrome_profile_dir, proxy_server=proxy_server, resource_policy=config.resource_policy, launch_profile=config.launch_profile)
+        monitor = ProcessTreeMonitor.for_driver(driver)
+        timer.lap("start_browser")
 
         # 执行人类化登录
-        success = perform_humanlike_login(driver, username, password)
+        deadline = Deadline(config.login_deadline_s)
+        success = perform_humanlike_login(driver, username, password, timer, waits, deadline)
+        outcome = "success" if success else "failed"
+        final_url = driver.current_url
+        collect_resource_report(driver, config.resource_policy)
 
         # 输出明确的成功/失败标识
         logging.info("=" * 60)
         if success:
+            session_file = os.getenv("SESSION_EXPORT_FILE")
+            if session_file:
+                # 导出会话后浏览器即可释放，后续请求由 http_handoff 的 HTTP 客户端完成
+                try:
+                    save_session_file(export_browser_session(driver), session_file)
+                    logging.info(f"会话已导出到 {session_file}")
+                except Exception as e:
+                    logging.warning(f"导出会话失败: {e}")
+            class_list_output = os.getenv("CLASS_LIST_OUTPUT")
+            class_sync_output = os.getenv("CLASS_SYNC_OUTPUT")
+            if class_list_output or class_sync_output:
+                # 交接会话后立即释放浏览器，课程列表由 HTTP 客户端抓取
+                session = handoff_from_driver(driver, proxy_server)
+                driver = None
+                timer.lap("session_handoff")
+                try:
+                    if class_list_output:
+                        export_class_list(session, class_list_output)
+                        timer.lap("class_list")
+                    if class_sync_output:
+                        sync_class_list(session, class_sync_output, os.getenv("CLASS_SYNC_DB", DEFAULT_SYNC_INDEX_PATH))
+                        timer.lap("class_sync")
+                except Exception as e:
+                    logging.warning(f"导出课程列表失败: {e}")
+                finally:
+                    session.close()
             logging.info("✓ 登录检查结果：成功")
             print("=" * 60)
             print("✓ LOGIN_SUCCESS")
@@ -960,20 +2175,19 @@ def main() -> int:
     finally:
         if driver is not None:
             logging.info("关闭浏览器。")
-            driver.quit()
-        
-        # 清理 Xvfb 进程（如果是由我们启动的）
-        if xvfb_process is not None:
             try:
-                logging.info(f"关闭 Xvfb 进程 (PID: {xvfb_process.pid})")
-                xvfb_process.terminate()
-                xvfb_process.wait(timeout=5)
+                driver.quit()
             except Exception as e:
-                logging.warning(f"关闭 Xvfb 进程时出错: {e}")
-                try:
-                    xvfb_process.kill()
-                except Exception:
-                    pass
+                logging.warning(f"关闭浏览器时出错: {e}")
+        if monitor is not None:
+            monitor.stop()
+            monitor.reap()
+        
+        # 清理 Xvfb 进程（如果是由我们启动的）
+        stop_xvfb(xvfb_process)
+        timer.lap("teardown")
+        waits.close()
+        record_run_history(timer, outcome, final_url, config, proxy_server)
 
         logging.info("===== Enrollware 人类化自动登录脚本结束 =====")
         return return_code
@@ -0,0 +1,378 @@
+"""
+Chrome 进程树监控与孤儿进程清理（仅 Linux，基于 /proc）
+
+- ProcessTreeMonitor：登录过程中定期采样 chromedriver 和 Chrome 整棵进程树的 CPU / RSS，记录峰值
+- 登记：每个被监控的浏览器会把进程（PID + 启动时间）和临时 profile 目录登记到状态文件
+- LaunchGuard：uc.Chrome(...) 启动期间先登记临时 profile 目录和新出现的浏览器进程，启动失败时清理
+- reap_orphans()：启动时清理登记者已经退出、但仍残留的 chrome / chromedriver 进程及其临时目录
+- ProcessTreeMonitor.reap()：退出时在 driver.quit() 之后补刀，清理残留进程和临时目录
+
+只清理本项目登记过的进程：PID 必须和登记时的启动时间一致，避免误杀 PID 被复用后的其他进程；
+判断登记者是否退出时同样比较启动时间。
+"""
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+STATE_FILE = os.getenv(
+    "CHROME_REAPER_STATE", os.path.join(tempfile.gettempdir(), "enrollware_chrome_owned.json")
+)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read_stat(pid: int) -> Optional[List[str]]:
+    """读取 /proc/<pid>/stat，返回 comm 之后的字段（字段 3 起）。"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # comm 可能包含空格，以最后一个 ')' 为界
+    return data[data.rfind(")") + 2:].split()
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """进程启动时间（开机以来的 clock ticks），用于识别 PID 复用。"""
+    fields = _read_stat(pid)
+    return int(fields[19]) if fields else None
+
+
+def list_children() -> Dict[int, List[int]]:
+    """返回 {ppid: [pid, ...]}。"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        fields = _read_stat(int(entry))
+        if fields:
+            children.setdefault(int(fields[1]), []).append(int(entry))
+    return children
+
+
+def process_tree(root_pids: List[int]) -> Set[int]:
+    """root_pids 及其全部后代。"""
+    children = list_children()
+    tree: Set[int] = set()
+    stack = [pid for pid in root_pids if pid]
+    while stack:
+        pid = stack.pop()
+        if pid in tree:
+            continue
+        tree.add(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def process_name(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _locked_state() -> Iterator[Dict[str, Dict[str, object]]]:
+    """加锁读写状态文件：{owner_key: {"owner_pid", "owner_start", "processes": {pid: start_time}, "temp_dirs"}}。"""
+    with open(STATE_FILE, "a+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or "{}")
+            except ValueError:
+                state = {}
+            yield state
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _kill_processes(processes: Dict[str, int], grace_s: float = 3.0) -> int:
+    """结束仍存活且启动时间匹配的进程（先 SIGTERM，宽限后 SIGKILL），返回结束的数量。"""
+    targets = [int(pid) for pid, start in processes.items() if process_start_time(int(pid)) == start]
+    for pid in targets:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    deadline = time.monotonic() + grace_s
+    while time.monotonic() < deadline and any(_pid_alive(pid) for pid in targets):
+        time.sleep(0.1)
+    for pid in targets:
+        if process_start_time(pid) is not None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+    return len(targets)
+
+
+def _purge_dirs(temp_dirs: List[str]) -> int:
+    """删除临时目录（只删除系统临时目录下的路径）。"""
+    tmp_root = os.path.realpath(tempfile.gettempdir())
+    purged = 0
+    for path in temp_dirs:
+        real = os.path.realpath(path)
+        if not real.startswith(tmp_root + os.sep) or not os.path.isdir(real):
+            continue
+        shutil.rmtree(real, ignore_errors=True)
+        purged += 1
+    return purged
+
+
+def _owner_entry(processes: Dict[str, int], temp_dirs: List[str]) -> Dict[str, object]:
+    return {
+        "owner_pid": os.getpid(),
+        "owner_start": process_start_time(os.getpid()),
+        "processes": processes,
+        "temp_dirs": temp_dirs,
+    }
+
+
+def _owner_alive(entry: Dict[str, object]) -> bool:
+    """登记者是否仍在运行（PID 存活且启动时间与登记时一致）。"""
+    owner_pid = int(entry["owner_pid"])
+    owner_start = entry.get("owner_start")
+    if owner_start is None:  # 旧版本的登记
+        return _pid_alive(owner_pid)
+    return process_start_time(owner_pid) == owner_start
+
+
+def reap_orphans() -> None:
+    """清理登记者已经退出的残留 chrome / chromedriver 进程及其临时目录。"""
+    if not os.path.isdir("/proc") or fcntl is None:
+        return
+    try:
+        with _locked_state() as state:
+            for key in list(state):
+                entry = state[key]
+                if _owner_alive(entry):
+                    continue
+                killed = _kill_processes(entry.get("processes", {}))
+                purged = _purge_dirs(entry.get("temp_dirs", []))
+                if killed or purged:
+                    logging.warning(f"清理孤儿浏览器（登记者 PID {entry['owner_pid']} 已退出）：结束 {killed} 个进程，删除 {purged} 个临时目录")
+                del state[key]
+    except Exception as e:
+        logging.warning(f"清理孤儿进程失败: {e}")
+
+
+class LaunchGuard:
+    """
+    一次浏览器启动期间的登记。
+
+    uc.Chrome(...) 之前登记临时 profile 目录，之后登记本进程新出现的 chrome / chromedriver 进程，
+    这样启动失败或进程崩溃时也能被清理。启动成功后 release()，由 ProcessTreeMonitor 接管；
+    失败时 kill_processes() 结束本次启动留下的进程，reap() 再删除临时目录。
+
+    Args:
+        temp_dirs: 本次启动使用的临时 profile 目录
+    """
+
+    def __init__(self, temp_dirs: Optional[List[str]] = None):
+        self.temp_dirs = temp_dirs or []
+        self.key = f"{os.getpid()}:launch:{id(self)}"
+        self.known: Dict[str, int] = {}
+        self.enabled = os.path.isdir("/proc") and fcntl is not None
+        self._before: Set[int] = process_tree([os.getpid()]) if self.enabled else set()
+        self._register()
+
+    def _register(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            with _locked_state() as state:
+                state[self.key] = _owner_entry(self.known, self.temp_dirs)
+        except Exception as e:
+            logging.debug(f"登记浏览器启动失败: {e}")
+
+    def _unregister(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            with _locked_state() as state:
+                state.pop(self.key, None)
+        except Exception as e:
+            logging.debug(f"注销浏览器启动失败: {e}")
+
+    def register_children(self) -> None:
+        """登记启动后新出现的浏览器进程（只登记名称含 chro 的进程，不影响其他线程启动的子进程）。"""
+        if not self.enabled:
+            return
+        for pid in process_tree([os.getpid()]) - self._before:
+            if str(pid) in self.known or "chro" not in process_name(pid):
+                continue
+            start = process_start_time(pid)
+            if start is not None:
+                self.known[str(pid)] = start
+        self._register()
+
+    def kill_processes(self) -> int:
+        """结束本次启动留下的浏览器进程（重试启动之前调用），返回结束的数量。"""
+        if not self.enabled:
+            return 0
+        self.register_children()
+        killed = _kill_processes(self.known)
+        self.known.clear()
+        self._register()
+        return killed
+
+    def reap(self) -> None:
+        """启动最终失败：结束残留进程、删除临时目录，并注销登记。"""
+        killed = self.kill_processes()
+        purged = _purge_dirs(self.temp_dirs)
+        if killed or purged:
+            logging.warning(f"浏览器启动失败，已结束 {killed} 个残留进程，删除 {purged} 个临时目录")
+        self._unregister()
+
+    def release(self) -> None:
+        """启动成功：注销登记，由 ProcessTreeMonitor 接管。"""
+        self._unregister()
+
+
+class ProcessTreeMonitor:
+    """
+    采样浏览器进程树的 CPU / RSS 峰值，并登记进程以便之后清理。
+
+    Args:
+        root_pids: chromedriver 和 Chrome 主进程的 PID
+        temp_dirs: 本次运行创建的临时 profile 目录
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, root_pids: List[int], temp_dirs: Optional[List[str]] = None, interval: float = 1.0):
+        self.root_pids = [pid for pid in root_pids if pid]
+        self.temp_dirs = temp_dirs or []
+        self.interval = interval
+        self.key = f"{os.getpid()}:{id(self)}"
+        self.known: Dict[str, int] = {}
+        self.peak_rss_bytes = 0
+        self.peak_cpu_percent = 0.0
+        self.peak_processes = 0
+        self.samples = 0
+        self._cpu_ticks: Dict[int, int] = {}
+        self._last_sample = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chrome-monitor", daemon=True)
+
+    @classmethod
+    def for_driver(cls, driver, interval: float = 1.0) -> "ProcessTreeMonitor":
+        """根据 undetected-chromedriver 实例创建并启动监控。"""
+        root_pids = []
+        service = getattr(driver, "service", None)
+        if service is not None and getattr(service, "process", None) is not None:
+            root_pids.append(service.process.pid)
+        root_pids.append(getattr(driver, "browser_pid", None))
+        temp_dirs = []
+        user_data_dir = getattr(driver, "user_data_dir", None)
+        if user_data_dir and not getattr(driver, "keep_user_data_dir", True):
+            temp_dirs.append(user_data_dir)
+        monitor = cls(root_pids, temp_dirs, interval)
+        monitor.start()
+        return monitor
+
+    def start(self) -> None:
+        if not os.path.isdir("/proc") or fcntl is None or not self.root_pids:
+            return
+        self._sample()
+        self._thread.start()
+
+    def _register(self) -> None:
+        try:
+            with _locked_state() as state:
+                state[self.key] = _owner_entry(self.known, self.temp_dirs)
+        except Exception as e:
+            logging.debug(f"登记浏览器进程失败: {e}")
+
+    def _sample(self) -> None:
+        now = time.monotonic()
+        elapsed = max(now - self._last_sample, 1e-6)
+        self._last_sample = now
+        rss = 0
+        cpu_ticks: Dict[int, int] = {}
+        new_processes = False
+        for pid in process_tree(self.root_pids):
+            fields = _read_stat(pid)
+            if not fields:
+                continue
+            cpu_ticks[pid] = int(fields[11]) + int(fields[12])  # utime + stime
+            rss += int(fields[21]) * _PAGE_SIZE
+            if str(pid) not in self.known:
+                self.known[str(pid)] = int(fields[19])
+                new_processes = True
+        delta = sum(ticks - self._cpu_ticks.get(pid, ticks) for pid, ticks in cpu_ticks.items())
+        cpu_percent = delta / _CLOCK_TICKS / elapsed * 100
+        self._cpu_ticks = cpu_ticks
+        self.samples += 1
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        self.peak_cpu_percent = max(self.peak_cpu_percent, cpu_percent)
+        self.peak_processes = max(self.peak_processes, len(cpu_ticks))
+        if new_processes:
+            self._register()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logging.debug(f"采样浏览器进程失败: {e}")
+
+    def stop(self) -> Dict[str, object]:
+        """停止采样，返回峰值统计。"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval * 2)
+        stats = {
+            "peak_rss_mb": round(self.peak_rss_bytes / 1024 / 1024, 1),
+            "peak_cpu_percent": round(self.peak_cpu_percent, 1),
+            "peak_processes": self.peak_processes,
+            "samples": self.samples,
+        }
+        logging.info(
+            "浏览器进程树峰值: RSS %.1f MB，CPU %.1f%%，进程 %d 个",
+            stats["peak_rss_mb"], stats["peak_cpu_percent"], stats["peak_processes"],
+        )
+        return stats
+
+    def reap(self) -> None:
+        """在 driver.quit() 之后调用：结束残留进程、删除临时目录，并注销登记。"""
+        if not os.path.isdir("/proc") or fcntl is None:
+            return
+        killed = _kill_processes(self.known)
+        purged = _purge_dirs(self.temp_dirs)
+        if killed:
+            logging.warning(f"driver.quit() 后仍有 {killed} 个浏览器进程残留，已强制结束")
+        if purged:
+            logging.info(f"已删除 {purged} 个临时 profile 目录")
+        try:
+            with _locked_state() as state:
+                state.pop(self.key, None)
+        except Exception as e:
+            logging.debug(f"注销浏览器进程失败: {e}")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+轻量代理探测（纯 socket）
+
+替代用 uc.Chrome 打开 api.ipify.org 的 socks5.py 检查：直接在 socket 上完成 SOCKS5 或 HTTP CONNECT 握手，
+并发探测多个代理，测量 TCP 连接、代理握手、首字节延迟和下载吞吐，并把出口 IP 与期望值比较。
+
+出口 IP 由回显端点返回（默认 http://api.ipify.org/，响应体即客户端 IP）。
+离线或测试时可以用 --serve-echo 启动本地回显服务代替：
+    GET /          返回客户端 IP
+    GET /bytes/N   返回 N 字节，用于测量吞吐
+
+使用方法：
+    python proxy_probe.py PROXY [PROXY ...] [--expect-ip IP] [--echo-url URL] [--download-url URL]
+
+示例：
+    # 检查 SSH 隧道的出口 IP
+    python proxy_probe.py socks5://127.0.0.1:8080 --expect-ip 136.56.72.172
+
+    # 并发检查多个代理并测量吞吐
+    python proxy_probe.py socks5://127.0.0.1:8080 socks5://127.0.0.1:8081 http://10.0.0.5:3128 \\
+        --download-url http://speed.example.com/bytes/1000000
+
+    # 本地回显服务（在代理出口一侧运行）
+    python proxy_probe.py --serve-echo 8099
+"""
+import argparse
+import base64
+import ipaddress
+import json
+import os
+import re
+import socket
+import ssl
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+DEFAULT_ECHO_URL = "http://api.ipify.org/"
+DEFAULT_TIMEOUT_S = 10.0
+READ_SIZE = 64 * 1024
+
+
+class ProxyError(OSError):
+    """代理握手失败"""
+
+
+@dataclass
+class ProbeResult:
+    proxy: str
+    ok: bool = False
+    error: Optional[str] = None
+    connect_ms: Optional[float] = None
+    handshake_ms: Optional[float] = None
+    first_byte_ms: Optional[float] = None
+    throughput_kbps: Optional[float] = None
+    egress_ip: Optional[str] = None
+    ip_match: Optional[bool] = None
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ProxyError("代理关闭了连接")
+        data += chunk
+    return data
+
+
+def _socks5_handshake(sock: socket.socket, host: str, port: int, username: Optional[str], password: Optional[str]) -> None:
+    methods = b"\x00\x02" if username else b"\x00"
+    sock.sendall(b"\x05" + bytes([len(methods)]) + methods)
+    version, method = _recv_exact(sock, 2)
+    if version != 5 or method == 0xFF:
+        raise ProxyError("SOCKS5 握手失败：代理不接受认证方式")
+    if method == 2:
+        user = (username or "").encode()
+        secret = (password or "").encode()
+        sock.sendall(b"\x01" + bytes([len(user)]) + user + bytes([len(secret)]) + secret)
+        if _recv_exact(sock, 2)[1] != 0:
+            raise ProxyError("SOCKS5 用户名/密码认证失败")
+
+    try:
+        address = ipaddress.ip_address(host)
+        target = (b"\x01" if address.version == 4 else b"\x04") + address.packed
+    except ValueError:
+        encoded = host.encode("idna")
+        target = b"\x03" + bytes([len(encoded)]) + encoded
+    sock.sendall(b"\x05\x01\x00" + target + struct.pack("!H", port))
+    reply = _recv_exact(sock, 4)
+    if reply[1] != 0:
+        raise ProxyError(f"SOCKS5 CONNECT 失败（REP={reply[1]}）")
+    # 跳过 BND.ADDR 和 BND.PORT
+    if reply[3] == 3:
+        _recv_exact(sock, _recv_exact(sock, 1)[0] + 2)
+    else:
+        _recv_exact(sock, (16 if reply[3] == 4 else 4) + 2)
+
+
+def _http_connect_handshake(sock: socket.socket, host: str, port: int, username: Optional[str], password: Optional[str]) -> None:
+    request = f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+    if username:
+        token = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+        request += f"Proxy-Authorization: Basic {token}\r\n"
+    sock.sendall((request + "\r\n").encode())
+    response = b""
+    while b"\r\n\r\n" not in response:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ProxyError("代理关闭了连接")
+        response += chunk
+        if len(response) > 16384:
+            raise ProxyError("CONNECT 响应头过长")
+    status_line = response.split(b"\r\n", 1)[0].decode("latin-1")
+    match = re.match(r"HTTP/\d\.\d (\d{3})", status_line)
+    if not match or match.group(1) != "200":
+        raise ProxyError(f"HTTP CONNECT 失败: {status_line}")
+
+
+def connect_via_proxy(
+    proxy: str, host: str, port: int, timeout: float = DEFAULT_TIMEOUT_S
+) -> Tuple[socket.socket, Dict[str, float]]:
+    """
+    通过代理建立到 host:port 的隧道。
+
+    Args:
+        proxy: socks5:// / socks5h:// / http:// 代理 URL（可带 user:pass@）
+        host, port: 目标地址（SOCKS5 由代理端解析域名）
+
+    Returns:
+        (已连通目标的 socket, {"connect_ms", "handshake_ms"})
+    """
+    parsed = urlparse(proxy)
+    scheme = parsed.scheme.lower()
+    if scheme not in ("socks5", "socks5h", "http"):
+        raise ValueError(f"不支持的代理类型: {proxy}")
+    username = unquote(parsed.username) if parsed.username else None
+    password = unquote(parsed.password) if parsed.password else None
+
+    started = time.monotonic()
+    sock = socket.create_connection((parsed.hostname, parsed.port or (1080 if scheme != "http" else 8080)), timeout=timeout)
+    connected = time.monotonic()
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if scheme == "http":
+            _http_connect_handshake(sock, host, port, username, password)
+        else:
+            _socks5_handshake(sock, host, port, username, password)
+    except BaseException:
+        sock.close()
+        raise
+    return sock, {
+        "connect_ms": (connected - started) * 1000,
+        "handshake_ms": (time.monotonic() - connected) * 1000,
+    }
+
+
+def http_get_via_proxy(
+    proxy: str, url: str, timeout: float = DEFAULT_TIMEOUT_S
+) -> Tuple[int, bytes, Dict[str, float]]:
+    """
+    通过代理发送 GET 请求（HTTP/1.0，读取到连接关闭）。
+
+    Returns:
+        (状态码, 响应体（最多约 64KB）, {"connect_ms", "handshake_ms", "first_byte_ms", "throughput_kbps"})
+    """
+    parsed = urlparse(url)
+    https = parsed.scheme == "https"
+    port = parsed.port or (443 if https else 80)
+    sock, timings = connect_via_proxy(proxy, parsed.hostname, port, timeout)
+    with sock:
+        stream = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname) if https else sock
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        sent = time.monotonic()
+        stream.sendall(f"GET {path} HTTP/1.0\r\nHost: {parsed.hostname}\r\nUser-Agent: proxy-probe\r\n\r\n".encode())
+        # 只保留前 READ_SIZE 字节（回显响应很小），大文件下载只计数，不占内存
+        kept = b""
+        received = 0
+        first_byte = None
+        while True:
+            chunk = stream.recv(READ_SIZE)
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = time.monotonic()
+            received += len(chunk)
+            if len(kept) < READ_SIZE:
+                kept += chunk
+        finished = time.monotonic()
+    head, separator, body = kept.partition(b"\r\n\r\n")
+    match = re.match(rb"HTTP/\d\.\d (\d{3})", head)
+    if not match:
+        raise ProxyError("目标没有返回 HTTP 响应")
+    timings["first_byte_ms"] = ((first_byte or finished) - sent) * 1000
+    transfer_s = finished - (first_byte or finished)
+    body_size = received - len(head) - len(separator)
+    timings["throughput_kbps"] = body_size / 1024 / transfer_s if transfer_s > 0 else 0.0
+    return int(match.group(1)), body, timings
+
+
+def probe_proxy(
+    proxy: str,
+    echo_url: str = DEFAULT_ECHO_URL,
+    expect_ip: Optional[str] = None,
+    download_url: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT_S,
+) -> ProbeResult:
+    """探测一个代理：出口 IP（回显端点）、延迟，以及可选的下载吞吐。"""
+    result = ProbeResult(proxy)
+    try:
+        status, body, timings = http_get_via_proxy(proxy, echo_url, timeout)
+        if status != 200:
+            raise ProxyError(f"回显端点返回 HTTP {status}")
+        result.connect_ms = round(timings["connect_ms"], 1)
+        result.handshake_ms = round(timings["handshake_ms"], 1)
+        result.first_byte_ms = round(timings["first_byte_ms"], 1)
+        result.egress_ip = body.decode("utf-8", "replace").strip()
+        if expect_ip:
+            result.ip_match = result.egress_ip == expect_ip
+        if download_url:
+            status, _, timings = http_get_via_proxy(proxy, download_url, timeout)
+            if status != 200:
+                raise ProxyError(f"下载地址返回 HTTP {status}")
+            result.throughput_kbps = round(timings["throughput_kbps"], 1)
+        result.ok = result.ip_match is not False
+        if result.ip_match is False:
+            result.error = f"出口 IP {result.egress_ip} 与期望的 {expect_ip} 不一致"
+    except (OSError, ValueError) as e:
+        result.error = str(e) or e.__class__.__name__
+    return result
+
+
+def probe_many(
+    proxies: List[str],
+    echo_url: str = DEFAULT_ECHO_URL,
+    expect_ip: Optional[str] = None,
+    download_url: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT_S,
+    max_workers: int = 16,
+) -> List[ProbeResult]:
+    """并发探测多个代理，结果顺序与输入一致。"""
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(proxies)))) as executor:
+        return list(executor.map(lambda proxy: probe_proxy(proxy, echo_url, expect_ip, download_url, timeout), proxies))
+
+
+class EchoRequestHandler(BaseHTTPRequestHandler):
+    """本地回显服务：/ 返回客户端 IP，/bytes/N 返回 N 字节。"""
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        match = re.fullmatch(r"/bytes/(\d+)", self.path)
+        if match:
+            size = min(int(match.group(1)), 100 * 1024 * 1024)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            block = b"\0" * READ_SIZE
+            while size > 0:
+                self.wfile.write(block[:size])
+                size -= READ_SIZE
+            return
+        body = self.client_address[0].encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}ms"
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="轻量代理探测（SOCKS5 / HTTP CONNECT）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("proxies", nargs="*", help="代理 URL（默认: PROXY_SERVER）")
+    parser.add_argument("--expect-ip", default=os.getenv("EXPECTED_EGRESS_IP"), help="期望的出口 IP（默认: EXPECTED_EGRESS_IP）")
+    parser.add_argument("--echo-url", default=os.getenv("ECHO_URL", DEFAULT_ECHO_URL), help=f"出口 IP 回显端点（默认: ECHO_URL 或 {DEFAULT_ECHO_URL}）")
+    parser.add_argument("--download-url", help="测量吞吐的下载地址（可选）")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S, help=f"单个代理的超时秒数（默认: {DEFAULT_TIMEOUT_S:.0f}）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--serve-echo", type=int, metavar="PORT", help="启动本地回显服务并监听 PORT")
+    args = parser.parse_args()
+
+    if args.serve_echo:
+        server = ThreadingHTTPServer(("0.0.0.0", args.serve_echo), EchoRequestHandler)
+        print(f"回显服务已启动: http://0.0.0.0:{args.serve_echo}/（/bytes/N 返回 N 字节）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    proxies = args.proxies or ([os.getenv("PROXY_SERVER")] if os.getenv("PROXY_SERVER") else [])
+    if not proxies:
+        parser.error("请指定代理 URL 或设置 PROXY_SERVER")
+
+    results = probe_many(proxies, args.echo_url, args.expect_ip, args.download_url, args.timeout)
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], ensure_ascii=False, indent=2))
+    else:
+        print(f"{'代理':<32} {'结果':<4} {'连接':>7} {'握手':>7} {'首字节':>7} {'吞吐':>11} 出口 IP")
+        for r in results:
+            throughput = "-" if r.throughput_kbps is None else f"{r.throughput_kbps:.0f}KB/s"
+            print(
+                f"{r.proxy:<32} {'✅' if r.ok else '❌':<4} {_format_ms(r.connect_ms):>7} {_format_ms(r.handshake_ms):>7} "
+                f"{_format_ms(r.first_byte_ms):>7} {throughput:>11} {r.egress_ip or '-'}"
+            )
+            if r.error:
+                print(f"    {r.error}")
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+隧道抓包回放（离线压测）
+
+读取 local_proxy.py --capture 生成的抓包文件，按原来的建立时间、并发和各方向数据块的大小与时间
+重新生成流量：客户端一侧发送上行数据块，本地源站（origin）一侧按时间线发送下行数据块。
+默认通过 --proxy 指定的代理建立隧道，用来测量代理在真实负载形态下的吞吐和延迟；
+不指定 --proxy 时直接连接源站（测量回放工具本身的基线）。
+
+客户端连上源站后先发送 4 字节隧道 ID，源站据此选择要回放的时间线（这 4 字节不计入统计）。
+抓包中保存了负载时按原负载回放（不足部分补零），否则发送全零数据。
+
+使用方法：
+    python proxy_replay.py CAPTURE [--proxy URL] [--speed X] [--origin HOST:PORT] [--json]
+    python proxy_replay.py CAPTURE --serve-origin PORT
+
+示例：
+    # 抓包（在生产代理上）
+    python local_proxy.py --capture /tmp/proxy.tcap
+
+    # 在本机启动一个代理，按原速回放
+    python local_proxy.py --host 127.0.0.1 --port 8899 &
+    python proxy_replay.py /tmp/proxy.tcap --proxy http://127.0.0.1:8899
+
+    # 2 倍速回放；--speed 0 表示不等待，所有隧道同时开始、数据块连续发送（最大吞吐）
+    python proxy_replay.py /tmp/proxy.tcap --proxy http://127.0.0.1:8899 --speed 2
+"""
+import argparse
+import json
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from proxy_probe import connect_via_proxy
+from tunnel_capture import DIRECTION_DOWN, DIRECTION_UP, DataEvent, TunnelTimeline, load_timelines
+
+READ_SIZE = 64 * 1024
+_TUNNEL_ID = struct.Struct("!I")
+
+
+def event_bytes(event: DataEvent) -> bytes:
+    """数据块内容：保存的负载，不足原始长度的部分补零。"""
+    return event.payload + bytes(event.length - len(event.payload))
+
+
+def play_events(sock: socket.socket, events: List[DataEvent], direction: int, started: float, speed: float) -> int:
+    """按时间线发送某个方向的数据块，返回发送的字节数。"""
+    sent = 0
+    for event in events:
+        if event.direction != direction:
+            continue
+        if speed > 0:
+            delay = started + event.offset_us / 1_000_000 / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sock.sendall(event_bytes(event))
+        sent += event.length
+    return sent
+
+
+def drain(sock: socket.socket) -> int:
+    received = 0
+    while True:
+        data = sock.recv(READ_SIZE)
+        if not data:
+            return received
+        received += len(data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("连接提前关闭")
+        data += chunk
+    return data
+
+
+class OriginHandler(socketserver.BaseRequestHandler):
+    """源站：读取隧道 ID，按时间线发送下行数据，同时读完上行数据。"""
+
+    timelines: Dict[int, TunnelTimeline] = {}
+    speed: float = 1.0
+
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        (tunnel_id,) = _TUNNEL_ID.unpack(_recv_exact(sock, _TUNNEL_ID.size))
+        timeline = self.timelines.get(tunnel_id)
+        if timeline is None:
+            return
+        started = time.monotonic()
+        upstream = threading.Thread(target=drain, args=(sock,), daemon=True)
+        upstream.start()
+        try:
+            play_events(sock, timeline.events, DIRECTION_DOWN, started, self.speed)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            return
+        upstream.join()
+
+
+class OriginServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def start_origin(timelines: List[TunnelTimeline], speed: float, host: str = "127.0.0.1", port: int = 0) -> OriginServer:
+    OriginHandler.timelines = {timeline.tunnel_id: timeline for timeline in timelines}
+    OriginHandler.speed = speed
+    server = OriginServer((host, port), OriginHandler)
+    threading.Thread(target=server.serve_forever, name="replay-origin", daemon=True).start()
+    return server
+
+
+@dataclass
+class ReplayResult:
+    tunnel_id: int
+    destination: str
+    ok: bool = False
+    error: Optional[str] = None
+    bytes_up: int = 0
+    bytes_down: int = 0
+    expected_down: int = 0
+    elapsed_ms: float = 0.0
+    recorded_ms: Optional[float] = None
+
+
+def replay_tunnel(timeline: TunnelTimeline, origin: Tuple[str, int], proxy: Optional[str], speed: float) -> ReplayResult:
+    """回放一条隧道：建立连接，发送上行数据块，读完下行数据。"""
+    result = ReplayResult(
+        timeline.tunnel_id,
+        timeline.destination,
+        expected_down=timeline.total_bytes(DIRECTION_DOWN),
+        recorded_ms=timeline.duration_us / 1000 if timeline.duration_us is not None else None,
+    )
+    started = time.monotonic()
+    try:
+        if proxy:
+            sock, _ = connect_via_proxy(proxy, origin[0], origin[1])
+            sock.settimeout(None)
+        else:
+            sock = socket.create_connection(origin)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        result.error = str(e)
+        return result
+    received: List[int] = []
+    downstream = threading.Thread(target=lambda: received.append(drain(sock)), daemon=True)
+    try:
+        sock.sendall(_TUNNEL_ID.pack(timeline.tunnel_id))
+        downstream.start()
+        result.bytes_up = play_events(sock, timeline.events, DIRECTION_UP, started, speed)
+        sock.shutdown(socket.SHUT_WR)
+        downstream.join()
+    except OSError as e:
+        result.error = str(e)
+    finally:
+        sock.close()
+    result.bytes_down = received[0] if received else 0
+    result.elapsed_ms = (time.monotonic() - started) * 1000
+    if result.error is None and result.bytes_down != result.expected_down:
+        result.error = f"下行字节数不一致: {result.bytes_down} != {result.expected_down}"
+    result.ok = result.error is None
+    return result
+
+
+def replay(
+    timelines: List[TunnelTimeline], origin: Tuple[str, int], proxy: Optional[str] = None, speed: float = 1.0
+) -> Tuple[List[ReplayResult], float]:
+    """按原来的建立时间（除以 speed）启动所有隧道，返回 (结果, 总耗时秒数)。"""
+    results: List[ReplayResult] = []
+    lock = threading.Lock()
+
+    def run(timeline: TunnelTimeline) -> None:
+        result = replay_tunnel(timeline, origin, proxy, speed)
+        with lock:
+            results.append(result)
+
+    threads = []
+    base_us = timelines[0].start_us if timelines else 0
+    started = time.monotonic()
+    for timeline in timelines:
+        if speed > 0:
+            delay = started + (timeline.start_us - base_us) / 1_000_000 / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        thread = threading.Thread(target=run, args=(timeline,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    results.sort(key=lambda result: result.tunnel_id)
+    return results, time.monotonic() - started
+
+
+def peak_concurrency(timelines: List[TunnelTimeline]) -> int:
+    """抓包中同时打开的隧道数峰值。"""
+    points = []
+    for timeline in timelines:
+        points.append((timeline.start_us, 1))
+        end = timeline.start_us + (timeline.duration_us if timeline.duration_us is not None else 0)
+        points.append((end, -1))
+    current = peak = 0
+    for _, delta in sorted(points):
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def _percentile(values: List[float], pct: int) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(timelines: List[TunnelTimeline], results: List[ReplayResult], elapsed_s: float) -> Dict[str, object]:
+    total_bytes = sum(result.bytes_up + result.bytes_down for result in results)
+    durations = [result.elapsed_ms for result in results if result.ok]
+    recorded = [result.recorded_ms for result in results if result.recorded_ms is not None]
+    return {
+        "tunnels": len(results),
+        "failed": sum(1 for result in results if not result.ok),
+        "peak_concurrency": peak_concurrency(timelines),
+        "bytes_up": sum(result.bytes_up for result in results),
+        "bytes_down": sum(result.bytes_down for result in results),
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_mbps": round(total_bytes * 8 / elapsed_s / 1_000_000, 2) if elapsed_s > 0 else 0.0,
+        "tunnel_p50_ms": round(_percentile(durations, 50), 1),
+        "tunnel_p95_ms": round(_percentile(durations, 95), 1),
+        "recorded_p50_ms": round(_percentile(recorded, 50), 1),
+        "recorded_p95_ms": round(_percentile(recorded, 95), 1),
+    }
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="回放 local_proxy.py 的隧道抓包，用于离线压测",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  # 通过本地代理按原速回放
+  python proxy_replay.py /tmp/proxy.tcap --proxy http://127.0.0.1:8899
+
+  # 最大吞吐（不等待），输出 JSON
+  python proxy_replay.py /tmp/proxy.tcap --proxy http://127.0.0.1:8899 --speed 0 --json
+
+  # 源站运行在另一台机器上（两边使用同一个抓包文件）
+  python proxy_replay.py /tmp/proxy.tcap --serve-origin 9900             # 源站机器
+  python proxy_replay.py /tmp/proxy.tcap --origin 10.0.0.5:9900 --proxy http://127.0.0.1:8899
+        """,
+    )
+    parser.add_argument("capture", help="抓包文件（local_proxy.py --capture 生成）")
+    parser.add_argument("--proxy", help="经由的代理（http:// 或 socks5://），不指定则直连源站")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0 为不等待（默认: 1.0）")
+    parser.add_argument("--origin", help="使用已运行的源站 HOST:PORT（默认: 在本机启动）")
+    parser.add_argument("--serve-origin", type=int, metavar="PORT", help="只运行源站，监听 0.0.0.0:PORT")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出汇总和每条隧道的结果")
+    args = parser.parse_args()
+
+    timelines = load_timelines(args.capture)
+    if not timelines:
+        print(f"{args.capture} 中没有隧道", file=sys.stderr)
+        return 1
+
+    if args.serve_origin:
+        server = start_origin(timelines, args.speed, "0.0.0.0", args.serve_origin)
+        print(f"源站已启动: 0.0.0.0:{args.serve_origin}（{len(timelines)} 条隧道），按 Ctrl+C 停止")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    server = None
+    if args.origin:
+        host, _, port = args.origin.rpartition(":")
+        origin = (host, int(port))
+    else:
+        server = start_origin(timelines, args.speed)
+        origin = server.server_address[:2]
+
+    try:
+        results, elapsed_s = replay(timelines, origin, args.proxy, args.speed)
+    finally:
+        if server is not None:
+            server.shutdown()
+    summary = summarize(timelines, results, elapsed_s)
+
+    if args.json:
+        print(json.dumps({"summary": summary, "tunnels": [asdict(result) for result in results]}, ensure_ascii=False, indent=2))
+    else:
+        print(
+            f"{summary['tunnels']} 条隧道（峰值并发 {summary['peak_concurrency']}），失败 {summary['failed']}，"
+            f"上行 {summary['bytes_up']} 字节，下行 {summary['bytes_down']} 字节，"
+            f"耗时 {summary['elapsed_s']}s，吞吐 {summary['throughput_mbps']} Mbit/s"
+        )
+        print(
+            f"隧道耗时 p50 {summary['tunnel_p50_ms']}ms / p95 {summary['tunnel_p95_ms']}ms"
+            f"（抓包中 p50 {summary['recorded_p50_ms']}ms / p95 {summary['recorded_p95_ms']}ms）"
+        )
+        for result in results:
+            if not result.ok:
+                print(f"  隧道 {result.tunnel_id} ({result.destination}) 失败: {result.error}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
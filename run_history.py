@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+登录运行历史（SQLite）
+
+login_humanlike.py 每次运行结束后写入一条紧凑的记录：结果、最终 URL、运行模式、
+代理、profile 以及各阶段耗时。本模块同时提供命令行报告，按时间窗口统计
+成功率、耗时分位数和最慢的阶段。
+
+使用方法：
+    python run_history.py [--db PATH] [--since 7d] [--bucket 1d] [--proxy PROXY]
+
+示例：
+    # 最近 7 天，按天统计
+    python run_history.py
+
+    # 对比代理切换前后：最近 30 天按周统计，只看某个代理
+    python run_history.py --since 30d --bucket 7d --proxy socks5://127.0.0.1:8080
+"""
+import argparse
+import math
+import os
+import socket
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_DB_PATH = "login_history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    duration_s REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    final_url TEXT,
+    mode TEXT,
+    proxy TEXT,
+    profile TEXT,
+    host TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_proxy_started_at ON runs (proxy, started_at);
+
+CREATE TABLE IF NOT EXISTS run_phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    phase TEXT NOT NULL,
+    duration_s REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_run_phases_run_id ON run_phases (run_id);
+"""
+
+
+class PhaseTimer:
+    """
+    记录一次登录中各阶段的耗时（秒）。同名阶段多次出现时累加。
+
+    lap(name) 把上一次打点到现在的时间记入阶段 name，适合顺序执行的流程；
+    phase(name) 是上下文管理器，只统计 with 块内的时间。
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._last = self._started
+        self.phases: Dict[str, float] = {}
+
+    def _add(self, name: str, duration: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def lap(self, name: str) -> None:
+        now = time.monotonic()
+        self._add(name, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._add(name, time.monotonic() - start)
+            self._last = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+
+class RunHistory:
+    """登录运行历史存储"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def record_run(
+        self,
+        timer: PhaseTimer,
+        outcome: str,
+        final_url: Optional[str],
+        mode: Optional[str],
+        proxy: Optional[str],
+        profile: Optional[str],
+    ) -> int:
+        """写入一次运行记录，返回记录 ID。"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (started_at, duration_s, outcome, final_url, mode, proxy, profile, host) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (timer.started_at, timer.elapsed, outcome, final_url, mode, proxy, profile, socket.gethostname()),
+            )
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO run_phases (run_id, phase, duration_s) VALUES (?, ?, ?)",
+                [(run_id, phase, duration) for phase, duration in timer.phases.items()],
+            )
+        return run_id
+
+    def runs_between(
+        self, since: float, until: float, proxy: Optional[str] = None
+    ) -> List[Tuple[int, float, float, str]]:
+        """返回 [(id, started_at, duration_s, outcome), ...]"""
+        query = "SELECT id, started_at, duration_s, outcome FROM runs WHERE started_at >= ? AND started_at < ?"
+        params: List[object] = [since, until]
+        if proxy is not None:
+            query += " AND proxy = ?"
+            params.append(proxy)
+        return self.conn.execute(query + " ORDER BY started_at", params).fetchall()
+
+    def phase_durations(self, since: float, until: float, proxy: Optional[str] = None) -> Dict[str, List[float]]:
+        """返回时间窗口内每个阶段的耗时列表。"""
+        query = (
+            "SELECT p.phase, p.duration_s FROM run_phases p JOIN runs r ON r.id = p.run_id "
+            "WHERE r.started_at >= ? AND r.started_at < ?"
+        )
+        params: List[object] = [since, until]
+        if proxy is not None:
+            query += " AND r.proxy = ?"
+            params.append(proxy)
+        durations: Dict[str, List[float]] = {}
+        for phase, duration in self.conn.execute(query, params):
+            durations.setdefault(phase, []).append(duration)
+        return durations
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """线性插值分位数（pct 取 0-100）。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def parse_duration(text: str) -> float:
+    """把 30m / 12h / 7d / 2w 这样的时长转换为秒（必须是有限的正数）。"""
+    units = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+    text = text.strip().lower()
+    if not text or text[-1] not in units:
+        raise argparse.ArgumentTypeError(f"无效的时长: {text}（示例: 30m, 12h, 7d, 2w）")
+    try:
+        seconds = float(text[:-1]) * units[text[-1]]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时长: {text}（示例: 30m, 12h, 7d, 2w）")
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise argparse.ArgumentTypeError(f"时长必须是有限的正数: {text}")
+    return seconds
+
+
+def format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def print_report(history: RunHistory, since: float, bucket: float, proxy: Optional[str], top_phases: int) -> None:
+    """按时间窗口打印成功率、耗时分位数和最慢阶段。"""
+    now = time.time()
+    start = now - since
+    print(f"{'窗口开始':<17} {'次数':>5} {'成功率':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    while start < now:
+        end = min(start + bucket, now)
+        runs = history.runs_between(start, end, proxy)
+        label = time.strftime("%Y-%m-%d %H:%M", time.localtime(start))
+        if runs:
+            durations = [r[2] for r in runs]
+            success_rate = sum(1 for r in runs if r[3] == "success") / len(runs)
+            print(
+                f"{label:<17} {len(runs):>5} {success_rate:>7.0%} "
+                f"{format_seconds(percentile(durations, 50)):>8} "
+                f"{format_seconds(percentile(durations, 95)):>8} "
+                f"{format_seconds(percentile(durations, 99)):>8}"
+            )
+        else:
+            print(f"{label:<17} {0:>5} {'-':>7} {'-':>8} {'-':>8} {'-':>8}")
+        start = end
+
+    phases = history.phase_durations(now - since, now, proxy)
+    if not phases:
+        return
+    print()
+    print(f"最慢的阶段（按 p95 排序，前 {top_phases} 个）:")
+    ranked = sorted(phases.items(), key=lambda item: percentile(item[1], 95) or 0, reverse=True)
+    for phase, durations in ranked[:top_phases]:
+        print(
+            f"  {phase:<24} n={len(durations):<5} "
+            f"p50={format_seconds(percentile(durations, 50))} p95={format_seconds(percentile(durations, 95))}"
+        )
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="登录运行历史报告",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  # 最近 7 天，按天统计
+  python run_history.py
+
+  # 最近 24 小时，按小时统计
+  python run_history.py --since 24h --bucket 1h
+        """,
+    )
+    parser.add_argument(
+        "--db",
+        default=os.getenv("RUN_HISTORY_DB", DEFAULT_DB_PATH),
+        help=f"SQLite 数据库路径（默认: RUN_HISTORY_DB 或 {DEFAULT_DB_PATH}）",
+    )
+    parser.add_argument("--since", type=parse_duration, default=parse_duration("7d"), help="统计范围（默认: 7d）")
+    parser.add_argument("--bucket", type=parse_duration, default=parse_duration("1d"), help="时间窗口大小（默认: 1d）")
+    parser.add_argument("--proxy", help="只统计使用该代理的运行")
+    parser.add_argument("--top-phases", type=int, default=5, help="显示最慢阶段的数量（默认: 5）")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库不存在: {args.db}")
+        return 1
+
+    history = RunHistory(args.db)
+    try:
+        print_report(history, args.since, args.bucket, args.proxy, args.top_phases)
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
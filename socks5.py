@@ -1,37 +1,35 @@
-# test_proxy_chrome.py
+"""
+检查 SOCKS5 代理是否生效（出口 IP 是否为期望值）
+
+不再启动浏览器：通过 proxy_probe 直接在 socket 上完成 SOCKS5 握手并请求出口 IP 回显端点。
+
+使用方法：
+    PROXY_SERVER=socks5://127.0.0.1:8080 EXPECTED_EGRESS_IP=1.2.3.4 python socks5.py
+"""
 import os
-import undetected_chromedriver as uc
-import time
+import sys
 
-# 设置代理
-proxy_server = "socks5://127.0.0.1:8080"
+from proxy_probe import DEFAULT_ECHO_URL, probe_proxy
 
-options = uc.ChromeOptions()
-options.add_argument(f"--proxy-server={proxy_server}")
-options.add_argument("--headless=new")
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
+proxy_server = os.getenv("PROXY_SERVER", "socks5://127.0.0.1:8080")
+expected_ip = os.getenv("EXPECTED_EGRESS_IP")
+echo_url = os.getenv("ECHO_URL", DEFAULT_ECHO_URL)
 
 print(f"使用代理: {proxy_server}")
-driver = uc.Chrome(options=options, version_main=144, headless=True)
-
-try:
-    # 访问 IP 检查网站
-    print("访问 https://api.ipify.org 检查 IP...")
-    driver.get("https://api.ipify.org")
-    time.sleep(3)
-    
-    # 获取页面内容
-    ip = driver.find_element("tag name", "body").text.strip()
-    print(f"检测到的 IP: {ip}")
-    
-    if ip == "136.56.72.172":
-        print("✅ 代理工作正常！")
-    else:
-        print(f"❌ 代理可能未生效，检测到的 IP: {ip}")
-        print("   预期 IP: 136.56.72.172")
-        
-except Exception as e:
-    print(f"❌ 错误: {e}")
-finally:
-    driver.quit()
\ No newline at end of file
+print(f"访问 {echo_url} 检查 IP...")
+result = probe_proxy(proxy_server, echo_url, expected_ip)
+
+if result.egress_ip:
+    print(f"检测到的 IP: {result.egress_ip}（握手 {result.handshake_ms:.0f}ms，首字节 {result.first_byte_ms:.0f}ms）")
+
+if result.ok and expected_ip:
+    print("✅ 代理工作正常！")
+elif result.ok:
+    print("✅ 代理可以连通（未设置 EXPECTED_EGRESS_IP，未比较出口 IP）")
+elif result.egress_ip:
+    print(f"❌ 代理可能未生效，检测到的 IP: {result.egress_ip}")
+    print(f"   预期 IP: {expected_ip}")
+else:
+    print(f"❌ 错误: {result.error}")
+
+sys.exit(0 if result.ok else 1)
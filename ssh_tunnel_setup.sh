@@ -84,9 +84,11 @@ echo ""
 echo "下一步："
 echo "1. 在 AWS EC2 上运行以下命令建立 SSH 隧道："
 echo ""
-echo "   ssh -D 8080 -N -f $(whoami)@136.56.72.172"
+echo "   python tunnel_supervisor.py $(whoami)@136.56.72.172"
+echo "   export TUNNEL_HEALTH_FILE=/tmp/enrollware_tunnels.json"
 echo ""
-echo "   或者如果使用密码认证："
+echo "   （守护进程需要免密登录：ssh-copy-id $(whoami)@136.56.72.172）"
+echo "   或者手动建立隧道（断开后不会自动恢复）："
 echo "   ssh -D 8080 -N -f $(whoami)@136.56.72.172"
 echo ""
 echo "2. 如果提示输入密码，请输入你的 WSL 用户密码"
@@ -0,0 +1,89 @@
+"""
+local_proxy 分流规则测试
+
+生成的 PAC（在浏览器中执行）必须与代理自身的 Router.route 给出相同的结果。
+PAC 用 node 执行，没有安装 node 时跳过对应用例。
+
+运行：
+    pytest -q test_local_proxy.py
+"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from local_proxy import PAC_BLACKHOLE, ROUTE_DIRECT, ROUTE_REJECT, Router
+
+PROXY_ADDRESS = "203.0.113.10:8080"
+
+RULES = {
+    "example.com": "proxy",
+    "*.example.com": "direct",
+    "cdn.example.com": "reject",
+    "*.static.example.com": "proxy",
+    "enrollware.com": "proxy",
+    "*.cloudflare.com": "via:home2",
+    "telemetry.test": "reject",
+    "*": "direct",
+}
+UPSTREAMS = {"home2": "socks5://127.0.0.1:1081"}
+
+HOSTS = [
+    "example.com",
+    "a.example.com",
+    "b.a.example.com",
+    "cdn.example.com",
+    "x.cdn.example.com",
+    "static.example.com",
+    "img.static.example.com",
+    "www.enrollware.com",
+    "cloudflare.com",
+    "challenges.cloudflare.com",
+    "telemetry.test",
+    "sub.telemetry.test",
+    "unrelated.org",
+    "EXAMPLE.COM.",
+]
+
+
+@pytest.fixture(scope="module")
+def router() -> Router:
+    return Router(RULES, UPSTREAMS)
+
+
+def expected_pac_result(action: str) -> str:
+    if action == ROUTE_DIRECT:
+        return "DIRECT"
+    if action == ROUTE_REJECT:
+        return PAC_BLACKHOLE
+    return f"PROXY {PROXY_ADDRESS}"
+
+
+def test_route_longest_match(router: Router) -> None:
+    assert router.route("example.com") == "proxy"
+    assert router.route("a.example.com") == "direct"
+    assert router.route("cdn.example.com") == "reject"
+    assert router.route("x.cdn.example.com") == "reject"
+    assert router.route("static.example.com") == "direct"
+    assert router.route("img.static.example.com") == "proxy"
+    assert router.route("cloudflare.com") == "direct"
+    assert router.route("challenges.cloudflare.com") == "via:home2"
+    assert router.route("unrelated.org") == "direct"
+
+
+def test_pac_matches_route(router: Router, tmp_path) -> None:
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("没有安装 node")
+    script = tmp_path / "check.js"
+    script.write_text(
+        router.pac(PROXY_ADDRESS)
+        + "\nvar hosts = " + json.dumps(HOSTS) + ";\n"
+        + "console.log(JSON.stringify(hosts.map(function (h) { return FindProxyForURL('https://' + h + '/', h); })));\n",
+        encoding="utf-8",
+    )
+    output = subprocess.run([node, str(script)], capture_output=True, text=True, check=True).stdout
+    pac_results = dict(zip(HOSTS, json.loads(output)))
+    expected = {host: expected_pac_result(router.route(host)) for host in HOSTS}
+    assert pac_results == expected
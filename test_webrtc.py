@@ -0,0 +1,243 @@
+"""
+WebRTC IP 泄露测试
+
+浏览器由 login_humanlike.create_chrome_driver 创建（与生产环境完全相同的启动参数和注入脚本，
+代理、启动配置和资源策略取自同样的环境变量），整个模块只启动一次。
+STUN 服务器是本地的 UDP 响应器：对每个 Binding 请求返回一个固定的"公网"地址（文档保留地址），
+如果该地址或任何真实 IP 出现在 SDP / ICE candidate 中，就说明发生了泄露。测试不访问外网。
+
+运行：
+    pytest -q test_webrtc.py
+    PROXY_SERVER=socks5://127.0.0.1:8080 CHROME_LAUNCH_PROFILE=lean pytest -q test_webrtc.py
+"""
+import ipaddress
+import re
+import socket
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+import pytest
+
+STUN_BINDING_REQUEST = 0x0001
+STUN_BINDING_SUCCESS = 0x0101
+STUN_MAGIC_COOKIE = 0x2112A442
+STUN_XOR_MAPPED_ADDRESS = 0x0020
+# STUN 响应器报告的"公网"地址（RFC 5737 文档地址，代表真实出口 IP）
+MAPPED_ADDRESS = "198.51.100.23"
+MAPPED_PORT = 40000
+
+CONSTRUCTORS = ("RTCPeerConnection", "webkitRTCPeerConnection")
+SURFACES = ("offer_sdp", "local_description", "ice_candidates")
+
+IP_PATTERN = re.compile(r"(?<![\w.:])(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9a-fA-F]{0,4}(?::[0-9a-fA-F]{0,4}){2,7})(?![\w.:])")
+
+GATHER_SCRIPT = r"""
+const [ctorName, stunUrl, done] = arguments;
+const Ctor = window[ctorName];
+if (!Ctor) { done({unsupported: true}); return; }
+const result = {offer_sdp: '', local_description: '', ice_candidates: [], error: null};
+let pc;
+try {
+    pc = new Ctor({iceServers: [{urls: stunUrl}]});
+} catch (e) {
+    done({blocked: true, error: String(e)});
+    return;
+}
+let finished = false;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    clearTimeout(timer);
+    result.local_description = pc.localDescription ? pc.localDescription.sdp : '';
+    pc.close();
+    done(result);
+};
+const timer = setTimeout(finish, 8000);
+pc.onicecandidate = (event) => {
+    if (event.candidate) {
+        result.ice_candidates.push(event.candidate.candidate);
+    } else {
+        finish();
+    }
+};
+pc.createDataChannel('probe');
+pc.createOffer()
+    .then(offer => { result.offer_sdp = offer.sdp; return pc.setLocalDescription(offer); })
+    .catch(e => { result.error = String(e); finish(); });
+"""
+
+
+class StunResponder:
+    """本地 STUN 服务器：对 Binding 请求返回 XOR-MAPPED-ADDRESS = MAPPED_ADDRESS:MAPPED_PORT。"""
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.sock.settimeout(0.2)
+        self.address = self.sock.getsockname()
+        self.requests = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="stun-responder", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"stun:{self.address[0]}:{self.address[1]}"
+
+    def start(self) -> "StunResponder":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+    @staticmethod
+    def binding_response(transaction_id: bytes) -> bytes:
+        port = MAPPED_PORT ^ (STUN_MAGIC_COOKIE >> 16)
+        address = struct.unpack("!I", socket.inet_aton(MAPPED_ADDRESS))[0] ^ STUN_MAGIC_COOKIE
+        attribute = struct.pack("!HHBBHI", STUN_XOR_MAPPED_ADDRESS, 8, 0, 0x01, port, address)
+        return struct.pack("!HHI", STUN_BINDING_SUCCESS, len(attribute), STUN_MAGIC_COOKIE) + transaction_id + attribute
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data, client = self.sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if len(data) < 20:
+                continue
+            message_type, _, cookie = struct.unpack("!HHI", data[:8])
+            if message_type != STUN_BINDING_REQUEST or cookie != STUN_MAGIC_COOKIE:
+                continue
+            self.requests += 1
+            self.sock.sendto(self.binding_response(data[8:20]), client)
+
+
+class BlankPageHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        body = b"<!doctype html><title>webrtc</title><body>webrtc</body>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def leaked_addresses(texts: List[str]) -> List[str]:
+    """candidate 中出现的 IP 字面量（mDNS 的 .local 名称和未指定地址除外）。"""
+    leaked = []
+    for text in texts:
+        for match in IP_PATTERN.findall(text):
+            try:
+                address = ipaddress.ip_address(match)
+            except ValueError:
+                continue
+            if not address.is_unspecified:
+                leaked.append(str(address))
+    return leaked
+
+
+def candidate_lines(sdp: str) -> List[str]:
+    return [line for line in sdp.splitlines() if line.startswith("a=candidate:")]
+
+
+@pytest.fixture(scope="module")
+def stun() -> Iterator[StunResponder]:
+    responder = StunResponder().start()
+    yield responder
+    responder.stop()
+
+
+@pytest.fixture(scope="module")
+def page_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlankPageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def driver(page_url: str):
+    pytest.importorskip("selenium")
+    pytest.importorskip("undetected_chromedriver")
+    from login_humanlike import RuntimeConfig, create_chrome_driver, prepare_display, stop_xvfb
+
+    # 与 LoginService 相同的启动方式（HEADLESS / USE_XVFB / CHROME_LAUNCH_PROFILE），测的是生产环境的浏览器配置
+    config = RuntimeConfig.from_env()
+    xvfb_process = prepare_display(config)
+    try:
+        browser = create_chrome_driver(
+            headless=config.headless,
+            use_xvfb=config.use_xvfb,
+            proxy_server=config.proxy_server,
+            resource_policy=config.resource_policy,
+            launch_profile=config.launch_profile,
+        )
+    except Exception as e:
+        stop_xvfb(xvfb_process)
+        pytest.skip(f"无法启动 Chrome: {e}")
+    browser.set_script_timeout(15)
+    # 注入脚本在新文档上生效，先导航到本地页面（localhost 不经过代理）
+    browser.get(page_url)
+    yield browser
+    browser.quit()
+    stop_xvfb(xvfb_process)
+
+
+@pytest.fixture(scope="module")
+def gathered(driver, stun: StunResponder) -> Dict[str, Dict[str, object]]:
+    """每种构造函数只收集一次 candidate，供所有用例共用。"""
+    return {name: driver.execute_async_script(GATHER_SCRIPT, name, stun.url) for name in CONSTRUCTORS}
+
+
+def test_stun_responder_maps_to_fixed_address(stun: StunResponder) -> None:
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(2)
+    transaction_id = bytes(range(12))
+    try:
+        client.sendto(struct.pack("!HHI", STUN_BINDING_REQUEST, 0, STUN_MAGIC_COOKIE) + transaction_id, stun.address)
+        data, _ = client.recvfrom(2048)
+    finally:
+        client.close()
+    message_type, length, cookie = struct.unpack("!HHI", data[:8])
+    assert (message_type, cookie, data[8:20]) == (STUN_BINDING_SUCCESS, STUN_MAGIC_COOKIE, transaction_id)
+    _, _, _, family, port, address = struct.unpack("!HHBBHI", data[20:20 + length])
+    assert family == 0x01
+    assert port ^ (STUN_MAGIC_COOKIE >> 16) == MAPPED_PORT
+    assert socket.inet_ntoa(struct.pack("!I", address ^ STUN_MAGIC_COOKIE)) == MAPPED_ADDRESS
+
+
+@pytest.mark.parametrize("surface", SURFACES)
+@pytest.mark.parametrize("constructor", CONSTRUCTORS)
+def test_no_ip_in_webrtc_surface(gathered: Dict[str, Dict[str, object]], constructor: str, surface: str) -> None:
+    result = gathered[constructor]
+    if result.get("unsupported"):
+        pytest.skip(f"{constructor} 不存在")
+    if result.get("blocked"):
+        return  # 构造函数被禁用，没有任何泄露面
+    if surface == "ice_candidates":
+        texts = list(result["ice_candidates"])
+    else:
+        texts = candidate_lines(str(result[surface]))
+    leaked = leaked_addresses(texts)
+    assert MAPPED_ADDRESS not in leaked, f"{constructor}.{surface} 泄露了 STUN 映射的公网地址"
+    assert not leaked, f"{constructor}.{surface} 泄露了 IP: {sorted(set(leaked))}"
+
+
+@pytest.mark.parametrize("constructor", CONSTRUCTORS)
+def test_gathering_does_not_error(gathered: Dict[str, Dict[str, object]], constructor: str) -> None:
+    """防护脚本不应让 createOffer / setLocalDescription 抛错（否则页面会发现 WebRTC 被篡改）。"""
+    result = gathered[constructor]
+    if result.get("unsupported") or result.get("blocked"):
+        pytest.skip(f"{constructor} 不可用")
+    assert result["error"] is None
@@ -0,0 +1,181 @@
+"""
+代理隧道抓包格式
+
+local_proxy.py --capture 把每条隧道的时间线写入紧凑的二进制日志，proxy_replay.py 读取并回放。
+
+文件以 MAGIC 开头，之后是连续的记录。每条记录以 "!BIQ"（类型、隧道 ID、距抓包开始的微秒数）开头：
+
+    OPEN   + "!fH" 连接耗时（毫秒）、客户端长度 + 客户端、"!H" 目标长度 + 目标（UTF-8）
+    DATA   + "!BII" 方向（0 上行 / 1 下行）、原始长度、保存的负载长度 + 负载
+    CLOSE  （无附加字段）
+
+默认不保存负载（只记录长度和时间）；--capture-payload N 保存每个数据块的前 N 字节。
+关闭时仍未结束的隧道（被强制关闭）补写 CLOSE 记录。
+"""
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+MAGIC = b"TCAP\x01\n"
+RECORD_OPEN = 1
+RECORD_DATA = 2
+RECORD_CLOSE = 3
+DIRECTION_UP = 0
+DIRECTION_DOWN = 1
+DIRECTIONS = {"up": DIRECTION_UP, "down": DIRECTION_DOWN}
+
+_HEADER = struct.Struct("!BIQ")
+_OPEN = struct.Struct("!fH")
+_LENGTH = struct.Struct("!H")
+_DATA = struct.Struct("!BII")
+
+
+class CaptureWriter:
+    """
+    线程安全的抓包写入器（所有隧道写入同一个文件）。
+
+    Args:
+        path: 输出文件
+        payload_bytes: 每个数据块保存的负载字节数，0 为只记录长度
+    """
+
+    def __init__(self, path: str, payload_bytes: int = 0):
+        self.path = path
+        self.payload_bytes = payload_bytes
+        self._file = open(path, "wb", buffering=1024 * 1024)
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._open: Set[int] = set()
+        self._started = time.monotonic()
+
+    def _offset_us(self) -> int:
+        return int((time.monotonic() - self._started) * 1_000_000)
+
+    def _write(self, record: bytes) -> None:
+        # 代理关闭后仍在转发的隧道不再写入
+        if not self._file.closed:
+            self._file.write(record)
+
+    def open_tunnel(self, client: str, destination: str, connect_ms: float) -> int:
+        """记录隧道建立，返回隧道 ID。"""
+        client_bytes = client.encode("utf-8")
+        destination_bytes = destination.encode("utf-8")
+        with self._lock:
+            tunnel_id = self._next_id
+            self._next_id += 1
+            self._open.add(tunnel_id)
+            self._write(
+                _HEADER.pack(RECORD_OPEN, tunnel_id, self._offset_us())
+                + _OPEN.pack(connect_ms, len(client_bytes))
+                + client_bytes
+                + _LENGTH.pack(len(destination_bytes))
+                + destination_bytes
+            )
+        return tunnel_id
+
+    def data(self, tunnel_id: int, direction: str, chunk: bytes) -> None:
+        payload = chunk[: self.payload_bytes]
+        with self._lock:
+            self._write(
+                _HEADER.pack(RECORD_DATA, tunnel_id, self._offset_us())
+                + _DATA.pack(DIRECTIONS[direction], len(chunk), len(payload))
+                + payload
+            )
+
+    def close_tunnel(self, tunnel_id: int) -> None:
+        with self._lock:
+            self._open.discard(tunnel_id)
+            self._write(_HEADER.pack(RECORD_CLOSE, tunnel_id, self._offset_us()))
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self) -> None:
+        """为仍未结束的隧道写入 CLOSE 记录后关闭文件。"""
+        with self._lock:
+            for tunnel_id in sorted(self._open):
+                self._write(_HEADER.pack(RECORD_CLOSE, tunnel_id, self._offset_us()))
+            self._open.clear()
+            self._file.close()
+
+
+@dataclass
+class DataEvent:
+    offset_us: int  # 距隧道建立的微秒数
+    direction: int
+    length: int
+    payload: bytes
+
+
+@dataclass
+class TunnelTimeline:
+    tunnel_id: int
+    start_us: int  # 距抓包开始的微秒数
+    connect_ms: float
+    client: str
+    destination: str
+    events: List[DataEvent] = field(default_factory=list)
+    duration_us: Optional[int] = None
+
+    def total_bytes(self, direction: int) -> int:
+        return sum(event.length for event in self.events if event.direction == direction)
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError
+    return data
+
+
+def iter_records(path: str) -> Iterator[Tuple]:
+    """
+    逐条读取记录：
+    (RECORD_OPEN, id, t_us, connect_ms, client, destination) /
+    (RECORD_DATA, id, t_us, direction, length, payload) / (RECORD_CLOSE, id, t_us)。
+    文件末尾不完整的记录（代理被强制终止）会被忽略。
+    """
+    with open(path, "rb") as stream:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} 不是隧道抓包文件")
+        while True:
+            try:
+                record_type, tunnel_id, offset_us = _HEADER.unpack(_read_exact(stream, _HEADER.size))
+                if record_type == RECORD_OPEN:
+                    connect_ms, client_length = _OPEN.unpack(_read_exact(stream, _OPEN.size))
+                    client = _read_exact(stream, client_length).decode("utf-8")
+                    (destination_length,) = _LENGTH.unpack(_read_exact(stream, _LENGTH.size))
+                    destination = _read_exact(stream, destination_length).decode("utf-8")
+                    yield (record_type, tunnel_id, offset_us, connect_ms, client, destination)
+                elif record_type == RECORD_DATA:
+                    direction, length, payload_length = _DATA.unpack(_read_exact(stream, _DATA.size))
+                    yield (record_type, tunnel_id, offset_us, direction, length, _read_exact(stream, payload_length))
+                elif record_type == RECORD_CLOSE:
+                    yield (record_type, tunnel_id, offset_us)
+                else:
+                    raise ValueError(f"未知的记录类型 {record_type}")
+            except EOFError:
+                return
+
+
+def load_timelines(path: str) -> List[TunnelTimeline]:
+    """把抓包文件整理为按建立时间排序的隧道时间线。"""
+    timelines: Dict[int, TunnelTimeline] = {}
+    for record in iter_records(path):
+        record_type, tunnel_id, offset_us = record[:3]
+        if record_type == RECORD_OPEN:
+            timelines[tunnel_id] = TunnelTimeline(tunnel_id, offset_us, record[3], record[4], record[5])
+            continue
+        timeline = timelines.get(tunnel_id)
+        if timeline is None:
+            continue
+        if record_type == RECORD_DATA:
+            timeline.events.append(DataEvent(offset_us - timeline.start_us, record[3], record[4], record[5]))
+        else:
+            timeline.duration_us = offset_us - timeline.start_us
+    return sorted(timelines.values(), key=lambda timeline: timeline.start_us)
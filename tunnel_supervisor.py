@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+SSH SOCKS 隧道守护进程
+
+替代手动执行的 `ssh -D 8080 -N -f user@host`：保持 N 条 SOCKS 隧道常驻，
+每隔几秒通过隧道做一次端到端探测（SOCKS5 握手 + CONNECT + HTTP 请求），
+隧道进程退出或连续探测失败时按指数退避重启，并把每条隧道的健康状态写入 JSON 文件。
+
+login_humanlike.py 在启动 Chrome 之前读取该文件（TUNNEL_HEALTH_FILE）：
+PROXY_SERVER 对应的隧道不健康时等待恢复，或者改用另一条健康的隧道，而不是让登录卡到超时。
+
+恢复时间上界：探测间隔 × 失败阈值 + 探测超时 + 最大退避 + 启动宽限期。
+
+使用方法：
+    python tunnel_supervisor.py user@host [--count 2] [--base-port 8080] [--interval 5]
+
+示例：
+    # 两条隧道：socks5://127.0.0.1:8080 和 socks5://127.0.0.1:8081
+    python tunnel_supervisor.py harry@136.56.72.172 --count 2
+
+    # 登录脚本使用隧道健康状态
+    export TUNNEL_HEALTH_FILE=/tmp/enrollware_tunnels.json
+    export PROXY_SERVER=socks5://127.0.0.1:8080
+    python login_humanlike.py
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from proxy_probe import connect_via_proxy
+
+DEFAULT_HEALTH_FILE = os.path.join(tempfile.gettempdir(), "enrollware_tunnels.json")
+DEFAULT_PROBE_TARGET = "www.enrollware.com:443"
+FAILURE_THRESHOLD = 2
+# ssh 启动后建立连接需要时间（ConnectTimeout=10），宽限期内的探测失败不计入失败次数
+STARTUP_GRACE_S = 15.0
+MIN_BACKOFF_S = 1.0
+MAX_BACKOFF_S = 30.0
+# 健康文件超过这个时间未更新，视为守护进程已停止
+STALE_AFTER_S = 30.0
+
+
+def socks5_probe(proxy_port: int, target_host: str, target_port: int, timeout: float = 5.0) -> float:
+    """
+    通过本地 SOCKS5 代理连接目标并完成一次往返，返回耗时（毫秒）。失败时抛出 OSError。
+
+    目标端口为 443 时只要求 CONNECT 成功（隧道对端已建立到目标的 TCP 连接）；
+    其他端口再发送 HTTP HEAD 请求并要求收到 HTTP 响应。
+    """
+    started = time.monotonic()
+    sock, _ = connect_via_proxy(f"socks5://127.0.0.1:{proxy_port}", target_host, target_port, timeout)
+    with sock:
+        if target_port != 443:
+            sock.sendall(f"HEAD / HTTP/1.1\r\nHost: {target_host}\r\nConnection: close\r\n\r\n".encode())
+            if not sock.recv(16).startswith(b"HTTP/"):
+                raise OSError("目标没有返回 HTTP 响应")
+    return (time.monotonic() - started) * 1000
+
+
+class Tunnel:
+    """一条 ssh -D 隧道及其健康状态。"""
+
+    def __init__(self, target: str, port: int, ssh_options: List[str]):
+        self.target = target
+        self.port = port
+        self.ssh_options = ssh_options
+        self.process: Optional[subprocess.Popen] = None
+        self.healthy = False
+        self.latency_ms: Optional[float] = None
+        self.last_ok_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.failures = 0
+        self.restarts = 0
+        self.backoff = MIN_BACKOFF_S
+        self.next_start_at = 0.0
+        self.started_at = 0.0
+
+    @property
+    def proxy(self) -> str:
+        return f"socks5://127.0.0.1:{self.port}"
+
+    def command(self) -> List[str]:
+        return [
+            "ssh", "-D", f"127.0.0.1:{self.port}", "-N",
+            "-o", "BatchMode=yes",
+            "-o", "ExitOnForwardFailure=yes",
+            "-o", "ServerAliveInterval=10",
+            "-o", "ServerAliveCountMax=3",
+            "-o", "ConnectTimeout=10",
+            *self.ssh_options,
+            self.target,
+        ]
+
+    def start(self) -> None:
+        self.process = subprocess.Popen(self.command(), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        self.failures = 0
+        self.started_at = time.monotonic()
+        logging.info(f"隧道 {self.proxy} 已启动（PID {self.process.pid}）")
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def schedule_restart(self, reason: str) -> None:
+        """记录故障，停止进程并按指数退避安排重启。"""
+        self.stop()
+        self.healthy = False
+        self.last_error = reason
+        self.next_start_at = time.monotonic() + self.backoff
+        logging.warning(f"隧道 {self.proxy} 故障（{reason}），{self.backoff:.0f}s 后重启")
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF_S)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "proxy": self.proxy,
+            "port": self.port,
+            "healthy": self.healthy,
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 1),
+            "last_ok_at": self.last_ok_at,
+            "last_error": self.last_error,
+            "restarts": self.restarts,
+            "pid": self.process.pid if self.process else None,
+        }
+
+
+class TunnelSupervisor:
+    """
+    保持多条隧道常驻并定期探测。
+
+    Args:
+        tunnels: 要管理的隧道
+        probe_target: 端到端探测目标 host:port
+        interval: 探测间隔（秒）
+        probe_timeout: 单次探测超时（秒）
+        health_file: 健康状态输出文件
+    """
+
+    def __init__(
+        self,
+        tunnels: List[Tunnel],
+        probe_target: str = DEFAULT_PROBE_TARGET,
+        interval: float = 5.0,
+        probe_timeout: float = 5.0,
+        health_file: str = DEFAULT_HEALTH_FILE,
+    ):
+        self.tunnels = tunnels
+        host, _, port = probe_target.rpartition(":")
+        self.probe_host = host
+        self.probe_port = int(port)
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.health_file = health_file
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _check(self, tunnel: Tunnel) -> None:
+        now = time.monotonic()
+        if tunnel.process is None:
+            if now >= tunnel.next_start_at:
+                if tunnel.last_error is not None:
+                    tunnel.restarts += 1
+                tunnel.start()
+            return
+        code = tunnel.process.poll()
+        if code is not None:
+            tunnel.schedule_restart(f"ssh 进程退出，返回码 {code}")
+            return
+        try:
+            tunnel.latency_ms = socks5_probe(tunnel.port, self.probe_host, self.probe_port, self.probe_timeout)
+        except OSError as e:
+            tunnel.healthy = False
+            tunnel.last_error = str(e) or e.__class__.__name__
+            if now - tunnel.started_at < STARTUP_GRACE_S:
+                return
+            tunnel.failures += 1
+            if tunnel.failures >= FAILURE_THRESHOLD:
+                tunnel.schedule_restart(f"连续 {tunnel.failures} 次探测失败: {tunnel.last_error}")
+            return
+        if not tunnel.healthy:
+            logging.info(f"隧道 {tunnel.proxy} 可用（{tunnel.latency_ms:.0f}ms）")
+        tunnel.healthy = True
+        tunnel.failures = 0
+        tunnel.backoff = MIN_BACKOFF_S
+        tunnel.last_ok_at = time.time()
+
+    def write_health(self) -> None:
+        """原子写入健康状态文件。"""
+        payload = {
+            "updated_at": time.time(),
+            "supervisor_pid": os.getpid(),
+            "tunnels": [tunnel.to_dict() for tunnel in self.tunnels],
+        }
+        tmp_path = f"{self.health_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.health_file)
+
+    def run(self) -> None:
+        with ThreadPoolExecutor(max_workers=max(len(self.tunnels), 1), thread_name_prefix="tunnel-probe") as executor:
+            try:
+                while not self._stop.is_set():
+                    started = time.monotonic()
+                    list(executor.map(self._check, self.tunnels))
+                    self.write_health()
+                    # 刚启动或等待重启的隧道更快复查，缩短恢复时间
+                    pending = any(t.process is None or not t.healthy for t in self.tunnels)
+                    delay = min(self.interval, 1.0) if pending else self.interval
+                    self._stop.wait(max(delay - (time.monotonic() - started), 0))
+            finally:
+                for tunnel in self.tunnels:
+                    tunnel.stop()
+                    tunnel.healthy = False
+                self.write_health()
+
+
+def read_health(health_file: str) -> List[Dict[str, object]]:
+    """读取健康状态；文件不存在、无法解析或已过期时返回空列表。"""
+    try:
+        with open(health_file, encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if time.time() - float(payload.get("updated_at", 0)) > STALE_AFTER_S:
+        return []
+    return payload.get("tunnels", [])
+
+
+# 本机回环地址的不同写法视为同一主机
+_LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+_DEFAULT_PORTS = {"http": 80, "https": 443, "socks5": 1080, "socks5h": 1080, "socks4": 1080}
+
+
+def proxy_key(proxy: str) -> Tuple[str, str, int]:
+    """把代理 URL 规范化为 (协议, 主机, 端口)，用于比较两个写法不同的代理是否相同。"""
+    parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host in _LOOPBACK_HOSTS:
+        host = "127.0.0.1"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    return scheme, host, port or _DEFAULT_PORTS.get(scheme, 0)
+
+
+def same_proxy(a: Optional[str], b: Optional[str]) -> bool:
+    if not a or not b:
+        return a == b
+    return proxy_key(a) == proxy_key(b)
+
+
+def is_supervised(health_file: str, proxy: str) -> Optional[bool]:
+    """proxy 是否是健康文件中的隧道；健康文件不存在或已过期时返回 None（无法判断）。"""
+    tunnels = read_health(health_file)
+    if not tunnels:
+        return None
+    return any(same_proxy(str(t.get("proxy", "")), proxy) for t in tunnels)
+
+
+def wait_for_healthy_proxy(health_file: str, preferred: Optional[str], timeout: float = 30.0) -> Optional[str]:
+    """
+    等待可用的隧道。优先返回 preferred（按协议、主机和端口比较）；它不健康时返回延迟最低的其他健康隧道。
+    超时仍没有健康隧道时返回 None。
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        healthy = [t for t in read_health(health_file) if t.get("healthy")]
+        for tunnel in healthy:
+            if same_proxy(str(tunnel["proxy"]), preferred):
+                return preferred
+        if healthy:
+            best = min(healthy, key=lambda t: t.get("latency_ms") or float("inf"))
+            return str(best["proxy"])
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(1.0)
+
+
+def main() -> int:
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="SSH SOCKS 隧道守护进程",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("target", nargs="?", default=os.getenv("TUNNEL_TARGET"), help="SSH 目标 user@host（默认: TUNNEL_TARGET）")
+    parser.add_argument("--count", type=int, default=1, help="隧道数量（默认: 1）")
+    parser.add_argument("--base-port", type=int, default=8080, help="第一条隧道的本地端口（默认: 8080）")
+    parser.add_argument("--interval", type=float, default=5.0, help="探测间隔秒数（默认: 5）")
+    parser.add_argument("--probe-timeout", type=float, default=5.0, help="单次探测超时秒数（默认: 5）")
+    parser.add_argument("--probe-target", default=DEFAULT_PROBE_TARGET, help=f"端到端探测目标（默认: {DEFAULT_PROBE_TARGET}）")
+    parser.add_argument(
+        "--health-file",
+        default=os.getenv("TUNNEL_HEALTH_FILE", DEFAULT_HEALTH_FILE),
+        help=f"健康状态文件（默认: TUNNEL_HEALTH_FILE 或 {DEFAULT_HEALTH_FILE}）",
+    )
+    parser.add_argument("-o", dest="ssh_options", action="append", default=[], help="额外的 ssh -o 选项，可重复")
+    args = parser.parse_args()
+
+    if not args.target:
+        parser.error("请指定 SSH 目标 user@host 或设置 TUNNEL_TARGET")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    ssh_options = [item for option in args.ssh_options for item in ("-o", option)]
+    tunnels = [Tunnel(args.target, args.base_port + i, ssh_options) for i in range(args.count)]
+    supervisor = TunnelSupervisor(tunnels, args.probe_target, args.interval, args.probe_timeout, args.health_file)
+
+    def request_stop(signum, frame) -> None:
+        supervisor.stop()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    logging.info(f"管理 {len(tunnels)} 条隧道，健康状态写入 {args.health_file}")
+    supervisor.run()
+    logging.info("隧道守护进程已退出")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+自适应等待预算
+
+登录流程中的等待（表单出现、提交后跳转、Cloudflare iframe 出现、验证后跳转、中间页跳转）不再使用写死的区间，
+而是按阶段和代理记录每次实际的就绪耗时，取最近若干次观测的高分位数乘以余量，
+再限制在下限和上限之间作为下一次的等待预算。
+
+- 网络状况好时预算自然收缩，快路径更快
+- 超时的观测按预算的 1.5 倍记录（删失观测，timed_out=1），同样参与分位数计算，慢路径的预算会逐步放宽，不再反复失败
+
+观测数据保存在运行历史数据库（RUN_HISTORY_DB）的 wait_observations 表中。
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from run_history import percentile
+
+# 阶段 -> (下限, 上限, 无观测时的默认值)，单位秒
+WAIT_PHASES: Dict[str, Tuple[float, float, float]] = {
+    "form_ready": (5.0, 30.0, 20.0),
+    "post_submit": (1.0, 20.0, 8.0),
+    "challenge_iframe": (2.0, 30.0, 15.0),
+    "post_challenge": (2.0, 30.0, 8.0),
+    "redirect": (2.0, 30.0, 5.0),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wait_observations (
+    id INTEGER PRIMARY KEY,
+    phase TEXT NOT NULL,
+    proxy TEXT NOT NULL,
+    observed_at REAL NOT NULL,
+    latency_s REAL NOT NULL,
+    timed_out INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_wait_observations_phase_proxy ON wait_observations (phase, proxy, observed_at);
+"""
+
+
+class WaitBudgetModel:
+    """
+    按阶段和代理学习等待预算。
+
+    Args:
+        db_path: SQLite 数据库路径；为 None 时不持久化，只使用默认值
+        proxy: 当前使用的代理（不同代理的延迟差异很大，分开统计）
+        window: 参与计算的最近观测数
+        pct: 使用的分位数
+        margin: 分位数之上的余量倍数
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        proxy: Optional[str] = None,
+        window: int = 50,
+        pct: float = 95,
+        margin: float = 1.3,
+    ):
+        self.proxy = proxy or "direct"
+        self.window = window
+        self.pct = pct
+        self.margin = margin
+        self.conn: Optional[sqlite3.Connection] = None
+        # 服务模式下在主线程创建、在请求线程中使用，访问用锁串行
+        self._lock = threading.Lock()
+        if db_path:
+            self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def budget(self, phase: str) -> float:
+        """返回阶段 phase 当前的等待预算（秒）。超时的删失观测也参与计算。"""
+        floor, ceiling, default = WAIT_PHASES[phase]
+        with self._lock:
+            if self.conn is None:
+                return default
+            rows = self.conn.execute(
+                "SELECT latency_s FROM wait_observations WHERE phase = ? AND proxy = ? "
+                "ORDER BY observed_at DESC LIMIT ?",
+                (phase, self.proxy, self.window),
+            ).fetchall()
+        if not rows:
+            return default
+        value = percentile([row[0] for row in rows], self.pct) * self.margin
+        return min(max(value, floor), ceiling)
+
+    def observe(self, phase: str, latency: float, timed_out: bool = False) -> None:
+        """记录一次观测。超时按 1.5 倍预算记录（不超过上限），让预算逐步放宽。"""
+        if timed_out:
+            latency = min(latency * 1.5, WAIT_PHASES[phase][1])
+        with self._lock:
+            if self.conn is None:
+                return
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO wait_observations (phase, proxy, observed_at, latency_s, timed_out) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (phase, self.proxy, time.time(), latency, int(timed_out)),
+                )